@@ -0,0 +1,342 @@
+"""
+Benchmark the quote/invoice generation pipeline stage by stage.
+
+Seeds a throwaway SQLite database with synthetic clients, services and quote
+profiles, then times the CRUD writes, HTML generation, PDF rendering and
+email sending individually before driving the `/quotes/batch_send_quotes`
+and `/invoices/send_invoices` routes end to end and sending the emails they
+queue in the outbox to a local SMTP stub.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_pipeline --clients 25 --json bench.json
+    python -m benchmarks.bench_pipeline --baseline bench.json --max-regression 0.2
+
+With `--baseline`, the run exits with status 1 if any stage's mean time is
+more than `--max-regression` (a fraction) slower than in the baseline report.
+"""
+import sys
+import json
+import time
+import logging
+import asyncio
+import argparse
+import tempfile
+import platform
+from pathlib import Path
+
+from benchmarks import common
+from benchmarks.smtp_stub import SMTPStub
+
+
+def time_calls(func, args_list: list[tuple]) -> list[float]:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        success, message, _ = func(*args)
+        samples.append(time.perf_counter() - start)
+        if not success:
+            raise RuntimeError(f"{func.__qualname__} failed: {message}")
+    return samples
+
+
+async def time_async_calls(func, kwargs_list: list[dict]) -> list[float]:
+    samples = []
+    for kwargs in kwargs_list:
+        start = time.perf_counter()
+        success, message, _ = await func(**kwargs)
+        samples.append(time.perf_counter() - start)
+        if not success:
+            raise RuntimeError(f"{func.__qualname__} failed: {message}")
+    return samples
+
+
+def run(args: argparse.Namespace, workdir: Path, smtp: SMTPStub) -> dict:
+    common.bootstrap(workdir / "bench.db", smtp_port=smtp.port)
+
+    import random
+    from fastapi.testclient import TestClient
+    from sqlmodel import SQLModel, Session
+
+    from main import app
+    from database import sqlite_engine
+    from models import Client, ClientQuoteProfile, QuoteProfileLine, Quote
+    from services import (
+        ClientCRUD, ClientQuoteProfileCRUD, QuoteProfileLineCRUD, QuoteCRUD,
+        PDFServices, EmailServices, OutboxServices
+    )
+
+    # xhtml2pdf warns about unsupported CSS on every render
+    logging.getLogger("xhtml2pdf").setLevel(logging.ERROR)
+
+    pdf_dir = workdir / "pdfs"
+    pdf_dir.mkdir()
+    SQLModel.metadata.create_all(sqlite_engine)
+
+    stages = {}
+    # The number of clients or emails each sample of a batch stage covers.
+    # A batch is timed as one request, so it is one sample.
+    batch_items = {}
+    rng = random.Random(args.seed)
+
+    # Seed the catalog and the clients that the pipeline routes will process
+    start = time.perf_counter()
+    with Session(sqlite_engine) as session:
+        common.seed_app_settings(session, pdf_dir)
+    client_ids = common.seed_database(
+        sqlite_engine,
+        num_clients=args.clients,
+        num_services=args.services,
+        lines_per_profile=args.lines,
+        seed=args.seed,
+    )
+    seed_seconds = time.perf_counter() - start
+
+    with Session(sqlite_engine) as session:
+        clients = [session.get(Client, client_id) for client_id in client_ids]
+        profiles = [session.get(ClientQuoteProfile, client_id) for client_id in client_ids]
+        profile_lines = [
+            QuoteProfileLineCRUD.get_lines(QuoteProfileLine, client_id, session)[2]
+            for client_id in client_ids
+        ]
+
+        # CRUD writes, one commit per call as the routers do it
+        new_clients = [common.make_client(rng, args.clients + i) for i in range(args.clients)]
+        stages["crud.client_create"] = time_calls(
+            ClientCRUD.create, [(client, session) for client in new_clients]
+        )
+        stages["crud.quote_profile_create"] = time_calls(
+            ClientQuoteProfileCRUD.create,
+            [
+                (
+                    ClientQuoteProfile(
+                        client_id=client.id,
+                        min_monthly_charge=profile.min_monthly_charge,
+                        premium_salt_upcharge=profile.premium_salt_upcharge,
+                        grand_total=profile.grand_total,
+                    ),
+                    lines,
+                    session,
+                )
+                for client, profile, lines in zip(new_clients, profiles, profile_lines)
+            ],
+        )
+        stages["crud.quote_create"] = time_calls(
+            QuoteCRUD.create,
+            [
+                (Quote(client_id=client.id, quote_no=f"{client.id}-bench", pdf_html=""), session)
+                for client in new_clients
+            ],
+        )
+
+        # HTML generation
+        html_sources = []
+        samples = []
+        for client, profile, lines in zip(clients, profiles, profile_lines):
+            start = time.perf_counter()
+            _, _, html_source = PDFServices.generate_html_source(
+                file_type="quote",
+                client=client,
+                invoice_no=None,
+                quote_no=f"{client.id}-bench",
+                min_monthly_charge=profile.min_monthly_charge,
+                premium_salt_upcharge=profile.premium_salt_upcharge,
+                services=[line.to_dict() for line in lines],
+                grand_total=profile.grand_total,
+            )
+            samples.append(time.perf_counter() - start)
+            html_sources.append(html_source)
+        stages["pdf.generate_html_source"] = samples
+
+        # PDF rendering
+        stages["pdf.save_pdf"] = time_calls(
+            lambda client, html_source: PDFServices.save_pdf(
+                file_type="quote",
+                client=client,
+                invoice_no=None,
+                quote_no=f"{client.id}-bench",
+                html_source=html_source,
+                pdf_save_path=str(pdf_dir),
+            ),
+            list(zip(clients, html_sources)),
+        )
+
+        # Email delivery to the SMTP stub, with the rendered PDF attached
+        stages["email.send_email"] = asyncio.run(time_async_calls(
+            EmailServices.send_email,
+            [
+                {
+                    "subject": "M&M Quote Request",
+                    "recipients": [client.email],
+                    "body": "Benchmark message.",
+                    "subtype": "plain",
+                    "attachments": [
+                        {
+                            "file": f'{pdf_dir}/m&m-quote_{client.name.replace(" ", "_")}_{client.id}-bench.pdf',
+                            "mime_type": "application/pdf",
+                        }
+                    ],
+                }
+                for client in clients
+            ],
+        ))
+
+    # End-to-end routes. The lifespan is deliberately not entered so the
+    # Tailwind compiler is not started.
+    http = TestClient(app, follow_redirects=False)
+
+    start = time.perf_counter()
+    response = http.post(
+        "/quotes/batch_send_quotes",
+        json={"client_ids": client_ids},
+    )
+    batch_seconds = time.perf_counter() - start
+    response.raise_for_status()
+    stages["route.batch_send_quotes"] = [batch_seconds]
+    batch_items["route.batch_send_quotes"] = len(client_ids)
+
+    form = {"client-ids": ";".join(str(client_id) for client_id in client_ids)}
+    for client_id, lines in zip(client_ids, profile_lines):
+        form[f"services-count_client-{client_id}"] = str(len(lines))
+        for i, line in enumerate(line.to_dict() for line in lines):
+            form[f"service-{i}_client-{client_id}"] = line["service_name"]
+            form[f"service-name-{i}_client-{client_id}"] = line["service_name"]
+            form[f"quantity-{i}_client-{client_id}"] = line["quantity"]
+            form[f"per-unit-{i}_client-{client_id}"] = line["per_unit"]
+            form[f"unit-price-{i}_client-{client_id}"] = line["unit_price"]
+            form[f"tax-{i}_client-{client_id}"] = line["tax"]
+            form[f"total-price-{i}_client-{client_id}"] = line["total_price"]
+    start = time.perf_counter()
+    response = http.post("/invoices/send_invoices", data=form)
+    invoices_seconds = time.perf_counter() - start
+    if response.status_code >= 400:
+        raise RuntimeError(f"/invoices/send_invoices failed: {response.text}")
+    stages["route.send_invoices"] = [invoices_seconds]
+    batch_items["route.send_invoices"] = len(client_ids)
+
+    # The routes queue their emails in the outbox; send them the way the
+    # outbox worker does
+    start = time.perf_counter()
+    emails_sent = 0
+    while True:
+        success, message, outbox_report = asyncio.run(OutboxServices.send_due())
+        if not success:
+            raise RuntimeError(f"Sending the outbox failed: {message}")
+        if not sum(outbox_report.values()):
+            break
+        emails_sent += outbox_report["sent"]
+    outbox_seconds = time.perf_counter() - start
+    if emails_sent:
+        stages["outbox.send_due"] = [outbox_seconds]
+        batch_items["outbox.send_due"] = emails_sent
+
+    report_stages = {}
+    for name, samples in stages.items():
+        summary = common.summarize(samples)
+        if summary["count"] < 2:
+            # A single sample has no distribution to report
+            summary.update(p50_ms=None, p95_ms=None, p99_ms=None, max_ms=None)
+        items = summary["count"]
+        if name in batch_items:
+            items = summary["items"] = batch_items[name]
+            summary["per_item_ms"] = round(summary["total_s"] / items * 1000, 3)
+        summary["throughput_per_s"] = round(
+            items / summary["total_s"], 2
+        ) if summary["total_s"] else None
+        report_stages[name] = summary
+
+    return {
+        "commit": common.current_commit(),
+        "python": platform.python_version(),
+        "parameters": {
+            "clients": args.clients,
+            "services": args.services,
+            "lines": args.lines,
+            "seed": args.seed,
+        },
+        "seed_s": round(seed_seconds, 4),
+        "emails_received": smtp.messages_received,
+        "stages": report_stages,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"commit {report['commit']} | {report['parameters']['clients']} clients, "
+        f"{report['parameters']['services']} services, "
+        f"{report['parameters']['lines']} lines/profile | "
+        f"{report['emails_received']} emails received"
+    )
+    def ms(value: float | None) -> str:
+        return f"{value:>11.3f}" if value is not None else f"{'-':>11}"
+
+    header = (
+        f"{'stage':<28}{'n':>6}{'mean ms':>11}{'p50 ms':>11}{'p95 ms':>11}{'max ms':>11}"
+        f"{'items':>7}{'ms/item':>11}{'per s':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, summary in report["stages"].items():
+        print(
+            f"{name:<28}{summary['count']:>6}{ms(summary['mean_ms'])}"
+            f"{ms(summary['p50_ms'])}{ms(summary['p95_ms'])}{ms(summary['max_ms'])}"
+            f"{summary.get('items', ''):>7}{ms(summary.get('per_item_ms'))}"
+            f"{summary['throughput_per_s'] or 0:>10.2f}"
+        )
+    print("Batch stages time each request as one sample of `items` clients or emails; per s counts items.")
+
+
+def find_regressions(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    # Batch stages are compared per client or email, so runs with different
+    # numbers of clients stay comparable (older reports stored the time per
+    # item as the mean)
+    def stage_ms(summary: dict) -> float:
+        return summary.get("per_item_ms") or summary["mean_ms"]
+
+    regressions = []
+    for name, summary in report["stages"].items():
+        previous = baseline.get("stages", {}).get(name)
+        if not previous or not stage_ms(previous):
+            continue
+        change = stage_ms(summary) / stage_ms(previous) - 1
+        if change > max_regression:
+            regressions.append(
+                f"{name}: {stage_ms(previous):.3f} ms -> {stage_ms(summary):.3f} ms "
+                f"(+{change:.0%})"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=25, help="clients to process per stage")
+    parser.add_argument("--services", type=int, default=12, help="services in the catalog")
+    parser.add_argument("--lines", type=int, default=5, help="service lines per quote profile")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for synthetic data")
+    parser.add_argument("--json", type=Path, help="write the report as JSON to this path")
+    parser.add_argument("--baseline", type=Path, help="JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed slowdown per stage")
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    json_path = args.json.resolve() if args.json else None
+
+    with tempfile.TemporaryDirectory(prefix="invoice-app-bench-") as tmp, SMTPStub() as smtp:
+        report = run(args, Path(tmp), smtp)
+
+    print_report(report)
+    if json_path:
+        json_path.write_text(json.dumps(report, indent=2))
+
+    if baseline:
+        regressions = find_regressions(report, baseline, args.max_regression)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
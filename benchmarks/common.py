@@ -0,0 +1,249 @@
+"""
+Shared helpers for the benchmark and load-testing scripts.
+
+The app resolves its templates, static files and SQLite database relative to
+the `src` directory, so `bootstrap()` must be called before anything from the
+app is imported. It points the app at a throwaway database (and, optionally, a
+local SMTP stub) through the same environment variables the app reads at
+startup.
+"""
+import os
+import sys
+import random
+import statistics
+import subprocess
+from decimal import Decimal
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SRC_DIR = REPO_ROOT / "src"
+
+FIRST_NAMES = ["Alex", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery"]
+LAST_NAMES = ["Smith", "Johnson", "Brown", "Miller", "Davis", "Wilson", "Moore", "Clark"]
+STREETS = ["Main St", "Oak Ave", "Maple Dr", "Cedar Ln", "Pine Rd", "Elm St"]
+CITIES = [("Evans City", "PA", "16033"), ("Zelienople", "PA", "16063"), ("Mars", "PA", "16046")]
+SERVICE_NAMES = ["Plowing", "Shoveling", "Rock Salt", "Premium Salt", "Calcium Chloride", "Deicing"]
+PER_UNITS = ["per-visit", "per-push"]
+
+
+def bootstrap(
+    database_path: str | Path,
+    smtp_port: int | None = None,
+) -> None:
+    """
+    Prepare the process to import the app.
+
+    Parameters:
+    - database_path: Path of the SQLite database file the app should use.
+    - smtp_port: Port of a local SMTP stub to send mail to, if any.
+    """
+    os.environ["SQLITE_FILE_NAME"] = str(database_path)
+    # fastapi-mail validates its configuration at import time, so it always
+    # needs a syntactically valid sender even if no mail is sent
+    os.environ.setdefault("MAIL_USERNAME", "benchmarks@example.com")
+    os.environ.setdefault("MAIL_PASSWORD", "benchmarks")
+    os.environ.setdefault("MAIL_SERVER", "127.0.0.1")
+    if smtp_port is not None:
+        os.environ["MAIL_SERVER"] = "127.0.0.1"
+        os.environ["MAIL_PORT"] = str(smtp_port)
+        os.environ["MAIL_STARTTLS"] = "false"
+        os.environ["MAIL_SSL_TLS"] = "false"
+        os.environ["MAIL_USE_CREDENTIALS"] = "false"
+        # The stub has no sending limits, and pacing would hide the
+        # pipeline's own cost
+        os.environ.setdefault("MAIL_RATE_PER_MINUTE", "1000000")
+        os.environ.setdefault("MAIL_BURST", "1000000")
+
+    os.chdir(SRC_DIR)
+    if str(SRC_DIR) not in sys.path:
+        sys.path.insert(0, str(SRC_DIR))
+
+
+def seed_app_settings(session, pdf_dir: str | Path) -> None:
+    """
+    Insert the app settings the routers read, pointing PDF output at pdf_dir.
+    """
+    from models import AppSetting
+
+    settings = [
+        AppSetting(id="0000", category="general", setting_name="theme", setting_value="light"),
+        AppSetting(id="0001", category="general", setting_name="color-theme", setting_value="blue-400"),
+        AppSetting(id="3000", category="quotes", setting_name="quote-save-pdfs-to-path", setting_value=str(pdf_dir)),
+        AppSetting(id="3001", category="quotes", setting_name="quote-email-body", setting_value="Dear {{client.name}},\n\nYour quote for {{client.street_address}} is attached."),
+        AppSetting(id="4000", category="invoices", setting_name="invoice-save-pdfs-to-path", setting_value=str(pdf_dir)),
+        AppSetting(id="4001", category="invoices", setting_name="invoice-email-body", setting_value=""),
+    ]
+    for setting in settings:
+        if session.get(AppSetting, setting.id) is None:
+            session.add(setting)
+    session.commit()
+
+
+def make_client(rng: random.Random, index: int):
+    """
+    Build a synthetic, unsaved Client.
+    """
+    from models import Client
+
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {index}"
+    city, state, zip_code = rng.choice(CITIES)
+    return Client(
+        name=name,
+        business_name=name if rng.random() < 0.5 else f"{name} LLC",
+        street_address=f"{rng.randint(1, 9999)} {rng.choice(STREETS)}",
+        city=city,
+        state=state,
+        zip_code=zip_code,
+        email=f"client{index}@example.com",
+        phone=f"(724) 555-{index % 10000:04d}",
+    )
+
+
+def make_service(rng: random.Random, index: int):
+    """
+    Build a synthetic, unsaved Service.
+    """
+    from models import Service
+
+    return Service(
+        name=f"{SERVICE_NAMES[index % len(SERVICE_NAMES)]} {index}",
+        description="Synthetic service used for benchmarking.",
+        unit_price=Decimal(rng.randint(2500, 25000)) / 100,
+    )
+
+
+def make_profile_lines(
+    rng: random.Random,
+    services: list,
+    num_lines: int,
+) -> tuple[list[dict], Decimal]:
+    """
+    Build the quote profile service lines for one client and their grand total.
+    """
+    lines = []
+    grand_total = Decimal("0.00")
+    for service in rng.sample(services, min(num_lines, len(services))):
+        quantity = rng.randint(1, 4)
+        tax = Decimal(rng.choice([0, 6, 7])).quantize(Decimal("0.00"))
+        total_price = (quantity * service.unit_price * (1 + tax / 100)).quantize(Decimal("0.00"))
+        lines.append({
+            "service_id": service.id,
+            "service_name": service.name,
+            "quantity": str(quantity),
+            "per_unit": rng.choice(PER_UNITS),
+            "unit_price": str(service.unit_price),
+            "tax": str(tax),
+            "total_price": str(total_price),
+        })
+        grand_total += total_price
+    return lines, grand_total
+
+
+def seed_database(
+    engine,
+    num_clients: int,
+    num_services: int,
+    lines_per_profile: int,
+    quotes_per_client: int = 0,
+    invoices_per_client: int = 0,
+    seed: int = 0,
+    batch_size: int = 1000,
+) -> list[int]:
+    """
+    Fill the database with synthetic clients, services and quote profiles
+    (plus matching temp quote profiles), committing in batches so large row
+    counts do not have to fit in a single transaction.
+
+    Returns:
+    - list[int]: The ids of the created clients.
+    """
+    from sqlmodel import Session
+    from models import (
+        ClientQuoteProfile, TempClientQuoteProfile, QuoteProfileLine,
+        TempQuoteProfileLine, Quote, Invoice
+    )
+
+    rng = random.Random(seed)
+    client_ids = []
+
+    with Session(engine) as session:
+        services = [make_service(rng, i) for i in range(num_services)]
+        session.add_all(services)
+        session.commit()
+        for service in services:
+            session.refresh(service)
+
+        for start in range(0, num_clients, batch_size):
+            clients = [
+                make_client(rng, i)
+                for i in range(start, min(start + batch_size, num_clients))
+            ]
+            session.add_all(clients)
+            session.flush()
+
+            for client in clients:
+                client_ids.append(client.id)
+                lines, grand_total = make_profile_lines(rng, services, lines_per_profile)
+                profile_data = {
+                    "client_id": client.id,
+                    "min_monthly_charge": Decimal("75.00"),
+                    "premium_salt_upcharge": Decimal("15.00"),
+                    "grand_total": grand_total,
+                }
+                session.add(ClientQuoteProfile(**profile_data))
+                session.add(TempClientQuoteProfile(**profile_data))
+                for line_model in (QuoteProfileLine, TempQuoteProfileLine):
+                    session.add_all(
+                        line_model.model_validate({**line, "client_id": client.id, "position": position})
+                        for position, line in enumerate(lines)
+                    )
+                for n in range(quotes_per_client):
+                    session.add(Quote(
+                        client_id=client.id,
+                        quote_no=f"{client.id}-{str(n + 1).zfill(4)}",
+                        pdf_html="<html></html>",
+                    ))
+                for n in range(invoices_per_client):
+                    session.add(Invoice(
+                        client_id=client.id,
+                        invoice_no=f"{client.id}-{str(n + 1).zfill(4)}",
+                        pdf_html="<html></html>",
+                    ))
+            session.commit()
+
+    return client_ids
+
+
+def summarize(samples: list[float]) -> dict:
+    """
+    Summarize a list of durations (in seconds) as milliseconds.
+    """
+    ordered = sorted(samples)
+    if len(ordered) >= 2:
+        percentiles = statistics.quantiles(ordered, n=100, method="inclusive")
+        p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+    else:
+        p50 = p95 = p99 = ordered[0] if ordered else 0.0
+    total = sum(ordered)
+    return {
+        "count": len(ordered),
+        "total_s": round(total, 4),
+        "mean_ms": round(total / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "p99_ms": round(p99 * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+def current_commit() -> str:
+    """
+    The short hash of the checked-out commit, or "unknown" outside a git repo.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
@@ -0,0 +1,98 @@
+"""
+Check that importing the app stays within a startup time budget.
+
+Imports `main` in fresh interpreters (the same way a worker does on boot)
+and reports the median wall time. The budget applies to the app's own share
+of that time: the median import of `main` minus the median import of the
+framework packages it cannot avoid (FastAPI, SQLModel, Jinja2), so the check
+means the same thing on a fast laptop and a slow CI box. The check also fails
+if any lazily loaded stack (xhtml2pdf, reportlab, fastapi-mail) was imported.
+
+Usage (from the repository root):
+
+    python -m benchmarks.import_time --budget 0.3 --runs 5
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+from benchmarks import common
+
+# Modules that must only be loaded on first use or by the background prewarm
+LAZY_MODULES = ("xhtml2pdf", "reportlab", "fastapi_mail")
+
+# Packages every worker has to import no matter how the app is structured
+FRAMEWORK_IMPORTS = "fastapi, fastapi.templating, fastapi.staticfiles, sqlmodel, jinja2"
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import %s
+""".strip()
+REPORT = """
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def measure_import(module: str, env: dict[str, str]) -> dict:
+    probe = (PROBE % module) + REPORT
+    result = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=common.SRC_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=0.3,
+        help="maximum seconds the app may add on top of the framework imports"
+    )
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters to time")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("MAIL_USERNAME", "bench@example.com")
+    env.setdefault("MAIL_PASSWORD", "bench")
+    env.setdefault("MAIL_SERVER", "localhost")
+
+    # The first runs warm the OS file cache and are not counted
+    measure_import(FRAMEWORK_IMPORTS, env)
+    measure_import("main", env)
+    framework_median = statistics.median(
+        measure_import(FRAMEWORK_IMPORTS, env)["seconds"] for _ in range(args.runs)
+    )
+    runs = [measure_import("main", env) for _ in range(args.runs)]
+    median = statistics.median(run["seconds"] for run in runs)
+    app_seconds = median - framework_median
+    loaded = sorted({name for run in runs for name in run["loaded"]})
+
+    print(f"import main:       median {median * 1000:.0f} ms over {args.runs} runs")
+    print(f"framework imports: median {framework_median * 1000:.0f} ms")
+    print(f"app overhead:      {app_seconds * 1000:.0f} ms (budget {args.budget * 1000:.0f} ms)")
+    failed = False
+    if app_seconds > args.budget:
+        print("FAIL: import time is over budget")
+        failed = True
+    if loaded:
+        print(f"FAIL: imported eagerly: {', '.join(loaded)}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
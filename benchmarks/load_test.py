@@ -0,0 +1,256 @@
+"""
+HTTP load test for the list pages and JSON APIs.
+
+Drives each scenario with a fixed number of concurrent httpx clients and
+reports p50/p99 latency, throughput and error counts per route. The server
+can either be one you started yourself (`--url`) or a `uvicorn` process this
+script starts against freshly seeded databases of each requested size.
+
+Usage (from the repository root):
+
+    # Seed 1k/10k/100k-row databases, start uvicorn on each and test it
+    python -m benchmarks.load_test --sizes 1000,10000,100000 --json load.json
+
+    # Test an already running server whose database holds 5000 clients
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --rows 5000
+
+    # Compare with an earlier report; exits with status 1 on a p99 regression
+    python -m benchmarks.load_test --sizes 1000 --baseline load.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+
+import httpx
+
+from benchmarks import common
+
+SCENARIOS = {
+    "clients_page": lambda rows, rng: "/clients/",
+    "quotes_page": lambda rows, rng: "/quotes/",
+    "invoices_page": lambda rows, rng: "/invoices/",
+    "services_api_all": lambda rows, rng: "/services/api/all",
+    "client_quote_profile": lambda rows, rng: f"/clients/get_client_quote_profile/{rng.randint(1, rows)}",
+}
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    build_path,
+    rows: int,
+    requests: int,
+    concurrency: int,
+    seed: int,
+) -> dict:
+    """
+    Issue `requests` requests for one scenario with `concurrency` workers.
+    """
+    rng = random.Random(seed)
+    paths = [build_path(rows, rng) for _ in range(requests)]
+    latencies = []
+    status_counts = {}
+    queue = iter(paths)
+
+    async def worker():
+        for path in queue:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            status_counts[status] = status_counts.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    summary = common.summarize(latencies)
+    summary["requests_per_s"] = round(len(latencies) / elapsed, 2) if elapsed else None
+    summary["errors"] = sum(
+        count for status, count in status_counts.items()
+        if not status.isdigit() or int(status) >= 400
+    )
+    summary["status_counts"] = status_counts
+    return summary
+
+
+async def run_all(
+    base_url: str,
+    rows: int,
+    scenarios: list[str],
+    requests: int,
+    concurrency: int,
+    timeout: float,
+    seed: int,
+) -> dict:
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        results = {}
+        for name in scenarios:
+            # One unmeasured request warms up template compilation and caches
+            try:
+                await client.get(SCENARIOS[name](rows, random.Random(seed)))
+            except httpx.HTTPError:
+                pass
+            results[name] = await run_scenario(
+                client, SCENARIOS[name], rows, requests, concurrency, seed
+            )
+        return results
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+        try:
+            httpx.get(f"{base_url}/services/api/all", timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.25)
+    raise RuntimeError(f"uvicorn did not become ready within {timeout}s")
+
+
+def run_against_uvicorn(args: argparse.Namespace, rows: int, workdir: Path) -> dict:
+    """
+    Seed a database of `rows` clients, serve it with uvicorn and load test it.
+    """
+    database_path = workdir / f"load-{rows}.db"
+    # Seeding runs in a subprocess because the app binds its database engine
+    # at import time
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.seed_data", "--rows", str(rows), "--out", str(database_path)],
+        cwd=common.REPO_ROOT,
+        check=True,
+    )
+
+    env = {
+        **os.environ,
+        "SQLITE_FILE_NAME": str(database_path),
+        "MAIL_USERNAME": os.environ.get("MAIL_USERNAME", "loadtest@example.com"),
+        "MAIL_PASSWORD": os.environ.get("MAIL_PASSWORD", "loadtest"),
+        "MAIL_SERVER": os.environ.get("MAIL_SERVER", "127.0.0.1"),
+    }
+    base_url = f"http://127.0.0.1:{args.port}"
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(args.port),
+            "--workers", str(args.workers), "--log-level", "warning",
+        ],
+        cwd=common.SRC_DIR,
+        env=env,
+    )
+    try:
+        wait_until_ready(base_url, process, args.startup_timeout)
+        return asyncio.run(run_all(
+            base_url, rows, args.scenarios, args.requests,
+            args.concurrency, args.timeout, args.seed,
+        ))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def print_report(report: dict) -> None:
+    print(f"commit {report['commit']} | concurrency {report['parameters']['concurrency']}")
+    header = f"{'rows':>8}  {'scenario':<24}{'n':>6}{'p50 ms':>11}{'p99 ms':>11}{'req/s':>10}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for rows, scenarios in report["results"].items():
+        for name, summary in scenarios.items():
+            print(
+                f"{rows:>8}  {name:<24}{summary['count']:>6}{summary['p50_ms']:>11.2f}"
+                f"{summary['p99_ms']:>11.2f}{summary['requests_per_s'] or 0:>10.2f}"
+                f"{summary['errors']:>8}"
+            )
+
+
+def find_regressions(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    regressions = []
+    for rows, scenarios in report["results"].items():
+        for name, summary in scenarios.items():
+            previous = baseline.get("results", {}).get(rows, {}).get(name)
+            if not previous or not previous["p99_ms"]:
+                continue
+            change = summary["p99_ms"] / previous["p99_ms"] - 1
+            if change > max_regression:
+                regressions.append(
+                    f"{rows} rows {name}: p99 {previous['p99_ms']:.2f} ms -> "
+                    f"{summary['p99_ms']:.2f} ms (+{change:.0%})"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="test an already running server instead of starting uvicorn")
+    parser.add_argument("--rows", type=int, default=1000, help="clients in the running server's database (with --url)")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated database sizes to seed and test")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenarios to run")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10, help="concurrent connections")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout in seconds")
+    parser.add_argument("--port", type=int, default=8765, help="port for the spawned uvicorn server")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="write the report as JSON to this path")
+    parser.add_argument("--baseline", type=Path, help="JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p99 slowdown per scenario")
+    args = parser.parse_args()
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = {}
+    if args.url:
+        results[str(args.rows)] = asyncio.run(run_all(
+            args.url.rstrip("/"), args.rows, args.scenarios, args.requests,
+            args.concurrency, args.timeout, args.seed,
+        ))
+    else:
+        sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+        with tempfile.TemporaryDirectory(prefix="invoice-app-load-") as tmp:
+            for rows in sizes:
+                results[str(rows)] = run_against_uvicorn(args, rows, Path(tmp))
+
+    report = {
+        "commit": common.current_commit(),
+        "python": platform.python_version(),
+        "parameters": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "url": args.url,
+        },
+        "results": results,
+    }
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+    if args.baseline:
+        regressions = find_regressions(report, json.loads(args.baseline.read_text()), args.max_regression)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
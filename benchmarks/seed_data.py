@@ -0,0 +1,86 @@
+"""
+Generate a synthetic SQLite database for load testing.
+
+Every client gets a quote profile (and temp quote profile) plus the requested
+number of quotes and invoices, so `--rows 10000` produces 10k clients, 10k
+quote profiles and 10k quotes and invoices each with the default options.
+
+Usage (from the repository root):
+
+    python -m benchmarks.seed_data --rows 10000 --out load-10k.db
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+from benchmarks import common
+
+
+def seed(
+    database_path: Path,
+    rows: int,
+    services: int = 25,
+    lines: int = 5,
+    quotes_per_client: int = 1,
+    invoices_per_client: int = 1,
+    seed: int = 0,
+) -> None:
+    """
+    Create (or replace) the database at database_path and fill it with rows
+    clients and their related data.
+    """
+    database_path = database_path.resolve()
+    if database_path.exists():
+        database_path.unlink()
+    pdf_dir = database_path.parent / f"{database_path.stem}-pdfs"
+    pdf_dir.mkdir(exist_ok=True)
+
+    common.bootstrap(database_path)
+
+    from sqlmodel import SQLModel, Session
+    from database import sqlite_engine
+    import models  # noqa: F401 - registers the tables on SQLModel.metadata
+
+    SQLModel.metadata.create_all(sqlite_engine)
+    with Session(sqlite_engine) as session:
+        common.seed_app_settings(session, pdf_dir)
+    common.seed_database(
+        sqlite_engine,
+        num_clients=rows,
+        num_services=services,
+        lines_per_profile=lines,
+        quotes_per_client=quotes_per_client,
+        invoices_per_client=invoices_per_client,
+        seed=seed,
+    )
+    sqlite_engine.dispose()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, required=True, help="number of clients to create")
+    parser.add_argument("--out", type=Path, required=True, help="database file to write")
+    parser.add_argument("--services", type=int, default=25, help="services in the catalog")
+    parser.add_argument("--lines", type=int, default=5, help="service lines per quote profile")
+    parser.add_argument("--quotes-per-client", type=int, default=1)
+    parser.add_argument("--invoices-per-client", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0, help="random seed for synthetic data")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    seed(
+        args.out,
+        rows=args.rows,
+        services=args.services,
+        lines=args.lines,
+        quotes_per_client=args.quotes_per_client,
+        invoices_per_client=args.invoices_per_client,
+        seed=args.seed,
+    )
+    print(f"Seeded {args.rows} clients into {args.out} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+A minimal in-process SMTP server that accepts and discards every message.
+
+It speaks just enough SMTP (no TLS, no AUTH) for fastapi-mail to deliver to
+it, so mail sending can be benchmarked without touching a real provider.
+"""
+import asyncio
+import threading
+
+
+class SMTPStub:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.messages_received = 0
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def start(self) -> "SMTPStub":
+        self._thread.start()
+        future = asyncio.run_coroutine_threadsafe(self._start_server(), self._loop)
+        future.result(timeout=5)
+        return self
+
+    def stop(self) -> None:
+        async def _close():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(_close(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def __enter__(self) -> "SMTPStub":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    async def _start_server(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        async def reply(line: str) -> None:
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        await reply("220 smtp-stub ready")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode(errors="replace").strip().upper()
+
+                if command.startswith("EHLO"):
+                    writer.write(b"250-smtp-stub\r\n250-8BITMIME\r\n250 SIZE 52428800\r\n")
+                    await writer.drain()
+                elif command == "DATA":
+                    await reply("354 end data with <CR><LF>.<CR><LF>")
+                    while (await reader.readline()) not in (b".\r\n", b".\n", b""):
+                        pass
+                    self.messages_received += 1
+                    await reply("250 OK: queued")
+                elif command == "QUIT":
+                    await reply("221 bye")
+                    break
+                else:
+                    # HELO, MAIL FROM, RCPT TO, RSET and NOOP all just succeed
+                    await reply("250 OK")
+        finally:
+            writer.close()
@@ -0,0 +1,73 @@
+"""
+Summarize a span file written by the file trace exporter.
+
+Spans are grouped by name and ranked by self time (a span's duration minus
+the time spent in its child spans), which shows the stage that dominates a
+slow batch. Pass --client to only count spans recorded for one client.
+
+Usage (from the repository root, after running the app or a benchmark with
+TRACE_EXPORTER=file):
+
+    python -m benchmarks.trace_summary src/traces.jsonl
+    python -m benchmarks.trace_summary src/traces.jsonl --client 42
+"""
+import sys
+import json
+import argparse
+from pathlib import Path
+from collections import defaultdict
+
+
+def load_spans(path: Path) -> list[dict]:
+    with open(path, encoding="utf-8") as trace_file:
+        return [json.loads(line) for line in trace_file if line.strip()]
+
+
+def summarize_spans(spans: list[dict], client_id: str | None = None) -> list[dict]:
+    """
+    Aggregate count, total time and self time per span name, sorted by self
+    time (largest first).
+    """
+    child_ms = defaultdict(float)
+    for span in spans:
+        if span["parent_span_id"]:
+            child_ms[span["parent_span_id"]] += span["duration_ms"]
+
+    stages: dict[str, dict] = {}
+    for span in spans:
+        if client_id is not None and str(span["attributes"].get("client.id")) != client_id:
+            continue
+        stage = stages.setdefault(
+            span["name"],
+            {"name": span["name"], "count": 0, "errors": 0, "total_ms": 0.0, "self_ms": 0.0}
+        )
+        stage["count"] += 1
+        stage["errors"] += span["status"]["code"] == "ERROR"
+        stage["total_ms"] += span["duration_ms"]
+        stage["self_ms"] += max(span["duration_ms"] - child_ms[span["span_id"]], 0.0)
+
+    return sorted(stages.values(), key=lambda stage: stage["self_ms"], reverse=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("trace_file", type=Path, help="JSON lines file written by TRACE_EXPORTER=file")
+    parser.add_argument("--client", help="only include spans tagged with this client id")
+    args = parser.parse_args()
+
+    stages = summarize_spans(load_spans(args.trace_file), args.client)
+    all_self_ms = sum(stage["self_ms"] for stage in stages) or 1.0
+
+    print(f"{'span':40} {'n':>6} {'errors':>6} {'total ms':>11} {'self ms':>11} {'self %':>7}")
+    print("-" * 86)
+    for stage in stages:
+        print(
+            f"{stage['name']:40} {stage['count']:>6} {stage['errors']:>6} "
+            f"{stage['total_ms']:>11.2f} {stage['self_ms']:>11.2f} "
+            f"{100 * stage['self_ms'] / all_self_ms:>6.1f}%"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import tempfile
+import mimetypes
+from functools import lru_cache
+
+from fastapi.staticfiles import StaticFiles
+from fastapi_tailwind import tailwind
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+
+import config
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+TAILWIND_INPUT_PATH = os.path.join(STATIC_DIR, "css", "input.css")
+# The stylesheet the Tailwind watcher writes to during development
+DEV_CSS_PATH = "css/output.css"
+# Maps logical asset paths (relative to static/) to their fingerprinted paths
+MANIFEST_PATH = os.path.join(STATIC_DIR, "manifest.json")
+# Fingerprinted copies of the assets and their compressed variants
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+# Directories under static/ whose files are fingerprinted as they are
+FINGERPRINTED_DIRS = ("js", "images")
+# Text assets worth serving compressed
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".json", ".svg", ".txt"}
+# Precompressed variants in order of preference. Brotli is optional and only
+# used if the `brotli` package is installed.
+ENCODING_SUFFIXES = (("br", ".br"), ("gzip", ".gz"))
+# Fingerprinted files never change, so browsers may keep them for a year
+# without revalidating
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def _fingerprinted_path(path: str, content: bytes) -> str:
+    """
+    Get the path of an asset with a hash of its content in the filename,
+    e.g. "css/output.css" -> "dist/css/output.3f2a9c1d0b7e.css".
+    """
+    root, extension = os.path.splitext(path)
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return f"dist/{root}.{digest}{extension}"
+
+def _compress(content: bytes) -> dict[str, bytes]:
+    """
+    Compress an asset with every available encoding at the highest level,
+    keeping only the variants that are smaller than the original.
+    """
+    variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        variants[".br"] = brotli.compress(content, quality=11)
+    return {suffix: data for suffix, data in variants.items() if len(data) < len(content)}
+
+def _write_asset(path: str, content: bytes) -> str:
+    """
+    Write a fingerprinted copy of an asset, and its compressed variants if it
+    is a text asset, to static/dist/.
+
+    Returns:
+    - str: The fingerprinted path, relative to static/.
+    """
+    dist_path = _fingerprinted_path(path, content)
+    output_path = os.path.join(STATIC_DIR, dist_path)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "wb") as output_file:
+        output_file.write(content)
+    if os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS:
+        for suffix, data in _compress(content).items():
+            with open(output_path + suffix, "wb") as output_file:
+                output_file.write(data)
+    return dist_path
+
+def compile_css() -> bytes:
+    """
+    Compile and minify the Tailwind stylesheet once.
+
+    Returns:
+    - bytes: The minified stylesheet.
+
+    Raises:
+    - RuntimeError: If the Tailwind compiler fails.
+    """
+    with tempfile.TemporaryDirectory() as build_dir:
+        output_path = os.path.join(build_dir, "output.css")
+        process = tailwind.compile(
+            output_path,
+            tailwind_stylesheet_path=TAILWIND_INPUT_PATH,
+            watch=False,
+            minify=True
+        )
+        if process.wait() != 0:
+            raise RuntimeError(f"Tailwind exited with status {process.returncode}.")
+        with open(output_path, "rb") as output_file:
+            return output_file.read()
+
+def build_assets() -> dict[str, str]:
+    """
+    Build the static assets served in production: the minified stylesheet
+    and every file in FINGERPRINTED_DIRS are written to static/dist/ under
+    fingerprinted names, along with gzip (and brotli) variants of the text
+    assets, and recorded in the asset manifest. The output of earlier builds
+    is removed.
+
+    Returns:
+    - dict[str, str]: The new manifest, mapping each asset's path to its
+    fingerprinted path (both relative to static/).
+
+    Raises:
+    - RuntimeError: If the Tailwind compiler fails.
+    """
+    css_content = compile_css()
+
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    manifest = {DEV_CSS_PATH: _write_asset(DEV_CSS_PATH, css_content)}
+    for directory in FINGERPRINTED_DIRS:
+        for root, _, file_names in os.walk(os.path.join(STATIC_DIR, directory)):
+            for file_name in sorted(file_names):
+                full_path = os.path.join(root, file_name)
+                path = os.path.relpath(full_path, STATIC_DIR).replace(os.sep, "/")
+                with open(full_path, "rb") as asset_file:
+                    manifest[path] = _write_asset(path, asset_file.read())
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=4, sort_keys=True)
+    return manifest
+
+def load_manifest() -> dict[str, str]:
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, encoding="utf-8") as manifest_file:
+        return json.load(manifest_file)
+
+@lru_cache(maxsize=1)
+def _production_manifest() -> dict[str, str]:
+    # The manifest cannot change while a production server is running
+    return load_manifest()
+
+def asset_url(path: str) -> str:
+    """
+    Jinja global that returns the URL of a static asset. In production this is
+    the fingerprinted file from the last build, during development it is the
+    file the Tailwind watcher keeps up to date.
+    """
+    if config.PRODUCTION:
+        path = _production_manifest().get(path, path)
+    return f"/static/{path}"
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    """
+    Get the content codings a client accepts from its Accept-Encoding header,
+    leaving out any it refuses with q=0.
+    """
+    encodings = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        params = params.strip()
+        q = params[2:] if params.startswith("q=") else "1"
+        try:
+            if float(q) > 0:
+                encodings.add(coding.strip().lower())
+        except ValueError:
+            continue
+    return encodings
+
+class CompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves the precompressed variant of a built asset when
+    the client accepts its encoding, and lets browsers cache fingerprinted
+    assets forever. Other files must be revalidated on every use.
+    """
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope,
+        status_code: int = 200
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        is_built = os.path.commonpath([os.path.realpath(full_path), os.path.realpath(DIST_DIR)]) \
+            == os.path.realpath(DIST_DIR)
+
+        response = None
+        if is_built and os.path.splitext(full_path)[1] in COMPRESSIBLE_EXTENSIONS:
+            accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+            for encoding, suffix in ENCODING_SUFFIXES:
+                if encoding not in accepted:
+                    continue
+                try:
+                    compressed_stat = os.stat(f"{full_path}{suffix}")
+                except FileNotFoundError:
+                    continue
+                response = FileResponse(
+                    f"{full_path}{suffix}",
+                    status_code=status_code,
+                    stat_result=compressed_stat,
+                    media_type=mimetypes.guess_type(str(full_path))[0],
+                    headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+                )
+                break
+
+        # Uncompressed responses get their Vary header from the GZip middleware
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if is_built else "no-cache"
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
\ No newline at end of file
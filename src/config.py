@@ -0,0 +1,22 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "production" serves prebuilt assets and skips the Tailwind compiler process
+# started for development. Run `python manage.py build-assets` before starting
+# the app in production.
+APP_ENV = os.getenv("APP_ENV", "development").lower()
+PRODUCTION = APP_ENV == "production"
+
+# Load the PDF and email libraries in a background thread at startup, so the
+# first batch send does not pay for importing them
+PREWARM_SERVICES = os.getenv("PREWARM_SERVICES", "true").lower() == "true"
+
+# Start the monthly billing run on the billing day set on the settings page.
+# Turn off in all but one process if the app runs as several processes.
+BILLING_SCHEDULER = os.getenv("BILLING_SCHEDULER", "true").lower() == "true"
+
+# Send the emails in the outbox from a background thread of the app. Turn off
+# if the emails are sent by `python manage.py outbox-worker` instead.
+OUTBOX_WORKER = os.getenv("OUTBOX_WORKER", "true").lower() == "true"
\ No newline at end of file
@@ -0,0 +1,138 @@
+import os
+import hashlib
+import inspect
+import functools
+from typing import Callable
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlmodel import SQLModel, Session
+
+import utils
+import config
+from templating import TEMPLATES_DIR
+from services import DataVersionCRUD
+
+# Responses may only be reused by the browser that requested them, and only
+# after revalidating their ETag
+CACHE_CONTROL = "private, no-cache"
+
+def _templates_fingerprint() -> str:
+    """
+    Fingerprint the template files so that editing a template changes the
+    ETags of the pages rendered from it.
+    """
+    digest = hashlib.sha1()
+    for directory, _, file_names in sorted(os.walk(TEMPLATES_DIR)):
+        for file_name in sorted(file_names):
+            path = os.path.join(directory, file_name)
+            file_stat = os.stat(path)
+            digest.update(f"{path}:{file_stat.st_mtime_ns}:{file_stat.st_size};".encode())
+    return digest.hexdigest()
+
+# Templates cannot change under a production server, so only fingerprint them
+# once per process
+if config.PRODUCTION:
+    _templates_fingerprint = functools.cache(_templates_fingerprint)
+
+def compute_etag(
+    request: Request,
+    session: Session,
+    models: tuple[type[SQLModel], ...]
+) -> str:
+    """
+    Compute the ETag of a response from the data versions of the tables it is
+    built from and the parts of the request that change its content.
+
+    Parameters:
+    - request: The incoming HTTP request.
+    - session: A SQLModel session for database access.
+    - models: The models whose tables the response is built from.
+
+    Returns:
+    - str: A weak ETag.
+    """
+    _, versions = utils.call_service_or_500(
+        DataVersionCRUD.get_versions,
+        models,
+        session
+    )
+    key = "|".join([
+        ",".join(f"{table_name}={version}" for table_name, version in sorted(versions.items())),
+        request.url.path,
+        request.url.query,
+        # The number of rows shown per page depends on the viewport height
+        request.cookies.get(utils.VIEWPORT_HEIGHT_COOKIE, ""),
+        _templates_fingerprint(),
+    ])
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:24]}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Check an `If-None-Match` header against an ETag using the weak comparison
+    that conditional GET requests use.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque_tag
+        for tag in if_none_match.split(",")
+    )
+
+def not_modified_response(etag: str) -> Response:
+    """
+    Build the 304 (NOT MODIFIED) response for a request that already has the
+    current version of a resource.
+    """
+    return Response(
+        status_code=304,
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    )
+
+def _with_etag(result, etag: str) -> Response:
+    response = result if isinstance(result, Response) else JSONResponse(jsonable_encoder(result))
+    if response.status_code == 200:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
+
+def conditional(*models: type[SQLModel]) -> Callable[[Callable], Callable]:
+    """
+    Decorator for GET route handlers whose response only depends on the given
+    models' tables and the request URL. A request whose `If-None-Match` header
+    carries the current ETag gets a 304 (NOT MODIFIED) response before the
+    handler runs any query or renders any template. The handler must take
+    `request` and `session` parameters.
+
+    Parameters:
+    - models: The models whose tables the response is built from.
+
+    Returns:
+    - The decorator.
+    """
+    def decorator(func: Callable) -> Callable:
+        parameters = inspect.signature(func).parameters
+        if "request" not in parameters or "session" not in parameters:
+            raise TypeError(f"{func.__name__} must take request and session parameters")
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                etag = compute_etag(kwargs["request"], kwargs["session"], models)
+                if etag_matches(kwargs["request"].headers.get("if-none-match"), etag):
+                    return not_modified_response(etag)
+                return _with_etag(await func(*args, **kwargs), etag)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = compute_etag(kwargs["request"], kwargs["session"], models)
+            if etag_matches(kwargs["request"].headers.get("if-none-match"), etag):
+                return not_modified_response(etag)
+            return _with_etag(func(*args, **kwargs), etag)
+        return wrapper
+    return decorator
\ No newline at end of file
@@ -1,36 +1,84 @@
 import os
+import logging
+import threading
 from typing import Annotated
 from contextlib import asynccontextmanager
 from datetime import datetime
 
-from fastapi import FastAPI, Depends, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Depends, Request, HTTPException, status
+from fastapi.responses import HTMLResponse, PlainTextResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from heroicons.jinja import (
-    heroicon_micro, heroicon_mini, heroicon_outline, heroicon_solid
-)
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi_tailwind import tailwind
 from sqlmodel import SQLModel, Session
 
+import assets
+import config
+import metrics
+import tracing
+import profiling
+import utils
+from templating import templates, precompile_templates
 from routers import clients, services, quotes, invoices, settings
 from database import sqlite_engine, get_session
 from models import (
     Client, Service, ClientQuoteProfile, Quote, Invoice, AppSetting
 )
-from services import AppSettingCRUD
+from services import (
+    AppSettingCRUD,
+    PDFServices,
+    EmailServices,
+    MigrationServices,
+    DashboardServices,
+    billing_scheduler,
+    outbox_worker
+)
+
+def prewarm_services() -> None:
+    """
+    Import the PDF and email stacks, which are otherwise loaded on first use.
+    """
+    for prewarm in (PDFServices.prewarm, EmailServices.prewarm):
+        success, message, _ = prewarm()
+        if not success:
+            logging.getLogger(__name__).warning("Prewarming failed: %s", message)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     ### Do on Startup ###
     # Create database tables if they don't exist
     SQLModel.metadata.create_all(sqlite_engine)
+    # Add indexes added since the existing tables were created
+    success, message, _ = MigrationServices.create_missing_indexes()
+    if not success:
+        raise RuntimeError(f"Creating indexes failed: {message}")
+    # Move quote profile lines saved as JSON into the quote profile line tables
+    success, message, _ = MigrationServices.migrate_quote_profile_lines()
+    if not success:
+        raise RuntimeError(f"Migrating quote profile lines failed: {message}")
+    # Add the grand totals of quotes and invoices and build the dashboard's
+    # activity tables
+    success, message, _ = MigrationServices.migrate_document_totals()
+    if not success:
+        raise RuntimeError(f"Migrating quote and invoice totals failed: {message}")
 
-    # Start Tailwind CSS compiler process
-    process = tailwind.compile(
-        StaticFiles(directory = "static").directory + "/css/output.css",
-        tailwind_stylesheet_path = "./static/css/input.css"
-    )
+    # Compile every template up front so no page pays for it on its first hit
+    precompile_templates()
+
+    # Start Tailwind CSS compiler process. In production the stylesheet is
+    # prebuilt by `python manage.py build-assets` and served as is.
+    process = None
+    if config.PRODUCTION:
+        if assets.DEV_CSS_PATH not in assets.load_manifest():
+            raise RuntimeError(
+                "No prebuilt stylesheet found. Run `python manage.py build-assets` "
+                "before starting the app with APP_ENV=production."
+            )
+    else:
+        process = tailwind.compile(
+            StaticFiles(directory = "static").directory + "/css/output.css",
+            tailwind_stylesheet_path = "./static/css/input.css"
+        )
 
     # Populate AppSettings table with default settings, if they do not exist already
     project_root_abs_dir_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -81,7 +129,9 @@ async def lifespan(app: FastAPI):
         ),
         # 4000 series: Invoices Settings
         AppSetting(id="4000", category="invoices", setting_name="invoice-save-pdfs-to-path", setting_value=invoices_dir),
-        AppSetting(id="4001", category="invoices", setting_name="invoice-email-body", setting_value="")
+        AppSetting(id="4001", category="invoices", setting_name="invoice-email-body", setting_value=""),
+        # Day of the month the billing run invoices every client, blank for no billing runs
+        AppSetting(id="4002", category="invoices", setting_name="invoice-billing-day", setting_value="")
     ]
 
     with Session(sqlite_engine) as session:
@@ -91,16 +141,46 @@ async def lifespan(app: FastAPI):
                 session.add(default_setting)
                 session.commit()
 
+    # Load the PDF and email stacks in the background while the server starts
+    # accepting requests
+    if config.PREWARM_SERVICES:
+        threading.Thread(target=prewarm_services, name="prewarm-services", daemon=True).start()
+
+    # Start the monthly billing runs on the billing day
+    if config.BILLING_SCHEDULER:
+        billing_scheduler.start()
+
+    # Send the emails queued in the outbox
+    if config.OUTBOX_WORKER:
+        outbox_worker.start()
+
     yield
     ### Do on Shutdown ###
+    billing_scheduler.stop()
+    outbox_worker.stop()
     # Stop Tailwind CSS compiler process
-    process.terminate()
+    if process is not None:
+        process.terminate()
 
 # Create FastAPI app with lifespan context manager
 app = FastAPI(lifespan=lifespan)
 
+# Compress dynamic responses (HTML pages and JSON). Built static assets are
+# served precompressed and pass through untouched.
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# Time every request and count the database queries it issues
+metrics.instrument_engine(sqlite_engine)
+app.add_middleware(metrics.TimingMiddleware)
+
+# Open a root span per request when tracing is enabled (TRACE_EXPORTER)
+app.add_middleware(tracing.TracingMiddleware)
+
+# Profile requests that carry the admin profiling token (PROFILING_TOKEN)
+app.add_middleware(profiling.ProfilingMiddleware)
+
 # Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", assets.CompressedStaticFiles(directory="static"), name="static")
 
 # Attach routers
 app.include_router(clients.router)
@@ -109,17 +189,6 @@ app.include_router(quotes.router)
 app.include_router(invoices.router)
 app.include_router(settings.router)
 
-# Create Jinja2 templates object for rendering HTML from the templates directory
-templates = Jinja2Templates(directory="./templates")
-templates.env.globals.update(
-    {
-        "heroicon_micro": heroicon_micro,
-        "heroicon_mini": heroicon_mini,
-        "heroicon_outline": heroicon_outline,
-        "heroicon_solid": heroicon_solid,
-    }
-)
-
 SessionDependency = Annotated[Session, Depends(get_session)]
 
 @app.get("/", response_class=HTMLResponse)
@@ -129,6 +198,8 @@ async def render_dashboard_page(
 ) -> HTMLResponse:
     """
     Renders the dashboard page. This is the primary page of the application.
+    The quote and invoice KPIs are read from the activity tables, which are
+    kept up to date as quotes and invoices are created.
 
     Parameters:
     - request: Request - The incoming HTTP request object.
@@ -149,8 +220,65 @@ async def render_dashboard_page(
     else:
         greeting = "Good evening!"
 
+    # Get the quote and invoice KPIs
+    _, summary = utils.call_service_or_500(DashboardServices.get_summary, session)
+
     return templates.TemplateResponse(
         request=request,
         name="dashboard.html",
-        context={"theme": theme, "colorTheme": colorTheme, "greeting": greeting}
-    )
\ No newline at end of file
+        context={
+            "theme": theme,
+            "colorTheme": colorTheme,
+            "greeting": greeting,
+            **summary
+        }
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics() -> PlainTextResponse:
+    """
+    Exposes per-route request counts, durations, database query counts and
+    database time in the Prometheus text exposition format.
+
+    Returns:
+    - PlainTextResponse: The metrics of all requests handled by this process.
+    """
+    return PlainTextResponse(
+        content=metrics.registry.render_prometheus(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/profiles/{profile_name}")
+def get_profile(
+    request: Request,
+    profile_name: str,
+    format: str = "prof"
+):
+    """
+    Downloads a stored request profile. Requires the admin profiling token in
+    the `X-Profile` header or the `profile` query parameter.
+
+    Parameters:
+    - request: Request - The incoming HTTP request object.
+    - profile_name: str - The profile name returned in the `X-Profile` response header.
+    - format: str - "prof" for the raw cProfile file (for snakeviz, flameprof, etc.) or "text" for a pstats summary.
+
+    Returns:
+    - FileResponse | PlainTextResponse: The stored profile.
+
+    Raises:
+    - HTTPException:
+        - 403 (FORBIDDEN) if the profiling token is missing or wrong
+        - 404 (NOT FOUND) if the profile does not exist
+    """
+    token = request.headers.get("X-Profile") or request.query_params.get("profile")
+    if not profiling.is_authorized(token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized.")
+
+    path = profiling.profile_file_path(profile_name)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found.")
+
+    if format == "text":
+        return PlainTextResponse(profiling.render_profile_text(path))
+    return FileResponse(path, media_type="application/octet-stream", filename=profile_name)
\ No newline at end of file
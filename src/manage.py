@@ -0,0 +1,199 @@
+"""
+Maintenance commands for the invoice app. Run from the src directory:
+
+    python manage.py build-assets
+    python manage.py migrate-quote-profile-lines
+    python manage.py reprice-quote-profiles
+    python manage.py rebuild-dashboard
+    python manage.py billing-run [--period YYYY-MM] [--dry-run]
+    python manage.py outbox-worker [--once] [--retry-failed]
+"""
+import sys
+import argparse
+
+def build_assets(args: argparse.Namespace) -> int:
+    import assets
+
+    manifest = assets.build_assets()
+    for path, dist_path in sorted(manifest.items()):
+        print(f"Built static/{dist_path} ({path})")
+    return 0
+
+def migrate_quote_profile_lines(args: argparse.Namespace) -> int:
+    from sqlmodel import SQLModel
+
+    from database import sqlite_engine
+    from services import MigrationServices
+
+    # Create the quote profile line tables if the app was not started since
+    # they were added
+    SQLModel.metadata.create_all(sqlite_engine)
+
+    success, message, _ = MigrationServices.migrate_quote_profile_lines()
+    print(message)
+    return 0 if success else 1
+
+def reprice_quote_profiles(args: argparse.Namespace) -> int:
+    from services import RepricingServices
+
+    # Quote profile lines are only re-priced once they are in the line tables
+    status = migrate_quote_profile_lines(args)
+    if status != 0:
+        return status
+
+    success, message, _ = RepricingServices.reprice_all()
+    print(message)
+    return 0 if success else 1
+
+def rebuild_dashboard(args: argparse.Namespace) -> int:
+    from sqlmodel import SQLModel
+
+    from database import sqlite_engine
+    from services import MigrationServices, DashboardServices
+
+    # Create the activity tables and add the quote and invoice grand totals
+    # if the app was not started since they were added
+    SQLModel.metadata.create_all(sqlite_engine)
+    success, message, _ = MigrationServices.migrate_document_totals()
+    if not success:
+        print(message)
+        return 1
+
+    success, message, _ = DashboardServices.rebuild()
+    print(message)
+    return 0 if success else 1
+
+def billing_run(args: argparse.Namespace) -> int:
+    from services import MigrationServices, BillingServices
+
+    # Bring the database up to date, the billing run reads quote profile
+    # lines and stores invoice totals
+    status = migrate_quote_profile_lines(args)
+    if status != 0:
+        return status
+    for migrate in (MigrationServices.create_missing_indexes, MigrationServices.migrate_document_totals):
+        success, message, _ = migrate()
+        if not success:
+            print(message)
+            return 1
+
+    success, message, period = BillingServices.parse_period(args.period)
+    if not success:
+        print(message)
+        return 1
+
+    if args.dry_run:
+        success, message, preview = BillingServices.preview(period)
+        if success:
+            for invoice in preview["invoices"]:
+                print(f"{invoice['invoice_no']:>12}  {invoice['grand_total']:>12}  {invoice['client_name']}")
+            print(f"Total: {preview['grand_total']}")
+        print(message)
+        return 0 if success else 1
+
+    success, message, _ = BillingServices.run(period)
+    print(message)
+    return 0 if success else 1
+
+def outbox_worker(args: argparse.Namespace) -> int:
+    import asyncio
+    import logging
+
+    from sqlmodel import SQLModel, Session
+
+    from database import sqlite_engine
+    from services import OutboxServices, outbox_worker
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    # Create the outbox table if the app was not started since it was added
+    SQLModel.metadata.create_all(sqlite_engine)
+
+    with Session(sqlite_engine) as session:
+        if args.retry_failed:
+            success, message, _ = OutboxServices.retry_failed(session)
+            print(message)
+            if not success:
+                return 1
+        _, _, counts = OutboxServices.get_counts(session)
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+
+    if args.once:
+        # Send every email that is due, then exit
+        while True:
+            success, message, report = asyncio.run(OutboxServices.send_due())
+            if not success:
+                print(message)
+                return 1
+            if not sum(report.values()):
+                return 0
+            print(message)
+
+    print("Sending outbox emails, press Ctrl+C to stop.")
+    try:
+        outbox_worker.run()
+    except KeyboardInterrupt:
+        outbox_worker.stop()
+    return 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Invoice app maintenance commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_assets_parser = commands.add_parser(
+        "build-assets",
+        help="build the minified, fingerprinted and precompressed assets served in production"
+    )
+    build_assets_parser.set_defaults(handler=build_assets)
+
+    migrate_parser = commands.add_parser(
+        "migrate-quote-profile-lines",
+        help="move quote profile lines saved as JSON into the quote profile line tables"
+    )
+    migrate_parser.set_defaults(handler=migrate_quote_profile_lines)
+
+    reprice_parser = commands.add_parser(
+        "reprice-quote-profiles",
+        help="re-price every quote profile line at its service's current unit price"
+    )
+    reprice_parser.set_defaults(handler=reprice_quote_profiles)
+
+    rebuild_dashboard_parser = commands.add_parser(
+        "rebuild-dashboard",
+        help="rebuild the dashboard's monthly and per-client activity from every quote and invoice"
+    )
+    rebuild_dashboard_parser.set_defaults(handler=rebuild_dashboard)
+
+    billing_run_parser = commands.add_parser(
+        "billing-run",
+        help="invoice every client with a quote profile for a month, or resume the month's interrupted run"
+    )
+    billing_run_parser.add_argument("--period", help="the month to bill, YYYY-MM (default: this month)")
+    billing_run_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only list the invoices the run would create"
+    )
+    billing_run_parser.set_defaults(handler=billing_run)
+
+    outbox_worker_parser = commands.add_parser(
+        "outbox-worker",
+        help="send the emails queued in the outbox, instead of the app's background thread (OUTBOX_WORKER=false)"
+    )
+    outbox_worker_parser.add_argument(
+        "--once",
+        action="store_true",
+        help="send the emails that are due and exit"
+    )
+    outbox_worker_parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="queue the emails that were given up on again first"
+    )
+    outbox_worker_parser.set_defaults(handler=outbox_worker)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,198 @@
+import time
+import threading
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Upper bounds (in seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class RequestStats:
+    """
+    Database activity of a single request, collected by the engine hooks.
+    """
+    def __init__(self):
+        self.query_count = 0
+        self.db_seconds = 0.0
+
+# The stats of the request currently being handled. Sync endpoints run in a
+# threadpool with a copy of the request's context, so they update the same
+# RequestStats object as the middleware reads.
+_current_request_stats: ContextVar[RequestStats | None] = ContextVar(
+    "current_request_stats", default=None
+)
+
+class RouteMetrics:
+    def __init__(self):
+        self.request_count = 0
+        self.duration_sum = 0.0
+        self.duration_bucket_counts = [0] * len(DURATION_BUCKETS)
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.status_counts: dict[str, int] = {}
+
+class MetricsRegistry:
+    """
+    In-process aggregate of request metrics, keyed by method and route
+    template (e.g. "/clients/get_client_quote_profile/{client_id}") so that
+    path parameters do not create a series per id.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: dict[tuple[str, str], RouteMetrics] = {}
+
+    def record(
+        self,
+        method: str,
+        route: str,
+        status_code: int,
+        duration: float,
+        stats: RequestStats
+    ) -> None:
+        with self._lock:
+            metrics = self._routes.setdefault((method, route), RouteMetrics())
+            metrics.request_count += 1
+            metrics.duration_sum += duration
+            for i, upper_bound in enumerate(DURATION_BUCKETS):
+                if duration <= upper_bound:
+                    metrics.duration_bucket_counts[i] += 1
+            metrics.query_count += stats.query_count
+            metrics.db_seconds += stats.db_seconds
+            status = str(status_code)
+            metrics.status_counts[status] = metrics.status_counts.get(status, 0) + 1
+
+    def render_prometheus(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                "# HELP http_requests_total Total HTTP requests handled.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route), metrics in routes:
+                for status, count in sorted(metrics.status_counts.items()):
+                    lines.append(
+                        f'http_requests_total{{{_labels(method, route)},status="{status}"}} {count}'
+                    )
+
+            lines += [
+                "# HELP http_request_duration_seconds Time spent handling HTTP requests.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), metrics in routes:
+                labels = _labels(method, route)
+                for upper_bound, count in zip(DURATION_BUCKETS, metrics.duration_bucket_counts):
+                    lines.append(
+                        f'http_request_duration_seconds_bucket{{{labels},le="{upper_bound}"}} {count}'
+                    )
+                lines.append(
+                    f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.request_count}'
+                )
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {metrics.duration_sum:.6f}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {metrics.request_count}")
+
+            lines += [
+                "# HELP db_queries_total Database queries issued while handling HTTP requests.",
+                "# TYPE db_queries_total counter",
+            ]
+            for (method, route), metrics in routes:
+                lines.append(f"db_queries_total{{{_labels(method, route)}}} {metrics.query_count}")
+
+            lines += [
+                "# HELP db_query_duration_seconds_total Time spent in database queries while handling HTTP requests.",
+                "# TYPE db_query_duration_seconds_total counter",
+            ]
+            for (method, route), metrics in routes:
+                lines.append(
+                    f"db_query_duration_seconds_total{{{_labels(method, route)}}} {metrics.db_seconds:.6f}"
+                )
+
+        return "\n".join(lines) + "\n"
+
+def _labels(method: str, route: str) -> str:
+    route = route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'method="{method}",route="{route}"'
+
+registry = MetricsRegistry()
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Attach event hooks to the engine that count the queries and database time
+    of the request being handled.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_times"].pop()
+        stats = _current_request_stats.get()
+        if stats is not None:
+            stats.query_count += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        start_times = exception_context.connection.info.get("query_start_times") \
+            if exception_context.connection is not None else None
+        if start_times:
+            start_times.pop()
+
+def _route_label(scope: Scope) -> str:
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    # Mounted apps (e.g. the static files) only leave their prefix behind
+    if scope.get("root_path", "") != scope.get("app_root_path", ""):
+        return scope["root_path"]
+    return "<unmatched>"
+
+class TimingMiddleware:
+    """
+    ASGI middleware that times each HTTP request, reports the request's
+    duration and database activity in a `Server-Timing` response header, and
+    records them in the metrics registry.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_request_stats.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_server_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f"app;dur={elapsed_ms:.2f}, "
+                    f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.query_count} queries"'
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_server_timing)
+        finally:
+            _current_request_stats.reset(token)
+            registry.record(
+                method=scope["method"],
+                route=_route_label(scope),
+                status_code=status_code,
+                duration=time.perf_counter() - start,
+                stats=stats
+            )
@@ -2,16 +2,32 @@ from .client import Client
 from .service import Service
 from .client_quote_profile import ClientQuoteProfile
 from .client_quote_profile import TempClientQuoteProfile
+from .quote_profile_line import QuoteProfileLine
+from .quote_profile_line import TempQuoteProfileLine
 from .quote import Quote
 from .invoice import Invoice
 from .setting import AppSetting
+from .data_version import DataVersion
+from .activity import MonthlyActivity, ClientActivity
+from .billing_run import BillingRun
+from .batch_send import BatchSend, BatchSendItem
+from .outbox_email import OutboxEmail
 
 __all__ = [
     "Client",
     "Service",
     "ClientQuoteProfile",
     "TempClientQuoteProfile",
+    "QuoteProfileLine",
+    "TempQuoteProfileLine",
     "Quote",
     "Invoice",
-    "AppSetting"
+    "AppSetting",
+    "DataVersion",
+    "MonthlyActivity",
+    "ClientActivity",
+    "BillingRun",
+    "BatchSend",
+    "BatchSendItem",
+    "OutboxEmail"
 ]
\ No newline at end of file
@@ -0,0 +1,19 @@
+from sqlmodel import SQLModel, Field
+
+class MonthlyActivity(SQLModel, table=True):
+    # primary key is the month the quotes and invoices were issued, "YYYY-MM"
+    month: str = Field(primary_key=True)
+    # attributes (totals are the sum of the documents' grand totals, in cents)
+    quote_count: int = 0
+    quote_total_cents: int = 0
+    invoice_count: int = 0
+    invoice_total_cents: int = 0
+
+class ClientActivity(SQLModel, table=True):
+    # primary key is a foreign key to client table (1:1 relationship)
+    client_id: int | None = Field(default=None, primary_key=True, foreign_key="client.id")
+    # attributes (totals are the sum of the documents' grand totals, in cents)
+    quote_count: int = 0
+    quote_total_cents: int = 0
+    invoice_count: int = 0
+    invoice_total_cents: int = Field(default=0, index=True)
\ No newline at end of file
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from sqlmodel import SQLModel, Field
+
+class BatchSend(SQLModel, table=True):
+    # auto-incrementing primary key
+    id: int | None = Field(default=None, primary_key=True)
+    # attributes
+    # the key the browser sends with a batch and again with each retry of it
+    idempotency_key: str = Field(unique=True)
+    # "quotes" or "invoices"
+    kind: str
+    # "running", "completed" or "failed"
+    status: str = "running"
+    created_at: datetime
+    # updated as each client is sent; a running batch whose heartbeat is too
+    # old has crashed and may be retried
+    heartbeat_at: datetime
+
+class BatchSendItem(SQLModel, table=True):
+    # primary key is the batch and the client sent to, so a client is sent
+    # at most one quote or invoice per batch
+    batch_id: int | None = Field(default=None, primary_key=True, foreign_key="batchsend.id")
+    client_id: int = Field(primary_key=True)
+    # attributes
+    # "pending", "done" or "failed"
+    status: str = "pending"
+    # the quote or invoice number, kept across retries once allocated
+    document_no: str | None = None
+    error: str | None = None
\ No newline at end of file
@@ -0,0 +1,24 @@
+from decimal import Decimal
+from datetime import date, datetime
+
+from sqlmodel import SQLModel, Field
+
+class BillingRun(SQLModel, table=True):
+    # auto-incrementing primary key
+    id: int | None = Field(default=None, primary_key=True)
+    # attributes
+    # the month billed, "YYYY-MM"; each month is billed by one run
+    period: str = Field(unique=True)
+    # "running", "completed" or "failed"
+    status: str = "running"
+    issue_date: date
+    started_at: datetime
+    # updated with every checkpoint; a running run whose heartbeat is too old
+    # has crashed and is taken over by the next run for its period
+    heartbeat_at: datetime
+    finished_at: datetime | None = None
+    # checkpoint: every active client with an id up to this one is invoiced
+    last_client_id: int = 0
+    invoice_count: int = 0
+    grand_total: Decimal = Field(default=Decimal("0.00"), max_digits=14, decimal_places=2)
+    error: str | None = None
\ No newline at end of file
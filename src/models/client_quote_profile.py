@@ -1,7 +1,6 @@
-from typing import List, Dict, Any
 from decimal import Decimal
 
-from sqlmodel import SQLModel, Field, Column, JSON
+from sqlmodel import SQLModel, Field
 
 class ClientQuoteProfile(SQLModel, table=True):
     # primary key is a foreign key to client table (1:1 relationship)
@@ -9,7 +8,6 @@ class ClientQuoteProfile(SQLModel, table=True):
     # attributes
     min_monthly_charge: Decimal
     premium_salt_upcharge: Decimal
-    services: List[Dict[str, Any]] | None = Field(default=None, sa_column=Column(JSON))
     grand_total: Decimal
 
 class TempClientQuoteProfile(SQLModel, table=True):
@@ -18,5 +16,4 @@ class TempClientQuoteProfile(SQLModel, table=True):
     # attributes
     min_monthly_charge: Decimal
     premium_salt_upcharge: Decimal
-    services: List[Dict[str, Any]] | None = Field(default=None, sa_column=Column(JSON))
     grand_total: Decimal
\ No newline at end of file
@@ -0,0 +1,7 @@
+from sqlmodel import SQLModel, Field
+
+class DataVersion(SQLModel, table=True):
+    # primary key is the name of the versioned table
+    table_name: str = Field(primary_key=True)
+    # attributes
+    version: int = 0
\ No newline at end of file
@@ -1,4 +1,5 @@
 from typing import Any
+from decimal import Decimal
 from datetime import date
 
 from sqlmodel import SQLModel, Field, Column, JSON
@@ -7,8 +8,9 @@ class Invoice(SQLModel, table=True):
     # auto-incrementing primary key
     id: int | None = Field(default=None, primary_key=True)
     # foreign key to client table (1:M relationship)
-    client_id: int = Field(foreign_key="client.id")
+    client_id: int = Field(foreign_key="client.id", index=True)
     # attributes
     invoice_no: str
     issue_date: date | None = Field(default_factory=date.today)
+    grand_total: Decimal = Field(default=Decimal("0.00"), max_digits=12, decimal_places=2)
     pdf_html: Any = Field(sa_column=Column(JSON))
\ No newline at end of file
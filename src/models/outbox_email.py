@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from sqlmodel import SQLModel, Field
+
+class OutboxEmail(SQLModel, table=True):
+    # auto-incrementing primary key
+    id: int | None = Field(default=None, primary_key=True)
+    # attributes
+    subject: str
+    # JSON list of email addresses
+    recipients: str
+    body: str
+    # "plain" or "html"
+    subtype: str = "plain"
+    # JSON list of {"file": path, "mime_type": ...}, read when the email is sent
+    attachments: str = "[]"
+    # the quote or invoice the email is sending, if any
+    document_type: str | None = None
+    document_no: str | None = None
+    # "pending", "sending", "sent" or "failed"
+    status: str = Field(default="pending", index=True)
+    attempts: int = 0
+    next_attempt_at: datetime = Field(index=True)
+    # a worker sending the email holds it until then; an email still
+    # "sending" after it was given up by a crashed worker and is sent again
+    locked_until: datetime | None = None
+    created_at: datetime
+    sent_at: datetime | None = None
+    last_error: str | None = None
\ No newline at end of file
@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field
+
+class QuoteProfileLineBase(SQLModel):
+    # position of the line in its quote profile
+    position: int = 0
+    # foreign key to service table (M:1 relationship), null if the line's
+    # service no longer exists
+    service_id: int | None = Field(default=None, foreign_key="service.id")
+    # attributes
+    service_name: str
+    quantity: Decimal = Field(max_digits=12, decimal_places=4)
+    per_unit: str
+    unit_price: Decimal = Field(max_digits=12, decimal_places=2)
+    tax: Decimal = Field(max_digits=12, decimal_places=4)
+    total_price: Decimal = Field(max_digits=12, decimal_places=2)
+
+    def to_dict(self) -> dict:
+        """
+        The line in the format the quote profile forms and PDFs use.
+        """
+        return {
+            "service_id": self.service_id,
+            "service_name": self.service_name,
+            "quantity": f"{self.quantity.normalize():f}",
+            "per_unit": self.per_unit,
+            "unit_price": str(self.unit_price),
+            "tax": f"{self.tax.normalize():f}",
+            "total_price": str(self.total_price)
+        }
+
+class QuoteProfileLine(QuoteProfileLineBase, table=True):
+    # the profiles using a service are looked up through the service index,
+    # a profile's lines through the client index
+    __table_args__ = (
+        Index("ix_quoteprofileline_service_id_client_id", "service_id", "client_id"),
+        Index("ix_quoteprofileline_client_id_position", "client_id", "position"),
+    )
+    # auto-incrementing primary key
+    id: int | None = Field(default=None, primary_key=True)
+    # foreign key to client quote profile table (M:1 relationship)
+    client_id: int | None = Field(default=None, foreign_key="clientquoteprofile.client_id", nullable=False)
+
+class TempQuoteProfileLine(QuoteProfileLineBase, table=True):
+    __table_args__ = (
+        Index("ix_tempquoteprofileline_client_id_position", "client_id", "position"),
+    )
+    # auto-incrementing primary key
+    id: int | None = Field(default=None, primary_key=True)
+    # foreign key to temp client quote profile table (M:1 relationship)
+    client_id: int | None = Field(default=None, foreign_key="tempclientquoteprofile.client_id", nullable=False)
\ No newline at end of file
@@ -0,0 +1,183 @@
+import io
+import os
+import re
+import hmac
+import secrets
+import time
+import pstats
+import cProfile
+import functools
+import inspect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+from urllib.parse import parse_qs
+
+from dotenv import load_dotenv
+from starlette.datastructures import MutableHeaders
+
+load_dotenv()
+
+# Profiling is only available when an admin token is configured
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "my_files",
+        "profiles"
+    )
+)
+
+class ProfileRequest:
+    """
+    A request that an admin asked to have profiled. `client_id` narrows the
+    profile of a batch route down to a single client's iteration.
+    """
+    def __init__(self, label: str, client_id: str | None):
+        self.label = label
+        self.client_id = client_id
+        self.profile_name: str | None = None
+
+_current_profile_request: ContextVar[ProfileRequest | None] = ContextVar(
+    "current_profile_request", default=None
+)
+
+# cProfile can only have one profiler active at a time on newer Pythons, and
+# a profile of two overlapping requests would be unreadable anyway
+_profiler_lock = threading.Lock()
+
+def is_authorized(token: str | None) -> bool:
+    """
+    Check a token against PROFILING_TOKEN in constant time. Always False when
+    profiling is not configured.
+    """
+    if not PROFILING_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+
+def _profile_path(profile_name: str) -> str:
+    return os.path.join(PROFILE_DIR, profile_name)
+
+def profile_file_path(profile_name: str) -> str | None:
+    """
+    Get the path of a stored profile, or None if the name is not a profile
+    this module wrote.
+    """
+    if not re.fullmatch(r"[\w.-]+\.prof", profile_name):
+        return None
+    path = _profile_path(profile_name)
+    return path if os.path.isfile(path) else None
+
+def render_profile_text(path: str, limit: int = 50) -> str:
+    """
+    Render a stored profile as a pstats table sorted by cumulative time.
+    """
+    output = io.StringIO()
+    stats = pstats.Stats(path, stream=output)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
+
+@contextmanager
+def _profile(profile_request: ProfileRequest, suffix: str) -> Iterator[None]:
+    if not _profiler_lock.acquire(blocking=False):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_name = (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}-"
+            f"{profile_request.label}{suffix}.prof"
+        )
+        profiler.dump_stats(_profile_path(profile_name))
+        profile_request.profile_name = profile_name
+    finally:
+        _profiler_lock.release()
+
+def profiled(func: Callable) -> Callable:
+    """
+    Decorator for route handlers that runs the handler under cProfile when the
+    request asked for a profile. The profiler runs in the thread that executes
+    the handler, so sync handlers are profiled in their threadpool worker. For
+    async handlers it also sees other requests served by the event loop while
+    the handler awaits.
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            profile_request = _current_profile_request.get()
+            # A client-scoped profile is taken by client_section instead
+            if profile_request is None or profile_request.client_id is not None:
+                return await func(*args, **kwargs)
+            with _profile(profile_request, ""):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile_request = _current_profile_request.get()
+        if profile_request is None or profile_request.client_id is not None:
+            return func(*args, **kwargs)
+        with _profile(profile_request, ""):
+            return func(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def client_section(client_id) -> Iterator[None]:
+    """
+    Profile the enclosed block if the request asked for a profile of this
+    client (e.g. one client's iteration of a batch send).
+    """
+    profile_request = _current_profile_request.get()
+    if profile_request is None or profile_request.client_id != str(client_id):
+        yield
+        return
+    with _profile(profile_request, f"-client-{client_id}"):
+        yield
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that marks a request for profiling when it carries the
+    admin token in an `X-Profile` header or `profile` query parameter. An
+    optional `X-Profile-Client` header (or `profile_client` query parameter)
+    limits the profile to one client of a batch route. The name of the stored
+    profile is returned in the `X-Profile` response header.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not PROFILING_TOKEN:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        token = headers.get("x-profile") or query.get("profile", [None])[0]
+        if not is_authorized(token):
+            await self.app(scope, receive, send)
+            return
+
+        client_id = headers.get("x-profile-client") or query.get("profile_client", [None])[0]
+        label = re.sub(r"[^\w-]+", "_", f"{scope['method']}{scope['path']}").strip("_")
+        profile_request = ProfileRequest(label, client_id)
+        reset_token = _current_profile_request.set(profile_request)
+
+        async def send_with_profile_name(message) -> None:
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                response_headers.append("X-Profile", profile_request.profile_name or "not-profiled")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_name)
+        finally:
+            _current_profile_request.reset(reset_token)
\ No newline at end of file
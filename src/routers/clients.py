@@ -1,47 +1,49 @@
+import io
 import textwrap
 from typing import Annotated
 from decimal import Decimal
 
-from fastapi import APIRouter, Depends, Form, HTTPException, Request, status
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
-from heroicons.jinja import heroicon_outline, heroicon_solid
 from sqlmodel import Session, select
 
 import utils
+import etags
+import profiling
 from database import get_session
+from templating import templates, render_fragment
 from models import (
     Client,
     Service,
     ClientQuoteProfile,
+    QuoteProfileLine,
     Quote,
     AppSetting
 )
 from services import (
     ClientCRUD,
     ClientQuoteProfileCRUD,
+    QuoteProfileLineCRUD,
     QuoteCRUD,
+    PricingServices,
     AppSettingCRUD,
     PDFServices,
-    EmailServices
+    OutboxServices,
+    ImportServices,
+    ExportServices,
+    services_catalog,
+    outbox_worker
 )
 
 # Create router for client-related endpoints
 router = APIRouter(prefix="/clients", tags=["clients"])
 
-# Create Jinja2 templates object for rendering HTML from the templates
-templates = Jinja2Templates(directory="./templates")
-templates.env.globals.update(
-    {
-        "heroicon_outline": heroicon_outline,
-        "heroicon_solid": heroicon_solid,
-    }
-)
-
 SessionDependency = Annotated[Session, Depends(get_session)]
 
 @router.get("/", response_class=HTMLResponse)
+@etags.conditional(Client, Service, AppSetting)
+@profiling.profiled
 def render_clients_page(
     request: Request,
     session: SessionDependency,
@@ -58,9 +60,9 @@ def render_clients_page(
     Returns:
     - `HTMLResponse`: The rendered HTML content of the clients page.
     """
-    # Determine number of clients to show per page based on screen height
-    per_page = utils.get_per_page("clients")
-    all_clients = session.exec(select(Client)).all()
+    # Determine number of clients to show per page based on the viewport height
+    per_page = utils.get_per_page("clients", request)
+    all_clients = session.exec(select(Client).order_by(Client.id)).all()
     total = len(all_clients)
     start = (page - 1) * per_page
     end = start + per_page
@@ -73,7 +75,7 @@ def render_clients_page(
     # JavaScript via the HTML template
     all_clients_dict = jsonable_encoder(all_clients)
     page_clients_dict = jsonable_encoder(page_clients)
-    all_services_dict = jsonable_encoder(session.exec(select(Service)).all())
+    all_services_json = services_catalog.get(session).html_json
 
     # Get color theme and page colors
     color_theme = session.get(AppSetting, "0001").setting_value
@@ -90,7 +92,7 @@ def render_clients_page(
             # json-serialized data
             "all_clients_dict": all_clients_dict,
             "page_clients_dict": page_clients_dict,
-            "all_services_dict": all_services_dict,
+            "all_services_json": all_services_json,
             # styling
             "theme": session.get(AppSetting, "0000").setting_value,
             "colorTheme": color_theme,
@@ -100,6 +102,7 @@ def render_clients_page(
 
 @router.post("/add_client")
 def add_client(
+    request: Request,
     session: SessionDependency,
     name: str = Form(...),
     business_name: str = Form(..., alias="business-name"),
@@ -109,12 +112,13 @@ def add_client(
     zip_code: str = Form(..., alias="zip-code"),
     email: str = Form(...),
     phone: str = Form(...),
-    page: int = 1
+    current_page: int = Form(1, alias="current-page")
 ) -> JSONResponse:
     """
     Creates a new client.
 
     Parameters:
+    - request: The incoming HTTP request.
     - session: A SQLModel session dependency for database access.
     - name: The name of the client.
     - business_name: The business name of the client.
@@ -124,20 +128,23 @@ def add_client(
     - zip_code: The zip code of the client.
     - email: The email address of the client.
     - phone: The phone number of the client.
-    - page: The page number to display for table pagination (default is 1).
+    - current_page: The current page of clients being viewed in the table.
 
     Returns:
     - `JSONResponse`: A JSON object containing a status message, status code, 
     redirect url, and the newly created client object data if the operation is 
-    successful.
+    successful, the page the new client is shown on, and the HTML fragments to
+    patch the table with: the new row if it is shown on the current page,
+    otherwise all rows of the page to switch to, plus the updated pagination
+    control.
 
     Raises:
     - HTTPException:
         - 422 (UNPROCESSABLE ENTITY) for form validation errors
         - 500 (INTERNAL SERVER ERROR) for unexpected errors
     """
-    # Determine number of clients shown per page based on screen height
-    per_page = utils.get_per_page("clients")
+    # Determine number of clients shown per page based on the viewport height
+    per_page = utils.get_per_page("clients", request)
 
     # Validate the new client data
     validate_status, new_client = utils.call_service_or_422(
@@ -162,34 +169,118 @@ def add_client(
     )
 
     # Count total number of clients after creation
-    total_clients = len(session.exec(select(Client)).all())
+    total_clients = utils.count_rows(Client, session)
     # Determine the new number of pages needed
-    total_pages = (total_clients + per_page - 1) // per_page
+    total_pages = utils.get_total_pages(total_clients, per_page)
+
+    # New clients are added to the end of the table, so they are always shown
+    # on the last page
+    page = max(total_pages, 1)
+
+    content = {
+        "detail": create_status,
+        "client": {
+            "id": client.id,
+            "name": client.name,
+            "business_name": client.business_name,
+            "street_address": client.street_address,
+            "city": client.city,
+            "state": client.state,
+            "zip_code": client.zip_code,
+            "email": client.email,
+            "phone": client.phone,
+        },
+        "page": page,
+        "redirect_to": f"/clients?page={page}",
+        **_render_table_fragments(session, page, total_pages, per_page, page != current_page)
+    }
+    if page == current_page:
+        content["row_html"] = _render_client_row(session, client)
+
+    return JSONResponse(content=content, status_code=200)
 
-    # If creating the new client caused a new page to be added, redirect to
-    # that new page or the current page if total_pages is an unexpected value
-    if total_pages > page:
-        page = max(total_pages, page)
+@router.post("/import")
+def import_clients(
+    session: SessionDependency,
+    file: UploadFile = File(...)
+) -> JSONResponse:
+    """
+    Imports clients from an uploaded CSV file with a header row naming the
+    client columns (e.g. `name,business_name,street_address,city,state,
+    zip_code,email,phone`). The upload is spooled to disk and parsed as a
+    stream, so files of any size are imported in constant memory. Valid rows
+    are inserted in batches, one transaction per batch; invalid rows are
+    skipped and reported.
+
+    Parameters:
+    - session: A SQLModel session dependency for database access.
+    - file: The uploaded CSV file, encoded as UTF-8.
+
+    Returns:
+    - `JSONResponse`: A JSON object containing a status message, status code,
+    the number of clients imported and rows rejected, the row number and
+    errors of each rejected row (up to a limit), and a redirect url.
+
+    Raises:
+    - HTTPException:
+        - 422 (UNPROCESSABLE ENTITY) if the file cannot be read or is missing
+        required columns
+        - 500 (INTERNAL SERVER ERROR) for unexpected errors
+    """
+    # Decode the upload as it is read instead of loading it into memory
+    csv_file = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        # Check the header row
+        _, reader = utils.call_service_or_422(ImportServices.read_client_csv, csv_file)
+
+        # Validate and insert the rows in batches
+        import_status, report = utils.call_service_or_500(
+            ImportServices.import_clients,
+            reader,
+            session
+        )
+    finally:
+        # Leave closing the file to the upload
+        csv_file.detach()
 
     return JSONResponse(
         content={
-            "detail": create_status,
-            "client": {
-                "id": client.id,
-                "name": client.name,
-                "business_name": client.business_name,
-                "street_address": client.street_address,
-                "city": client.city,
-                "state": client.state,
-                "zip_code": client.zip_code,
-                "email": client.email,
-                "phone": client.phone,
-            },
-            "redirect_to": f"/clients?page={page}",
+            "detail": import_status,
+            **report,
+            "redirect_to": "/clients?page=1",
         },
         status_code=200,
     )
 
+@router.get("/export")
+def export_clients(export_format: str = Query("csv", alias="format")) -> StreamingResponse:
+    """
+    Exports every client as a CSV or JSONL (one JSON object per line)
+    download. The rows are streamed from the database as the response is
+    sent, so the download starts at once and exports of any size run in
+    constant memory.
+
+    Parameters:
+    - export_format: "csv" (default) or "jsonl".
+
+    Returns:
+    - `StreamingResponse`: The export, sent as an attachment.
+
+    Raises:
+    - HTTPException:
+        - 422 (UNPROCESSABLE ENTITY) if the format is not supported
+    """
+    _, (rows, media_type, file_name) = utils.call_service_or_422(
+        ExportServices.export_rows,
+        "clients",
+        export_format
+    )
+    return StreamingResponse(
+        rows,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+    )
+
 @router.post("/edit_client")
 def edit_client(
     session: SessionDependency,
@@ -222,8 +313,8 @@ def edit_client(
 
     Returns:
     - `JSONResponse`: A JSON object containing a status message, status code, 
-    redirect url, and the edited client object data if the operation is 
-    successful.
+    redirect url, and the edited client object data and its re-rendered table
+    row if the operation is successful.
 
     Raises:
     - HTTPException:
@@ -275,13 +366,16 @@ def edit_client(
                 "email": updated_client.email,
                 "phone": updated_client.phone,
             },
+            "page": current_page,
             "redirect_to": f"/clients?page={current_page}",
+            "row_html": _render_client_row(session, updated_client),
         },
         status_code=200,
     )
 
 @router.post("/remove_client")
 def remove_client(
+    request: Request,
     session: SessionDependency,
     client_id: int = Form(..., alias="client-id"),
     current_page: int = Form(..., alias="current-page")
@@ -291,6 +385,7 @@ def remove_client(
     will also be removed.
 
     Parameters:
+    - request: The incoming HTTP request.
     - session: A SQLModel session dependency for database access.
     - client_id: The unique ID of the client to remove.
     - current_page: The current page of clients being viewed in the table.
@@ -298,14 +393,17 @@ def remove_client(
     Returns:
     - `JSONResponse`: A JSON object containing a status message, status code, 
     redirect url, and the removed client's unique id if the operation is 
-    successful.
+    successful, the page to show, and the HTML fragments to patch the table
+    with: the row that moved up onto the current page from the next one (if
+    any), or all rows of the previous page if the current page is now empty,
+    plus the updated pagination control.
 
     Raises:
     - HTTPException:
         - 500 (INTERNAL SERVER ERROR) for unexpected errors
     """
-    # Determine number of clients shown per page based on screen height
-    per_page = utils.get_per_page("clients")
+    # Determine number of clients shown per page based on the viewport height
+    per_page = utils.get_per_page("clients", request)
 
     # Check if the client has a client quote profile
     existing_client_quote_profile = session.get(ClientQuoteProfile, client_id)
@@ -325,26 +423,75 @@ def remove_client(
     )
 
     # Count total number of clients after deletion
-    total_clients = len(session.exec(select(Client)).all())
+    total_clients = utils.count_rows(Client, session)
     # Determine the new number of pages needed
-    total_pages = (total_clients + per_page - 1) // per_page
+    total_pages = utils.get_total_pages(total_clients, per_page)
 
     # If removing the client caused the page to be empty, redirect to the
     # previous page or the first page if total_pages is an unexpected value,
     # otherwise, stay on the current page
+    page = current_page
     if current_page > total_pages:
-        current_page = max(total_pages, 1)
+        page = max(total_pages, 1)
 
-    return JSONResponse(
-        content={
-            "detail": delete_status,
-            "client": {
-                "id": client.id,
-            },
-            "redirect_to": f"/clients?page={current_page}",
+    content = {
+        "detail": delete_status,
+        "client": {
+            "id": client.id,
         },
-        status_code=200,
-    )
+        "page": page,
+        "redirect_to": f"/clients?page={page}",
+        **_render_table_fragments(session, page, total_pages, per_page, page != current_page)
+    }
+    # If staying on the current page, the first client of the next page (if
+    # any) moves up to fill the removed client's place
+    if page == current_page:
+        next_clients = session.exec(
+            select(Client).order_by(Client.id).offset(page * per_page - 1).limit(1)
+        ).all()
+        if next_clients:
+            content["refill_client"] = jsonable_encoder(next_clients[0])
+            content["refill_row_html"] = _render_client_row(session, next_clients[0])
+
+    return JSONResponse(content=content, status_code=200)
+
+def _render_client_row(session: Session, client: Client) -> str:
+    """
+    Render a client's row in the all clients table.
+    """
+    colors = utils.get_colors(session.get(AppSetting, "0001").setting_value)
+    return render_fragment("partials/client_row.html", client=client, **colors)
+
+def _render_table_fragments(
+    session: Session,
+    page: int,
+    total_pages: int,
+    per_page: int,
+    include_rows: bool
+) -> dict:
+    """
+    Render the pagination control for the clients table and, if the page
+    shown changes, the rows of the new page along with their JSON data.
+    """
+    color_theme = session.get(AppSetting, "0001").setting_value
+    fragments = {
+        "pagination_html": render_fragment(
+            "partials/pagination.html",
+            pagination_base_url="/clients",
+            page=page,
+            total_pages=total_pages,
+            colorTheme=color_theme
+        )
+    }
+    if include_rows:
+        page_clients = utils.get_page_rows(Client, page, per_page, session)
+        colors = utils.get_colors(color_theme)
+        fragments["rows_html"] = "".join(
+            render_fragment("partials/client_row.html", client=client, **colors)
+            for client in page_clients
+        )
+        fragments["page_clients"] = jsonable_encoder(page_clients)
+    return fragments
 
 @router.post("/save_client_quote_profile")
 async def save_client_quote_profile(
@@ -379,26 +526,28 @@ async def save_client_quote_profile(
     """
     # Extract the list of services from the form
     form = await request.form()
-    services = []
-    grand_total = 0
-
-    service_names = form.getlist("service")
-    quantities = form.getlist("quantity")
-    per_units = form.getlist("per-unit")
-    unit_prices = form.getlist("unit-price")
-    taxes = form.getlist("tax")
-    total_prices = form.getlist("total-price")
-
-    for i in range(len(service_names)):
-        services.append({
-            "service_name": service_names[i],
-            "quantity": quantities[i],
-            "per_unit": per_units[i],
-            "unit_price": unit_prices[i],
-            "tax": taxes[i],
-            "total_price": total_prices[i]
-        })
-        grand_total += Decimal(form.getlist("total-price")[i]) 
+    services = [
+        {
+            "service_name": service_name,
+            "quantity": quantity,
+            "per_unit": per_unit,
+            "unit_price": unit_price,
+            "tax": tax
+        }
+        for service_name, quantity, per_unit, unit_price, tax in zip(
+            form.getlist("service"),
+            form.getlist("quantity"),
+            form.getlist("per-unit"),
+            form.getlist("unit-price"),
+            form.getlist("tax")
+        )
+    ]
+
+    # Price the services and total them, the totals computed by the browser
+    # are not used
+    _, price = utils.call_service_or_422(PricingServices.price_profile, services)
+    services = price.priced_lines(services)
+    grand_total = price.grand_total
 
     # Validate the new client quote profile data
     validate_status, new_client_quote_profile = utils.call_service_or_422(
@@ -407,10 +556,15 @@ async def save_client_quote_profile(
             client_id=client_id,
             min_monthly_charge=Decimal(min_monthly_charge),
             premium_salt_upcharge=Decimal(premium_salt_upcharge),
-            services=services,
             grand_total=Decimal(grand_total)
         )
     )
+    # Validate the new client quote profile's lines
+    validate_status, new_lines = utils.call_service_or_422(
+        QuoteProfileLineCRUD.validate_lines,
+        QuoteProfileLine,
+        services
+    )
 
     # Check if client quote profile already exists
     existing_client_quote_profile = session.get(ClientQuoteProfile, client_id)
@@ -422,6 +576,7 @@ async def save_client_quote_profile(
             ClientQuoteProfileCRUD.update,
             existing_client_quote_profile,
             new_client_quote_profile,
+            new_lines,
             session
         )
     else:
@@ -429,9 +584,18 @@ async def save_client_quote_profile(
         status, client_quote_profile = utils.call_service_or_500(
             ClientQuoteProfileCRUD.create,
             new_client_quote_profile,
+            new_lines,
             session
         )
 
+    # Get the saved lines, linked to their services
+    _, lines = utils.call_service_or_500(
+        QuoteProfileLineCRUD.get_lines,
+        QuoteProfileLine,
+        client_quote_profile.client_id,
+        session
+    )
+
     return JSONResponse(
         content={
             "detail": status,
@@ -444,7 +608,7 @@ async def save_client_quote_profile(
                 "premium_salt_upcharge": str(
                     client_quote_profile.premium_salt_upcharge
                 ),
-                "services": client_quote_profile.services,
+                "services": [line.to_dict() for line in lines],
                 "grand_total": str(client_quote_profile.grand_total)
             },
             "redirect_to": f"/clients?page={current_page}",
@@ -462,7 +626,8 @@ async def send_quote(
     current_page: int = Form(..., alias="current-page")
 ) -> JSONResponse:
     """
-    Send a quote as a PDF to the client via email.
+    Send a quote as a PDF to the client via email. The quote is saved
+    together with its email in the outbox, which the outbox worker sends.
 
     Parameters:
     - request: The incoming HTTP request.
@@ -479,30 +644,33 @@ async def send_quote(
 
     Raises:
     - HTTPException:
+        - 422 (UNPROCESSABLE ENTITY) if a service's numbers cannot be priced
         - 500 (INTERNAL SERVER ERROR) for unexpected errors
     """
     # Extract the list of services from the form
     form = await request.form()
-    services = []
-    grand_total = 0
-
-    service_names = form.getlist("service")
-    quantities = form.getlist("quantity")
-    per_units = form.getlist("per-unit")
-    unit_prices = form.getlist("unit-price")
-    taxes = form.getlist("tax")
-    total_prices = form.getlist("total-price")
-
-    for i in range(len(service_names)):
-        services.append({
-            "service_name": service_names[i],
-            "quantity": quantities[i],
-            "per_unit": per_units[i] if per_units[i] != "-1" else "--",
-            "unit_price": unit_prices[i],
-            "tax": taxes[i],
-            "total_price": total_prices[i]
-        })
-        grand_total += Decimal(form.getlist("total-price")[i]) 
+    services = [
+        {
+            "service_name": service_name,
+            "quantity": quantity,
+            "per_unit": per_unit if per_unit != "-1" else "--",
+            "unit_price": unit_price,
+            "tax": tax
+        }
+        for service_name, quantity, per_unit, unit_price, tax in zip(
+            form.getlist("service"),
+            form.getlist("quantity"),
+            form.getlist("per-unit"),
+            form.getlist("unit-price"),
+            form.getlist("tax")
+        )
+    ]
+
+    # Price the services and total them, the totals computed by the browser
+    # are not used
+    _, price = utils.call_service_or_422(PricingServices.price_profile, services)
+    services = price.priced_lines(services)
+    grand_total = price.grand_total
 
     # Get the client from the database
     client = session.get(Client, client_id)
@@ -567,9 +735,22 @@ async def send_quote(
     # User's Business Email
     # User's Business Phone No.
 
-    # Send the email
-    status, _ = await utils.call_async_service_or_500(
-        EmailServices.send_email,
+    # Validate the new quote data
+    status, new_quote = utils.call_service_or_422(
+        QuoteCRUD.validate_data,
+        Quote(
+            client_id=client_id,
+            quote_no=quote_no,
+            grand_total=grand_total,
+            pdf_html=html_source,
+        )
+    )
+
+    # Queue the email in the outbox, it is saved with the quote and sent by
+    # the outbox worker
+    utils.call_service_or_500(
+        OutboxServices.enqueue,
+        session,
         subject="M&M Quote Request",
         recipients=[client.email],
         body=quote_email_body,
@@ -582,17 +763,9 @@ async def send_quote(
                 ),
                 "mime_type": "application/pdf",
             }
-        ]
-    )
-
-    # Validate the new quote data
-    status, new_quote = utils.call_service_or_422(
-        QuoteCRUD.validate_data,
-        Quote(
-            client_id=client_id,
-            quote_no=quote_no,
-            pdf_html=html_source,
-        )
+        ],
+        document_type="quote",
+        document_no=quote_no
     )
     
     # Create the new quote in the database
@@ -601,6 +774,7 @@ async def send_quote(
         new_quote,
         session
     )
+    outbox_worker.wake()
 
     return JSONResponse(
         content={
@@ -614,7 +788,10 @@ async def send_quote(
     )
 
 @router.get("/get_client_quote_profile/{client_id}")
+@etags.conditional(ClientQuoteProfile)
+@profiling.profiled
 async def get_client_quote_profile(
+    request: Request,
     session: SessionDependency,
     client_id: int
 ) -> JSONResponse:
@@ -622,6 +799,7 @@ async def get_client_quote_profile(
     Fetches a client's client quote profile from the database.
 
     Parameters:
+    - request: The incoming HTTP request.
     - session: A SQLModel session dependency for database access.
     - client_id: The unique ID of the client.
 
@@ -634,12 +812,18 @@ async def get_client_quote_profile(
         - 404 (NOT FOUND) if the client quote profile does not exist in the 
         database
     """
-    # Get the client quote profile from the database
+    # Get the client quote profile and its lines from the database
     get_status, quote_profile = utils.call_service_or_404(
         ClientQuoteProfileCRUD.get,
         client_id,
         session
     )
+    _, lines = utils.call_service_or_500(
+        QuoteProfileLineCRUD.get_lines,
+        QuoteProfileLine,
+        client_id,
+        session
+    )
 
     return JSONResponse(
         content={
@@ -648,7 +832,7 @@ async def get_client_quote_profile(
                 "client_id": quote_profile.client_id,
                 "min_monthly_charge": str(quote_profile.min_monthly_charge),
                 "premium_salt_upcharge": str(quote_profile.premium_salt_upcharge),
-                "services": quote_profile.services,
+                "services": [line.to_dict() for line in lines],
                 "grand_total": str(quote_profile.grand_total)
             },
         },
@@ -1,38 +1,52 @@
+import uuid
+import logging
+import textwrap
+from pathlib import Path
 from typing import Annotated
+from decimal import Decimal
+from datetime import date
 
-from fastapi import APIRouter, Depends, Form, HTTPException, Request, status, Query
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, BackgroundTasks, Depends, Form, HTTPException, Request, status, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
-from heroicons.jinja import heroicon_outline, heroicon_solid
 from sqlmodel import Session, select
 
 import utils
+import etags
+import profiling
+import tracing
 from database import get_session
-from models import Client, Invoice, AppSetting
+from templating import templates
+from models import Client, ClientQuoteProfile, Invoice, AppSetting
+from services import (
+    ClientCRUD,
+    InvoiceCRUD,
+    AppSettingCRUD,
+    PricingServices,
+    PDFServices,
+    ExportServices,
+    ArchiveServices,
+    BillingServices,
+    BatchSendServices,
+    OutboxServices,
+    outbox_worker
+)
 
 # Create router for invoice-related endpoints
 router = APIRouter(prefix="/invoices", tags=["invoices"])
 
-# Create Jinja2 templates object for rendering HTML from the templates
-templates = Jinja2Templates(directory="./templates")
-templates.env.globals.update(
-    {
-        "heroicon_outline": heroicon_outline,
-        "heroicon_solid": heroicon_solid,
-    }
-)
-
 SessionDependency = Annotated[Session, Depends(get_session)]
 
 @router.get("/", response_class=HTMLResponse)
+@etags.conditional(Invoice, AppSetting)
+@profiling.profiled
 def render_invoices_page(
     request: Request,
     session: SessionDependency,
     page: int = 1
 ) -> HTMLResponse:
-    # Determine the number of invocies to show per page based on screen height
-    per_page = utils.get_per_page("invoices")
+    # Determine the number of invocies to show per page based on the viewport height
+    per_page = utils.get_per_page("invoices", request)
 
     # Slice the list of all invocies based on the number of invocies per page
     all_invoices = session.exec(select(Invoice)).all()
@@ -62,6 +76,72 @@ def render_invoices_page(
         }
     )
 
+@router.get("/export")
+def export_invoices(export_format: str = Query("csv", alias="format")) -> StreamingResponse:
+    """
+    Exports every invoice, with the columns of its client, as a CSV or JSONL
+    (one JSON object per line) download. The rows are streamed from the
+    database as the response is sent, so the download starts at once and
+    exports of any size run in constant memory.
+
+    Parameters:
+    - export_format: "csv" (default) or "jsonl".
+
+    Returns:
+    - `StreamingResponse`: The export, sent as an attachment.
+
+    Raises:
+    - HTTPException:
+        - 422 (UNPROCESSABLE ENTITY) if the format is not supported
+    """
+    _, (rows, media_type, file_name) = utils.call_service_or_422(
+        ExportServices.export_rows,
+        "invoices",
+        export_format
+    )
+    return StreamingResponse(
+        rows,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+    )
+
+@router.get("/archive")
+def archive_invoices(
+    client_id: int | None = Query(None),
+    start_date: date | None = Query(None),
+    end_date: date | None = Query(None)
+) -> StreamingResponse:
+    """
+    Downloads a ZIP archive of the saved invoice PDFs, optionally only those of
+    one client or issued between two dates (inclusive). PDFs missing from the
+    invoice PDF directory are regenerated from the invoices' stored HTML. The
+    archive is built as it is sent, so it is never held in memory or on disk.
+
+    Parameters:
+    - client_id: The unique ID of the client to archive the invoices of, if any.
+    - start_date: The first issue date to include (YYYY-MM-DD), if any.
+    - end_date: The last issue date to include (YYYY-MM-DD), if any.
+
+    Returns:
+    - `StreamingResponse`: The ZIP archive, sent as an attachment.
+
+    Raises:
+    - HTTPException:
+        - 422 (UNPROCESSABLE ENTITY) if the start date is after the end date
+    """
+    _, (archive, file_name) = utils.call_service_or_422(
+        ArchiveServices.archive_pdfs,
+        "invoices",
+        client_id=client_id,
+        start_date=start_date,
+        end_date=end_date
+    )
+    return StreamingResponse(
+        archive,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+    )
+
 @router.get("/download_invoice")
 def download_invoice(
     session: SessionDependency,
@@ -106,12 +186,20 @@ def download_invoice(
     return RedirectResponse(url="/quotes_and_invoices/", status_code=303)
 
 @router.post("/send_invoices")
+@profiling.profiled
 async def send_invoices(
     request: Request,
     session: SessionDependency
 ):
     """
-    Send invoices as a PDFs to a list of clients via their email.
+    Send invoices as a PDFs to a list of clients via their email. Each
+    invoice is saved together with its email in the outbox, which the outbox
+    worker sends, so the request does not wait on the mail server. Progress
+    is kept per client in a batch ledger under the request's idempotency key
+    (the Idempotency-Key header or the idempotency-key form field, or a new
+    key), so if some clients fail, retrying with the same key only sends to
+    those: clients already sent to are skipped and their invoice numbers are
+    kept.
 
     Parameters:
     - request: Request - The incoming HTTP request.
@@ -119,102 +207,263 @@ async def send_invoices(
 
     Returns:
     - RedirectResponse: If successful, a redirect response to the clients page with HTTP status code 303 (SEE OTHER).
+    - JSONResponse: If any client failed, the batch's idempotency key, the
+    number of invoices sent, and the clients that failed and why, with HTTP
+    status code 500 (INTERNAL SERVER ERROR).
 
     Raises:
     - HTTPException:
+        - 409 (CONFLICT) if the batch is already being sent, or the key was
+        used for a batch of quotes
+        - 422 (UNPROCESSABLE ENTITY) if a service's numbers cannot be priced
         - 500 (INTERNAL SERVER ERROR) for unexpected errors
     """
     # Extract the list of client ids from the form
     form = await request.form()
-    client_ids = form.get("client-ids").split(";")
+    client_ids = [int(client_id) for client_id in form.get("client-ids").split(";")]
+    idempotency_key = (
+        request.headers.get("Idempotency-Key")
+        or form.get("idempotency-key")
+        or uuid.uuid4().hex
+    )
+
+    # Extract the list of services for each client from the form
+    services_by_client_id = {}
     for client_id in client_ids:
         services_count = int(form.get(f"services-count_client-{client_id}"))
-        services = []
-        grand_total = 0
-
-        # Extract the list of services for each client from the form
-        for i in range(services_count):
-            services.append({
+        services_by_client_id[client_id] = [
+            {
                 "service_id": form.get(f"service-{i}_client-{client_id}"),
                 "service_name": form.get(f"service-name-{i}_client-{client_id}"),
                 "quantity": form.get(f"quantity-{i}_client-{client_id}"),
                 "per_unit": form.get(f"per-unit-{i}_client-{client_id}"),
                 "unit_price": form.get(f"unit-price-{i}_client-{client_id}"),
-                "total_price": form.get(f"total-price-{i}_client-{client_id}")
-            })
-            grand_total += Decimal(form.get(f"total-price-{i}_client-{client_id}"))
-
-        # Get the client from the database
-        client = session.get(Client, client_id)
-
-        # Get the number of invoices existing for the client & generate an invoice
-        # number for the invoice based on that value and the client's unique id
-        num_invoices = utils.call_service_or_500(
-            InvoiceCRUD.count_by_client_id,
-            client_id,
-            session
-        )
-        invoice_no = f"{client_id}-{str(num_invoices + 1).zfill(4)}"
+                "tax": form.get(f"tax-{i}_client-{client_id}", "0")
+            }
+            for i in range(services_count)
+        ]
 
-        # Get the path to save invoice PDFs to from app settings
-        pdf_save_path = utils.call_service_or_404(
-            AppSettingCRUD.get_by_setting_name,
-            "invoice-save-pdfs-to-path",
-            session
-        )
+    # Get the clients' minimum monthly charges from their quote profiles, then
+    # price every client's services in one pass. A client whose services do
+    # not reach their minimum monthly charge is billed the minimum.
+    min_monthly_charges = dict(session.exec(
+        select(ClientQuoteProfile.client_id, ClientQuoteProfile.min_monthly_charge)
+        .where(ClientQuoteProfile.client_id.in_(client_ids))
+    ).all())
+    _, prices = utils.call_service_or_422(
+        PricingServices.price_profiles,
+        [
+            (services_by_client_id[client_id], min_monthly_charges.get(client_id))
+            for client_id in client_ids
+        ]
+    )
 
-        # Generate HTML source for the invoice pdf
-        html_source = utils.call_service_or_500(
-            PDFServices.generate_html_source,
-            file_type="invoice",
-            client=client,
-            invoice_no=invoice_no,
-            quote_no=None,
-            services=services,
-            grand_total=grand_total
-        )
-        
-        # Save the PDF
-        pdf_status = utils.call_service_or_500(
-            PDFServices.save_pdf,
-            file_type="invoice",
-            client=client,
-            invoice_no=invoice_no,
-            quote_no=None,
-            html_source=html_source,
-            pdf_save_path=pdf_save_path,
-        )
+    # Start the batch, or resume it if this is a retry
+    _, (batch, items) = utils.call_service_or_409(
+        BatchSendServices.start,
+        "invoices",
+        idempotency_key,
+        client_ids,
+        session
+    )
 
-        # Send the email
-        email_status = await utils.call_async_service_or_500(
-            EmailServices.send_email,
-            subject=f"M&M Invoice {invoice_no}",
-            recipients=[client.email],
-            body=textwrap.dedent(f"""\
-                Dear {client.name},
-
-                (some text about the invoice)
-            """),
-            subtype="plain",
-            attachments=[
-                {
-                    "file": f'{pdf_save_path}/m&m-invoice_{client.name.replace(" ", "_")}_{invoice_no}.pdf',
-                    "mime_type": "application/pdf",
-                }
-            ]
-        )
+    for client_id, price in zip(client_ids, prices):
+        # Skip the clients an earlier try of the batch already sent to
+        item = items[client_id]
+        if item.status == "done":
+            continue
+
+        # Trace each client separately so a slow client stands out, and
+        # profile only the client an admin asked for (X-Profile-Client)
+        with tracing.span("send_invoices.client", **{"client.id": client_id}), \
+                profiling.client_section(client_id):
+            try:
+                services = price.invoice_lines(services_by_client_id[client_id])
+                grand_total = price.grand_total
+
+                # Get the client from the database
+                client = session.get(Client, client_id)
+
+                # Get the client's invoice number for this batch, allocated
+                # from the number of invoices existing for the client and
+                # their unique id the first time the batch reaches them
+                _, invoice_no = utils.call_service_or_500(
+                    BatchSendServices.allocate,
+                    "invoices",
+                    item,
+                    session
+                )
+
+                # Get the path to save invoice PDFs to from app settings
+                _, app_setting = utils.call_service_or_404(
+                    AppSettingCRUD.get_by_setting_name,
+                    "invoice-save-pdfs-to-path",
+                    session
+                )
+                pdf_save_path = app_setting.setting_value
+
+                # Generate HTML source for the invoice pdf
+                _, html_source = utils.call_service_or_500(
+                    PDFServices.generate_html_source,
+                    file_type="invoice",
+                    client=client,
+                    invoice_no=invoice_no,
+                    quote_no=None,
+                    min_monthly_charge=Decimal("0.00"),
+                    premium_salt_upcharge=Decimal("0.00"),
+                    services=services,
+                    grand_total=grand_total
+                )
+
+                # Save the PDF
+                _ = utils.call_service_or_500(
+                    PDFServices.save_pdf,
+                    file_type="invoice",
+                    client=client,
+                    invoice_no=invoice_no,
+                    quote_no=None,
+                    html_source=html_source,
+                    pdf_save_path=pdf_save_path,
+                )
+
+                # Validate the new invoice data
+                _, new_invoice = utils.call_service_or_422(
+                    InvoiceCRUD.validate_data,
+                    Invoice(
+                        client_id=client_id,
+                        invoice_no=invoice_no,
+                        grand_total=grand_total,
+                        pdf_html=html_source
+                    )
+                )
+
+                # Create the new invoice in the database, in the same
+                # transaction as queueing its email in the outbox and marking
+                # the client done in the ledger
+                utils.call_service_or_500(
+                    OutboxServices.enqueue,
+                    session,
+                    subject=f"M&M Invoice {invoice_no}",
+                    recipients=[client.email],
+                    body=textwrap.dedent(f"""\
+                        Dear {client.name},
 
-        # Validate the new invoice data
-        new_invoice = utils.call_service_or_422(
-            InvoiceCRUD.validate_data,
-            Invoice(
-                client_id=client_id,
-                invoice_no=invoice_no,
-                pdf_html=html_source
-            )
+                        (some text about the invoice)
+                    """),
+                    subtype="plain",
+                    attachments=[
+                        {
+                            "file": f'{pdf_save_path}/m&m-invoice_{client.name.replace(" ", "_")}_{invoice_no}.pdf',
+                            "mime_type": "application/pdf",
+                        }
+                    ],
+                    document_type="invoice",
+                    document_no=invoice_no
+                )
+                utils.call_service_or_500(
+                    BatchSendServices.mark,
+                    item,
+                    "done",
+                    session,
+                    commit=False
+                )
+                _, invoice = utils.call_service_or_500(InvoiceCRUD.create, new_invoice, session)
+            except Exception as e:
+                # Record the failure and carry on with the next client, a
+                # retry of the batch only redoes the failed clients
+                session.rollback()
+                utils.call_service_or_500(
+                    BatchSendServices.mark,
+                    item,
+                    "failed",
+                    session,
+                    error=e.detail if isinstance(e, HTTPException) else str(e)
+                )
+
+    # Mark the batch completed, or failed if any client failed, and have the
+    # outbox worker send the queued emails
+    _, report = utils.call_service_or_500(
+        BatchSendServices.finish,
+        batch,
+        client_ids,
+        session
+    )
+    outbox_worker.wake()
+
+    if report["failed"]:
+        return JSONResponse(
+            content={
+                "detail": (
+                    f"Sent {report['sent']} of {len(client_ids)} invoices, "
+                    f"{len(report['failed'])} failed. Retry to send only the failed invoices."
+                ),
+                **report
+            },
+            status_code=500,
         )
+    return RedirectResponse(url="/quotes_and_invoices/", status_code=303)
+
+@router.post("/billing_run")
+def start_billing_run(
+    background_tasks: BackgroundTasks,
+    period: str | None = Form(None),
+    dry_run: bool = Form(False, alias="dry-run")
+) -> JSONResponse:
+    """
+    Invoices every client with a quote profile for a month, from their quote
+    profile and minimum monthly charge, like the scheduled billing run. The
+    run continues in the background after the response is sent; its
+    progress is shown by `GET /invoices/billing_runs`. A dry run prices the
+    invoices and reports them without creating anything.
+
+    Parameters:
+    - background_tasks: Tasks to run after the response is sent.
+    - period: The month to bill, "YYYY-MM" (default is the current month).
+    - dry_run: Whether to only report the invoices the run would create.
+
+    Returns:
+    - `JSONResponse`: A JSON object containing a status message, status code,
+    the month billed, and for a dry run the number, total and list of the
+    invoices the run would create.
+
+    Raises:
+    - HTTPException:
+        - 422 (UNPROCESSABLE ENTITY) if the month is not a "YYYY-MM" month
+        - 500 (INTERNAL SERVER ERROR) for unexpected errors
+    """
+    _, period = utils.call_service_or_422(BillingServices.parse_period, period)
+
+    if dry_run:
+        preview_status, preview = utils.call_service_or_500(BillingServices.preview, period)
+        return JSONResponse(content={"detail": preview_status, **preview}, status_code=200)
+
+    # Bill the clients after the response is sent
+    background_tasks.add_task(run_billing, period)
+
+    return JSONResponse(
+        content={"detail": f"Billing run for {period} started.", "period": period},
+        status_code=200
+    )
 
-        # Create the new invoice in the database
-        create_status = utils.call_service_or_500(InvoiceCRUD.create, new_invoice, session)
+@router.get("/billing_runs")
+def get_billing_runs(session: SessionDependency) -> JSONResponse:
+    """
+    Returns the most recent billing runs with their status, checkpoint (the
+    last client invoiced), invoice count and total.
 
-    return RedirectResponse(url="/quotes_and_invoices/", status_code=303)
\ No newline at end of file
+    Parameters:
+    - session: A SQLModel session dependency for database access.
+
+    Returns:
+    - `JSONResponse`: The billing runs, newest month first.
+    """
+    _, runs = utils.call_service_or_500(BillingServices.get_runs, session)
+    return JSONResponse(content={"billing_runs": runs}, status_code=200)
+
+def run_billing(period: str) -> None:
+    """
+    Background task that runs a month's billing.
+    """
+    success, message, _ = BillingServices.run(period)
+    if not success:
+        logging.getLogger(__name__).warning("Billing run for %s failed: %s", period, message)
\ No newline at end of file
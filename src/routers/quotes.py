@@ -1,45 +1,52 @@
+import os
+import uuid
 from typing import Annotated
+from datetime import date
 
 from fastapi import APIRouter, Depends, Form, HTTPException, Request, status, Query
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, FileResponse
 from fastapi.encoders import jsonable_encoder
-from heroicons.jinja import heroicon_outline, heroicon_solid
 from sqlmodel import Session, select
 
 import utils
+import profiling
+import tracing
 from database import get_session
+from templating import templates
 from models import (
     Client,
     Service,
     Quote,
     ClientQuoteProfile,
     TempClientQuoteProfile,
+    QuoteProfileLine,
+    TempQuoteProfileLine,
     AppSetting
 )
 from services import (
     TempClientQuoteProfileCRUD,
+    QuoteProfileLineCRUD,
     QuoteCRUD,
+    PricingServices,
     AppSettingCRUD,
     PDFServices,
-    EmailServices
+    EmailServices,
+    ExportServices,
+    ArchiveServices,
+    PreviewServices,
+    BatchSendServices,
+    OutboxServices,
+    services_catalog,
+    outbox_worker
 )
 
 # Create router for quote-related endpoints
 router = APIRouter(prefix="/quotes", tags=["quotes"])
 
-# Create Jinja2 templates object for rendering HTML from the templates
-templates = Jinja2Templates(directory="./templates")
-templates.env.globals.update(
-    {
-        "heroicon_outline": heroicon_outline,
-        "heroicon_solid": heroicon_solid,
-    }
-)
-
 SessionDependency = Annotated[Session, Depends(get_session)]
 
 @router.get("/", response_class=HTMLResponse)
+@profiling.profiled
 def render_quotes_page(
     request: Request,
     session: SessionDependency,
@@ -56,8 +63,8 @@ def render_quotes_page(
     Returns:
     - `HTMLResponse`: The rendered HTML content of the clients page.
     """
-    # Determine the number of quotes to show per page based on screen height
-    per_page = utils.get_per_page("quotes")
+    # Determine the number of quotes to show per page based on the viewport height
+    per_page = utils.get_per_page("quotes", request)
 
     # Slice the list of all quotes based on the number of quotes per page
     all_quotes = session.exec(select(Quote)).all()
@@ -71,16 +78,22 @@ def render_quotes_page(
     # Convert quotes lists to JSON serializable format for use in javascript
     all_quotes_dict = jsonable_encoder(all_quotes)
     page_quotes_dict = jsonable_encoder(page_quotes)
-    # Convert services list to JSON serializable format for use in javascript
-    all_services_dict = jsonable_encoder(session.exec(select(Service)).all())
+    # Get the cached services list, already serialized for use in javascript
+    all_services_json = services_catalog.get(session).html_json
 
     # Write the clients' quote profiles to the temporary quote profiles table
     all_clients = session.exec(select(Client)).all()
     for client in all_clients:
         client_id = client.id
 
-        # Get quote profile and temp quote profile for the client
+        # Get quote profile, its lines and temp quote profile for the client
         quote_profile = session.get(ClientQuoteProfile, client_id)
+        _, quote_profile_lines = utils.call_service_or_500(
+            QuoteProfileLineCRUD.get_lines,
+            QuoteProfileLine,
+            client_id,
+            session
+        )
         temp_quote_profile = session.get(TempClientQuoteProfile, client_id)
 
         # If there is no temp quote profile, create one from the quote profile
@@ -89,13 +102,13 @@ def render_quotes_page(
                     client_id=quote_profile.client_id,
                     min_monthly_charge=quote_profile.min_monthly_charge,
                     premium_salt_upcharge=quote_profile.premium_salt_upcharge,
-                    services=quote_profile.services,
                     grand_total=quote_profile.grand_total
                 )
 
             _, temp_quote_profile = utils.call_service_or_500(
                 TempClientQuoteProfileCRUD.create,
                 temp_quote_profile,
+                quote_profile_lines,
                 session
             )
         # Otherwise, update the temp quote profile in case the quote profile
@@ -109,7 +122,6 @@ def render_quotes_page(
                     client_id=quote_profile.client_id,
                     min_monthly_charge=quote_profile.min_monthly_charge,
                     premium_salt_upcharge=quote_profile.premium_salt_upcharge,
-                    services=quote_profile.services,
                     grand_total=quote_profile.grand_total
                 )
             )
@@ -118,6 +130,7 @@ def render_quotes_page(
                 TempClientQuoteProfileCRUD.update,
                 existing_temp_quote_profile,
                 new_temp_quote_profile,
+                quote_profile_lines,
                 session
             )
 
@@ -133,7 +146,7 @@ def render_quotes_page(
             "page_quotes": page_quotes,
             "page_quotes_dict": page_quotes_dict,
             "clients": all_clients,
-            "all_services_dict": all_services_dict,
+            "all_services_json": all_services_json,
             "page": page,
             "per_page": per_page,
             "total_pages": total_pages,
@@ -152,12 +165,18 @@ async def get_temp_client_quote_profile(
     data = await request.json()
     client_id = data.get("client_id")
     
-    # Get the temp client quote profile from the database
+    # Get the temp client quote profile and its lines from the database
     get_status, temp_quote_profile = utils.call_service_or_404(
         TempClientQuoteProfileCRUD.get,
         client_id,
         session
     )
+    _, lines = utils.call_service_or_500(
+        QuoteProfileLineCRUD.get_lines,
+        TempQuoteProfileLine,
+        client_id,
+        session
+    )
 
     return JSONResponse(
         content={
@@ -166,7 +185,7 @@ async def get_temp_client_quote_profile(
                 "client_id": temp_quote_profile.client_id,
                 "min_monthly_charge": str(temp_quote_profile.min_monthly_charge),
                 "premium_salt_upcharge": str(temp_quote_profile.premium_salt_upcharge),
-                "services": temp_quote_profile.services,
+                "services": [line.to_dict() for line in lines],
                 "grand_total": str(temp_quote_profile.grand_total)
             },
         },
@@ -183,8 +202,13 @@ async def save_temp_client_quote_profile(
     client_id = data.get("client_id")
     min_monthly_charge = data.get("min_monthly_charge")
     premium_salt_upcharge = data.get("premium_salt_upcharge")
-    services = data.get("services")
-    grand_total = data.get("grand_total")
+    services = data.get("services") or []
+
+    # Price the services and total them, the totals computed by the browser
+    # are not used
+    _, price = utils.call_service_or_422(PricingServices.price_profile, services)
+    services = price.priced_lines(services)
+    grand_total = price.grand_total
 
     # Validate the new client quote profile data
     _, new_temp_client_quote_profile = utils.call_service_or_422(
@@ -193,10 +217,15 @@ async def save_temp_client_quote_profile(
             client_id=client_id,
             min_monthly_charge=min_monthly_charge,
             premium_salt_upcharge=premium_salt_upcharge,
-            services=services,
             grand_total=grand_total
         )
     )
+    # Validate the new temp client quote profile's lines
+    _, new_lines = utils.call_service_or_422(
+        QuoteProfileLineCRUD.validate_lines,
+        TempQuoteProfileLine,
+        services
+    )
 
     # Check if client quote profile already exists
     existing_temp_client_quote_profile = session.get(
@@ -211,6 +240,7 @@ async def save_temp_client_quote_profile(
             TempClientQuoteProfileCRUD.update,
             existing_temp_client_quote_profile,
             new_temp_client_quote_profile,
+            new_lines,
             session
         )
     else:
@@ -218,9 +248,18 @@ async def save_temp_client_quote_profile(
         status, temp_client_quote_profile = utils.call_service_or_500(
             TempClientQuoteProfileCRUD.create,
             new_temp_client_quote_profile,
+            new_lines,
             session
         )
 
+    # Get the saved lines, linked to their services
+    _, lines = utils.call_service_or_500(
+        QuoteProfileLineCRUD.get_lines,
+        TempQuoteProfileLine,
+        temp_client_quote_profile.client_id,
+        session
+    )
+
     return JSONResponse(
         content={
             "detail": status,
@@ -233,7 +272,7 @@ async def save_temp_client_quote_profile(
                 "premium_salt_upcharge": str(
                     temp_client_quote_profile.premium_salt_upcharge
                 ),
-                "services": temp_client_quote_profile.services,
+                "services": [line.to_dict() for line in lines],
                 "grand_total": str(temp_client_quote_profile.grand_total)
             },
         },
@@ -241,121 +280,401 @@ async def save_temp_client_quote_profile(
     )
 
 @router.post("/batch_send_quotes")
+@profiling.profiled
 async def send_quotes(
     request: Request,
     session: SessionDependency
 ):
+    """
+    Send quotes as PDFs to a list of clients via their email, from their temp
+    quote profiles. Each quote is saved together with its email in the
+    outbox, which the outbox worker sends, so the request does not wait on
+    the mail server. Progress is kept per client in a batch ledger under the
+    request's idempotency key (the Idempotency-Key header, or a new key), so
+    if some clients fail, retrying with the same key only sends to those:
+    clients already sent to are skipped and their quote numbers are kept.
+
+    Parameters:
+    - request: Request - The incoming HTTP request, with a JSON body holding
+    the `client_ids` to send to.
+    - session: SessionDependency - A SQLModel session dependency for database access.
+
+    Returns:
+    - JSONResponse: A status message, the page to redirect to, the batch's
+    idempotency key and the number of quotes sent, or with status code 500
+    the clients that failed and why.
+
+    Raises:
+    - HTTPException:
+        - 409 (CONFLICT) if the batch is already being sent, or the key was
+        used for a batch of invoices
+        - 500 (INTERNAL SERVER ERROR) for unexpected errors
+    """
     # Extract the data from the request body
     data = await request.json()
-    client_ids = data.get("client_ids")
+    client_ids = [int(client_id) for client_id in data.get("client_ids")]
+    idempotency_key = request.headers.get("Idempotency-Key") or uuid.uuid4().hex
+
+    # Start the batch, or resume it if this is a retry
+    _, (batch, items) = utils.call_service_or_409(
+        BatchSendServices.start,
+        "quotes",
+        idempotency_key,
+        client_ids,
+        session
+    )
 
-    for client_id in client_ids:
-        # Get the client from the database
-        client = session.get(Client, client_id)
-        # Get the client's temp quote profile from the database
-        temp_quote_profile = session.get(TempClientQuoteProfile, client_id)
+    # Get the lines of every client's temp quote profile, then price all of
+    # them in one pass
+    _, lines_by_client_id = utils.call_service_or_500(
+        QuoteProfileLineCRUD.get_lines_by_client_ids,
+        TempQuoteProfileLine,
+        client_ids,
+        session
+    )
+    _, prices = utils.call_service_or_500(
+        PricingServices.price_profiles,
+        [(lines_by_client_id[client_id], None) for client_id in client_ids]
+    )
 
-        # Get the number of quotes existing for the client and generate a quote
-        # number for the quote based on that value and the client's unique id
-        _, num_quotes = utils.call_service_or_500(
-            QuoteCRUD.count_by_client_id,
-            client_id,
-            session
-        )
-        quote_no = f"{client_id}-{str(num_quotes + 1).zfill(4)}"
+    for client_id, price in zip(client_ids, prices):
+        # Skip the clients an earlier try of the batch already sent to
+        item = items[client_id]
+        if item.status == "done":
+            continue
+
+        # Trace each client separately so a slow client stands out, and
+        # profile only the client an admin asked for (X-Profile-Client)
+        with tracing.span("batch_send_quotes.client", **{"client.id": client_id}), \
+                profiling.client_section(client_id):
+            try:
+                # Get the client and their temp quote profile from the database
+                client = session.get(Client, client_id)
+                temp_quote_profile = session.get(TempClientQuoteProfile, client_id)
+
+                # Get the client's quote number for this batch, allocated from
+                # the number of quotes existing for the client and their
+                # unique id the first time the batch reaches them
+                _, quote_no = utils.call_service_or_500(
+                    BatchSendServices.allocate,
+                    "quotes",
+                    item,
+                    session
+                )
 
-        # Get the path to save quote PDFs to from app settings (id: 3000)
-        _, app_setting = utils.call_service_or_404(
-            AppSettingCRUD.get,
-            "3000",
-            session
-        )
-        pdf_save_path = app_setting.setting_value
+                # Get the path to save quote PDFs to from app settings (id: 3000)
+                _, app_setting = utils.call_service_or_404(
+                    AppSettingCRUD.get,
+                    "3000",
+                    session
+                )
+                pdf_save_path = app_setting.setting_value
+
+                # Generate HTML source for the quote pdf
+                _, html_source = utils.call_service_or_500(
+                    PDFServices.generate_html_source,
+                    file_type="quote",
+                    client=client,
+                    invoice_no=None,
+                    quote_no=quote_no,
+                    min_monthly_charge=temp_quote_profile.min_monthly_charge,
+                    premium_salt_upcharge=temp_quote_profile.premium_salt_upcharge,
+                    services=price.priced_lines(
+                        line.to_dict() for line in lines_by_client_id[client_id]
+                    ),
+                    grand_total=price.grand_total
+                )
 
-        # Generate HTML source for the quote pdf
-        _, html_source = utils.call_service_or_500(
-            PDFServices.generate_html_source,
-            file_type="quote",
-            client=client,
-            invoice_no=None,
-            quote_no=quote_no,
-            min_monthly_charge=temp_quote_profile.min_monthly_charge,
-            premium_salt_upcharge=temp_quote_profile.premium_salt_upcharge,
-            services=temp_quote_profile.services,
-            grand_total=temp_quote_profile.grand_total
-        )
+                # Save the PDF
+                _ = utils.call_service_or_500(
+                    PDFServices.save_pdf,
+                    file_type="quote",
+                    client=client,
+                    invoice_no=None,
+                    quote_no=quote_no,
+                    html_source=html_source,
+                    pdf_save_path=pdf_save_path,
+                )
 
-        # Save the PDF
-        _ = utils.call_service_or_500(
-            PDFServices.save_pdf,
-            file_type="quote",
-            client=client,
-            invoice_no=None,
-            quote_no=quote_no,
-            html_source=html_source,
-            pdf_save_path=pdf_save_path,
-        )
+                # Get the quote email body from app settings (id: 3001)
+                _, app_setting = utils.call_service_or_404(
+                    AppSettingCRUD.get,
+                    "3001",
+                    session
+                )
+                quote_email_body = app_setting.setting_value
+
+                # Replace placeholders in the email body
+                # Client Name
+                quote_email_body = quote_email_body.replace("{{client.name}}", client.name)
+                # Client Street Address
+                quote_email_body = quote_email_body.replace(
+                    "{{client.street_address}}",
+                    client.street_address
+                )
+                # User's Business Email
+                # User's Business Phone No.
+
+                # Validate the new quote data
+                _, new_quote = utils.call_service_or_422(
+                    QuoteCRUD.validate_data,
+                    Quote(
+                        client_id=client_id,
+                        quote_no=quote_no,
+                        grand_total=price.grand_total,
+                        pdf_html=html_source,
+                    )
+                )
 
-        # Get the quote email body from app settings (id: 3001)
-        _, app_setting = utils.call_service_or_404(
-            AppSettingCRUD.get,
-            "3001",
-            session
+                # Create the new quote in the database, in the same
+                # transaction as queueing its email in the outbox and marking
+                # the client done in the ledger
+                utils.call_service_or_500(
+                    OutboxServices.enqueue,
+                    session,
+                    subject="M&M Quote Request",
+                    recipients=[client.email],
+                    body=quote_email_body,
+                    subtype="plain",
+                    attachments=[
+                        {
+                            "file": (
+                                f'{pdf_save_path}/m&m-quote_'
+                                f'{client.name.replace(" ", "_")}_{quote_no}.pdf'
+                            ),
+                            "mime_type": "application/pdf",
+                        }
+                    ],
+                    document_type="quote",
+                    document_no=quote_no
+                )
+                utils.call_service_or_500(
+                    BatchSendServices.mark,
+                    item,
+                    "done",
+                    session,
+                    commit=False
+                )
+                _, quote = utils.call_service_or_500(
+                    QuoteCRUD.create,
+                    new_quote,
+                    session
+                )
+            except Exception as e:
+                # Record the failure and carry on with the next client, a
+                # retry of the batch only redoes the failed clients
+                session.rollback()
+                utils.call_service_or_500(
+                    BatchSendServices.mark,
+                    item,
+                    "failed",
+                    session,
+                    error=e.detail if isinstance(e, HTTPException) else str(e)
+                )
+
+    # Mark the batch completed, or failed if any client failed, and have the
+    # outbox worker send the queued emails
+    _, report = utils.call_service_or_500(
+        BatchSendServices.finish,
+        batch,
+        client_ids,
+        session
+    )
+    outbox_worker.wake()
+
+    if report["failed"]:
+        return JSONResponse(
+            content={
+                "detail": (
+                    f"Sent {report['sent']} of {len(client_ids)} quotes, "
+                    f"{len(report['failed'])} failed. Retry to send only the failed quotes."
+                ),
+                **report
+            },
+            status_code=500,
         )
-        quote_email_body = app_setting.setting_value
-
-        # Replace placeholders in the email body
-        # Client Name
-        quote_email_body = quote_email_body.replace("{{client.name}}", client.name)
-        # Client Street Address
-        quote_email_body = quote_email_body.replace(
-            "{{client.street_address}}",
-            client.street_address
+    return JSONResponse(
+        content={
+            "detail": "Quotes sent successfully.",
+            "redirect_to": "/quotes?page=1",
+            **report
+        },
+        status_code=200,
+    )
+
+@router.get("/preview")
+def preview_quotes(
+    request: Request,
+    session: SessionDependency,
+    client_ids: list[int] = Query(...),
+    preview_format: str = Query("html", alias="format")
+):
+    """
+    Previews the quotes "Send Quotes" would send the given clients, from
+    their temp quote profiles, without rendering PDFs, sending emails or
+    creating quotes. Only the quotes' HTML is generated, so even a large
+    batch is previewed in well under a second per hundred clients.
+
+    Parameters:
+    - client_ids: The unique IDs of the clients to preview, one
+    `client_ids` query parameter each.
+    - format: "html" for a page showing every quote (default), or "json" for
+    each client's quote number, grand total and quote HTML.
+
+    Returns:
+    - `TemplateResponse` | `JSONResponse`: The previews.
+
+    Raises:
+    - HTTPException:
+        - 422 (UNPROCESSABLE ENTITY) if the format is unknown
+        - 500 (INTERNAL SERVER ERROR) if the previews could not be generated
+    """
+    if preview_format not in ("html", "json"):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown preview format {preview_format!r}, use html or json."
         )
-        # User's Business Email
-        # User's Business Phone No.
 
-        # Send the email
-        _, _ = await utils.call_async_service_or_500(
-            EmailServices.send_email,
-            subject="M&M Quote Request",
-            recipients=[client.email],
-            body=quote_email_body,
-            subtype="plain",
-            attachments=[
-                {
-                    "file": (
-                        f'{pdf_save_path}/m&m-quote_'
-                        f'{client.name.replace(" ", "_")}_{quote_no}.pdf'
-                    ),
-                    "mime_type": "application/pdf",
-                }
-            ]
+    _, previews = utils.call_service_or_500(
+        PreviewServices.preview_quotes,
+        client_ids,
+        session
+    )
+
+    if preview_format == "json":
+        return JSONResponse(
+            content={"previews": jsonable_encoder(previews)},
+            status_code=200
         )
+    return templates.TemplateResponse(
+        request=request,
+        name="quote_previews.html",
+        context={"previews": previews}
+    )
 
-        # Validate the new quote data
-        _, new_quote = utils.call_service_or_422(
-            QuoteCRUD.validate_data,
-            Quote(
-                client_id=client_id,
-                quote_no=quote_no,
-                pdf_html=html_source,
-            )
+@router.get("/preview/{client_id}")
+def preview_quote(
+    client_id: int,
+    session: SessionDependency,
+    preview_format: str = Query("html", alias="format")
+):
+    """
+    Previews the quote "Send Quotes" would send a client, as the quote's
+    HTML, or as its PDF. PDFs are cached by their content, so a quote is
+    only rendered the first time its PDF is previewed and again once
+    anything on it changes.
+
+    Parameters:
+    - client_id: The unique ID of the client to preview the quote of.
+    - format: "html" (default) or "pdf".
+
+    Returns:
+    - `HTMLResponse` | `FileResponse`: The quote.
+
+    Raises:
+    - HTTPException:
+        - 404 (NOT FOUND) if the client or their quote profile was not found
+        - 422 (UNPROCESSABLE ENTITY) if the format is unknown
+        - 500 (INTERNAL SERVER ERROR) if the quote could not be generated
+    """
+    if preview_format not in ("html", "pdf"):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown preview format {preview_format!r}, use html or pdf."
         )
-        
-        # Create the new quote in the database
-        _, quote = utils.call_service_or_500(
-            QuoteCRUD.create,
-            new_quote,
-            session
+
+    _, (preview,) = utils.call_service_or_500(
+        PreviewServices.preview_quotes,
+        [client_id],
+        session
+    )
+    if "error" in preview:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=preview["error"]
         )
 
-    return JSONResponse(
-        content={
-            "detail": "Quotes sent successfully.",
-            "redirect_to": "/quotes?page=1"
-        },
-        status_code=200,
+    if preview_format == "html":
+        return HTMLResponse(content=preview["html"], status_code=200)
+
+    _, pdf_path = utils.call_service_or_500(
+        PreviewServices.get_pdf,
+        "quote",
+        preview["client_name"],
+        preview["quote_no"],
+        preview["html"]
+    )
+    return FileResponse(
+        pdf_path,
+        media_type="application/pdf",
+        filename=os.path.basename(pdf_path),
+        content_disposition_type="inline"
+    )
+
+@router.get("/export")
+def export_quotes(export_format: str = Query("csv", alias="format")) -> StreamingResponse:
+    """
+    Exports every quote, with the columns of its client, as a CSV or JSONL
+    (one JSON object per line) download. The rows are streamed from the
+    database as the response is sent, so the download starts at once and
+    exports of any size run in constant memory.
+
+    Parameters:
+    - export_format: "csv" (default) or "jsonl".
+
+    Returns:
+    - `StreamingResponse`: The export, sent as an attachment.
+
+    Raises:
+    - HTTPException:
+        - 422 (UNPROCESSABLE ENTITY) if the format is not supported
+    """
+    _, (rows, media_type, file_name) = utils.call_service_or_422(
+        ExportServices.export_rows,
+        "quotes",
+        export_format
+    )
+    return StreamingResponse(
+        rows,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+    )
+
+@router.get("/archive")
+def archive_quotes(
+    client_id: int | None = Query(None),
+    start_date: date | None = Query(None),
+    end_date: date | None = Query(None)
+) -> StreamingResponse:
+    """
+    Downloads a ZIP archive of the saved quote PDFs, optionally only those of
+    one client or issued between two dates (inclusive). PDFs missing from the
+    quote PDF directory are regenerated from the quotes' stored HTML. The
+    archive is built as it is sent, so it is never held in memory or on disk.
+
+    Parameters:
+    - client_id: The unique ID of the client to archive the quotes of, if any.
+    - start_date: The first issue date to include (YYYY-MM-DD), if any.
+    - end_date: The last issue date to include (YYYY-MM-DD), if any.
+
+    Returns:
+    - `StreamingResponse`: The ZIP archive, sent as an attachment.
+
+    Raises:
+    - HTTPException:
+        - 422 (UNPROCESSABLE ENTITY) if the start date is after the end date
+    """
+    _, (archive, file_name) = utils.call_service_or_422(
+        ArchiveServices.archive_pdfs,
+        "quotes",
+        client_id=client_id,
+        start_date=start_date,
+        end_date=end_date
+    )
+    return StreamingResponse(
+        archive,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
     )
 
 @router.get("/download_quote")
@@ -507,6 +826,7 @@ async def send_quotes(
             Quote(
                 client_id=client_id,
                 quote_no=quote_no,
+                grand_total=grand_total,
                 pdf_html=html_source,
             )
         )
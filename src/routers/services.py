@@ -1,33 +1,27 @@
+import logging
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Form, Request
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, BackgroundTasks, Depends, Form, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.encoders import jsonable_encoder
-from heroicons.jinja import heroicon_outline, heroicon_solid
 from sqlmodel import Session, select
 
 import utils
+import etags
+import profiling
 from database import get_session
+from templating import templates, render_fragment
 from models import Service, AppSetting
-from services import ServiceCRUD
+from services import ServiceCRUD, RepricingServices, services_catalog
 
 # Create router for service-related endpoints
 router = APIRouter(prefix="/services", tags=["services"])
 
-# Create Jinja2 templates object for rendering HTML from the templates
-# directory
-templates = Jinja2Templates(directory="./templates")
-templates.env.globals.update(
-    {
-        "heroicon_outline": heroicon_outline,
-        "heroicon_solid": heroicon_solid,
-    }
-)
-
 SessionDependency = Annotated[Session, Depends(get_session)]
 
 @router.get("/", response_class=HTMLResponse)
+@etags.conditional(Service, AppSetting)
+@profiling.profiled
 def render_services_page(
     request: Request,
     session: SessionDependency,
@@ -44,21 +38,21 @@ def render_services_page(
     Returns:
     - `HTMLResponse`: The rendered HTML content of the services page.
     """
-    # Determine number of services to show per page based on screen height
-    per_page = utils.get_per_page("services")
+    # Determine number of services to show per page based on the viewport height
+    per_page = utils.get_per_page("services", request)
 
-    # Slice the list of all services based on the number of services per page
-    all_services = session.exec(select(Service)).all()
-    total = len(all_services)
+    # Slice the cached list of all services based on the number of services
+    # per page
+    catalog = services_catalog.get(session)
+    total = len(catalog.services)
     start = (page - 1) * per_page
     end = start + per_page
-    page_services = all_services[start:end]
+    page_services = catalog.services[start:end]
     # Count the number of pages necessary to show all the services
     total_pages = (total + per_page - 1) // per_page
 
-    # Convert services lists to JSON-serializable format for use in javascript
-    all_services_dict = jsonable_encoder(all_services)
-    page_services_dict = jsonable_encoder(page_services)
+    # The page's services in JSON-serializable format for use in javascript
+    page_services_dict = catalog.services_dict[start:end]
 
     # Get color theme and page colors
     color_theme = session.get(AppSetting, "0001").setting_value
@@ -68,7 +62,7 @@ def render_services_page(
         request=request,
         name="services.html",
         context={
-            "all_services_dict": all_services_dict,
+            "all_services_json": catalog.html_json,
             "page_services": page_services,
             "page_services_dict": page_services_dict,
             "page": page,
@@ -82,33 +76,38 @@ def render_services_page(
 
 @router.post("/add_service")
 def add_service(
+    request: Request,
     session: SessionDependency,
     name: str = Form(...),
     unit_price: str = Form(..., alias="unit-price"),
     description: str | None = Form(...),
-    page: int = 1
+    current_page: int = Form(1, alias="current-page")
 ) -> JSONResponse:
     """
     Creates a new service.
 
     Parameters:
+    - request: The incoming HTTP request.
     - session: A SQLModel session dependency for database access.
     - name: The name of the service.
     - unit_price: The unit price of the service.
     - description: The description of the service, if applicable.
-    - page: The page number to display for table pagination (default is 1).
+    - current_page: The current page of services being viewed in the table.
 
     Returns:
     - `JSONResponse`: A JSON object containing a status message, status code, 
-    and the newly created service object if the operation is successful.
+    the newly created service object if the operation is successful, the page
+    the new service is shown on, and the HTML fragments to patch the table
+    with: the new row if it is shown on the current page, otherwise all rows
+    of the page to switch to, plus the updated pagination control.
 
     Raises:
     - HTTPException:
         - 422 (UNPROCESSABLE ENTITY) for form validation errors
         - 500 (INTERNAL SERVER ERROR) for unexpected errors
     """
-    # Determine number of services shown per page based on screen height
-    per_page = utils.get_per_page("services")
+    # Determine number of services shown per page based on the viewport height
+    per_page = utils.get_per_page("services", request)
 
     # Validate the new service data
     validate_status, new_service = utils.call_service_or_422(
@@ -128,32 +127,35 @@ def add_service(
     )
 
     # Count total number of services after creation
-    total_services = len(session.exec(select(Service)).all())
+    total_services = utils.count_rows(Service, session)
     # Determine the new number of pages needed
-    total_pages = (total_services + per_page - 1) // per_page
-
-    # If creating the new service caused a new page to be added, redirect to
-    # that new page or the current page if total_pages is an unexpected value
-    if total_pages > page:
-        page = max(total_pages, page)
-
-    return JSONResponse(
-        content={
-            "detail": create_status,
-            "service": {
-                "id": service.id,
-                "name": service.name,
-                "description": service.description,
-                "unit_price": str(service.unit_price),
-            },
-            "redirect_to": f"/services?page={page}",
+    total_pages = utils.get_total_pages(total_services, per_page)
+
+    # New services are added to the end of the table, so they are always
+    # shown on the last page
+    page = max(total_pages, 1)
+
+    content = {
+        "detail": create_status,
+        "service": {
+            "id": service.id,
+            "name": service.name,
+            "description": service.description,
+            "unit_price": str(service.unit_price),
         },
-        status_code=200,
-    )
+        "page": page,
+        "redirect_to": f"/services?page={page}",
+        **_render_table_fragments(session, page, total_pages, per_page, page != current_page)
+    }
+    if page == current_page:
+        content["row_html"] = _render_service_row(session, service)
+
+    return JSONResponse(content=content, status_code=200)
 
 @router.post("/edit_service")
 def edit_service(
     session: SessionDependency,
+    background_tasks: BackgroundTasks,
     new_name: str = Form(..., alias="name"),
     new_description: str | None = Form(..., alias="description"),
     new_unit_price: str = Form(..., alias="unit-price"),
@@ -161,10 +163,12 @@ def edit_service(
     current_page: int = Form(..., alias="current-page")
 ) -> JSONResponse:
     """
-    Edits attributes of an existing service.
+    Edits attributes of an existing service. If the unit price changed, the
+    quote profiles that use the service are re-priced in the background.
 
     Parameters:
     - session: A SQLModel session dependency for database access.
+    - background_tasks: Tasks to run after the response is sent.
     - new_name: The new name of the service.
     - new_description: The new description of the service.
     - new_unit_price: The new unit price of the service.
@@ -173,8 +177,8 @@ def edit_service(
 
     Returns:
     - `JSONResponse`: A JSON object containing a status message, status code, 
-    the edited service object if the operation is successful, and a redirect
-    path to the same page.
+    the edited service object and its re-rendered table row if the operation
+    is successful, and a redirect path to the same page.
 
     Raises:
     - HTTPException:
@@ -199,6 +203,10 @@ def edit_service(
         session
     )
 
+    # Keep the current unit price, the update changes the existing service in
+    # place
+    previous_unit_price = existing_service.unit_price
+
     # Update the existing service's attributes with the updated service's data
     update_status, updated_service = utils.call_service_or_500(
         ServiceCRUD.update,
@@ -207,6 +215,11 @@ def edit_service(
         session
     )
 
+    # Re-price the quote profile lines for this service after the response is
+    # sent
+    if updated_service.unit_price != previous_unit_price:
+        background_tasks.add_task(reprice_quote_profiles, updated_service.id)
+
     return JSONResponse(
         content={
             "detail": update_status,
@@ -216,13 +229,16 @@ def edit_service(
                 "description": updated_service.description,
                 "unit_price": str(updated_service.unit_price),
             },
+            "page": current_page,
             "redirect_to": f"/services?page={current_page}",
+            "row_html": _render_service_row(session, updated_service),
         },
         status_code=200,
     )
 
 @router.post("/remove_service")
 def remove_service(
+    request: Request,
     session: SessionDependency,
     service_id: int = Form(..., alias="service-id"),
     current_page: int = Form(..., alias="current-page")
@@ -231,21 +247,25 @@ def remove_service(
     Removes an existing service.
 
     Parameters:
+    - request: The incoming HTTP request.
     - session: A SQLModel session dependency for database access.
     - service_id: The unique ID of the service to remove.
     - current_page: The current page of services being viewed in the table.
 
     Returns:
     - `JSONResponse`: A JSON object containing a status message, status code, 
-    the removed service object's unique id if the operation is successful, and
-    the page to redirect to.
+    the removed service object's unique id if the operation is successful, the
+    page to show, and the HTML fragments to patch the table with: the row that
+    moved up onto the current page from the next one (if any), or all rows of
+    the previous page if the current page is now empty, plus the updated
+    pagination control.
 
     Raises:
     - HTTPException:
         - 500 (INTERNAL SERVER ERROR) for unexpected errors
     """
-    # Determine number of services shown per page based on screen height
-    per_page = utils.get_per_page("services")
+    # Determine number of services shown per page based on the viewport height
+    per_page = utils.get_per_page("services", request)
 
     # Delete the service from the database
     delete_status, service = utils.call_service_or_500(
@@ -255,28 +275,107 @@ def remove_service(
     )
 
     # Count total number of services after deletion
-    total_services = len(session.exec(select(Service)).all())
+    total_services = utils.count_rows(Service, session)
     # Determine the new number of pages needed
-    total_pages = (total_services + per_page - 1) // per_page
+    total_pages = utils.get_total_pages(total_services, per_page)
 
     # If removing the service caused the page to be empty, redirect to the
     # previous page or the first page if total_pages is an unexpected value,
     # otherwise, stay on the current page
+    page = current_page
     if current_page > total_pages:
-        current_page = max(total_pages, 1)
+        page = max(total_pages, 1)
 
-    return JSONResponse(
-        content={
-            "detail": delete_status,
-            "service": {
-                "id": service.id,
-            },
-            "redirect_to": f"/services?page={current_page}",
+    content = {
+        "detail": delete_status,
+        "service": {
+            "id": service.id,
         },
-        status_code=200,
-    )
+        "page": page,
+        "redirect_to": f"/services?page={page}",
+        **_render_table_fragments(session, page, total_pages, per_page, page != current_page)
+    }
+    # If staying on the current page, the first service of the next page (if
+    # any) moves up to fill the removed service's place
+    if page == current_page:
+        next_services = session.exec(
+            select(Service).order_by(Service.id).offset(page * per_page - 1).limit(1)
+        ).all()
+        if next_services:
+            content["refill_service"] = jsonable_encoder(next_services[0])
+            content["refill_row_html"] = _render_service_row(session, next_services[0])
+
+    return JSONResponse(content=content, status_code=200)
+
+def reprice_quote_profiles(service_id: int) -> None:
+    """
+    Background task that re-prices the quote profiles using a service.
+    """
+    success, message, _ = RepricingServices.reprice_service(service_id)
+    if not success:
+        logging.getLogger(__name__).warning("Re-pricing service %s failed: %s", service_id, message)
+
+def _render_service_row(session: Session, service: Service) -> str:
+    """
+    Render a service's row in the all services table.
+    """
+    colors = utils.get_colors(session.get(AppSetting, "0001").setting_value)
+    return render_fragment("partials/service_row.html", service=service, **colors)
+
+def _render_table_fragments(
+    session: Session,
+    page: int,
+    total_pages: int,
+    per_page: int,
+    include_rows: bool
+) -> dict:
+    """
+    Render the pagination control for the services table and, if the page
+    shown changes, the rows of the new page along with their JSON data.
+    """
+    color_theme = session.get(AppSetting, "0001").setting_value
+    fragments = {
+        "pagination_html": render_fragment(
+            "partials/pagination.html",
+            pagination_base_url="/services",
+            page=page,
+            total_pages=total_pages,
+            colorTheme=color_theme
+        )
+    }
+    if include_rows:
+        page_services = utils.get_page_rows(Service, page, per_page, session)
+        colors = utils.get_colors(color_theme)
+        fragments["rows_html"] = "".join(
+            render_fragment("partials/service_row.html", service=service, **colors)
+            for service in page_services
+        )
+        fragments["page_services"] = jsonable_encoder(page_services)
+    return fragments
 
 @router.get("/api/all")
-async def api_get_all_services(session: SessionDependency):
-    all_services = session.exec(select(Service)).all()
-    return all_services
\ No newline at end of file
+@profiling.profiled
+async def api_get_all_services(request: Request, session: SessionDependency) -> Response:
+    """
+    Returns every service as JSON from the in-memory services catalog. The
+    body is serialized once per catalog change, and the ETag comes from the
+    catalog too, so a cache hit or a conditional request only reads the
+    services table's data version.
+
+    Parameters:
+    - request: The incoming HTTP request.
+    - session: A SQLModel session dependency for checking the catalog's data
+    version, and loading the catalog when it changed.
+
+    Returns:
+    - `Response`: The JSON list of all services, or 304 (NOT MODIFIED) if the
+    request's `If-None-Match` header carries the catalog's current ETag.
+    """
+    catalog = services_catalog.get(session)
+    if etags.etag_matches(request.headers.get("if-none-match"), catalog.etag):
+        return etags.not_modified_response(catalog.etag)
+    return Response(
+        content=catalog.json_bytes,
+        media_type="application/json",
+        headers={"ETag": catalog.etag, "Cache-Control": etags.CACHE_CONTROL}
+    )
\ No newline at end of file
@@ -2,30 +2,17 @@ from typing import Annotated, Any
 
 from fastapi import APIRouter, Depends, Form, HTTPException, Request, status
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from heroicons.jinja import heroicon_micro, heroicon_mini, heroicon_outline, heroicon_solid
-from requests import session
 from sqlmodel import Session, select
 
 import utils
 from database import get_session
+from templating import templates
 from models import AppSetting
-from services import ServiceCRUD
+from services import ServiceCRUD, DataVersionCRUD
 
 # Create router for settings-related endpoints
 router = APIRouter(prefix="/settings", tags=["settings"])
 
-# Create Jinja2 templates object for rendering HTML from the templates directory
-templates = Jinja2Templates(directory="./templates")
-templates.env.globals.update(
-    {
-        "heroicon_micro": heroicon_micro,
-        "heroicon_mini": heroicon_mini,
-        "heroicon_outline": heroicon_outline,
-        "heroicon_solid": heroicon_solid,
-    }
-)
-
 SessionDependency = Annotated[Session, Depends(get_session)]
 
 @router.get("/", response_class=HTMLResponse)
@@ -65,6 +52,7 @@ async def save_app_settings(
             if app_setting.id in form:
                 app_setting.setting_value = form.get(app_setting.id)
                 session.add(app_setting)
+        DataVersionCRUD.bump(AppSetting, session)
         session.commit()
     except Exception as e:
         raise HTTPException(
@@ -1,8 +1,23 @@
-from .crud_services import ClientCRUD, ServiceCRUD, ClientQuoteProfileCRUD, TempClientQuoteProfileCRUD, QuoteCRUD, InvoiceCRUD, AppSettingCRUD
+from .crud_services import DataVersionCRUD, ActivityCRUD, QuoteProfileLineCRUD, ClientCRUD, ServiceCRUD, ClientQuoteProfileCRUD, TempClientQuoteProfileCRUD, QuoteCRUD, InvoiceCRUD, AppSettingCRUD
 from .email_services import EmailServices
 from .pdf_services import PDFServices
+from .catalog_services import services_catalog
+from .pricing_services import PricingServices
+from .repricing_services import RepricingServices
+from .migration_services import MigrationServices
+from .import_services import ImportServices
+from .export_services import ExportServices
+from .archive_services import ArchiveServices
+from .dashboard_services import DashboardServices
+from .preview_services import PreviewServices
+from .batch_send_services import BatchSendServices
+from .outbox_services import OutboxServices, outbox_worker
+from .billing_services import BillingServices, billing_scheduler
 
 __all__ = [
+    "DataVersionCRUD",
+    "ActivityCRUD",
+    "QuoteProfileLineCRUD",
     "ClientCRUD",
     "ServiceCRUD",
     "ClientQuoteProfileCRUD",
@@ -11,5 +26,19 @@ __all__ = [
     "InvoiceCRUD",
     "AppSettingCRUD",
     "EmailServices",
-    "PDFServices"
+    "PDFServices",
+    "PricingServices",
+    "RepricingServices",
+    "MigrationServices",
+    "ImportServices",
+    "ExportServices",
+    "ArchiveServices",
+    "DashboardServices",
+    "PreviewServices",
+    "BatchSendServices",
+    "OutboxServices",
+    "BillingServices",
+    "services_catalog",
+    "billing_scheduler",
+    "outbox_worker"
 ]
\ No newline at end of file
@@ -0,0 +1,200 @@
+import os
+import zipfile
+from datetime import date
+from typing import Iterator
+from concurrent.futures import as_completed
+
+from sqlmodel import Session, select
+
+import tracing
+from database import sqlite_engine
+from models import Client, Quote, Invoice, AppSetting
+from .pdf_services import pdf_file_name, pdf_worker_pool, render_pdf
+
+# Number of documents looked up (and missing PDFs regenerated) at a time
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+
+# The document model, its number column, its PDF file type and the id of the
+# app setting holding the directory its PDFs are saved to
+ARCHIVES = {
+    "quotes": (Quote, "quote_no", "quote", "3000"),
+    "invoices": (Invoice, "invoice_no", "invoice", "4000")
+}
+
+class _ZipStream:
+    """
+    A write-only file for `zipfile` that keeps what is written until it is
+    taken, so the archive can be sent while it is being built. zipfile cannot
+    seek in it, so it writes each file's sizes after the file's data.
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _stream(
+    archive_name: str,
+    client_id: int | None,
+    start_date: date | None,
+    end_date: date | None
+) -> Iterator[bytes]:
+    """
+    Build the ZIP archive and yield it as it is written. Documents are read
+    ARCHIVE_BATCH_SIZE at a time, paging by ID; the missing PDFs of a batch
+    are regenerated in worker processes while the batch's saved PDFs are
+    sent. Every batch, with the HTML of its missing PDFs, is read in a short
+    session of its own, closed before any PDF is rendered or sent, since the
+    response is sent after the request's session is closed and an open read
+    would keep SQLite's lock, and every write waiting on it, for the whole
+    archive.
+    """
+    model, number_column, file_type, setting_id = ARCHIVES[archive_name]
+    statement = (
+        select(model.id, getattr(model, number_column), Client.name)
+        .join(Client, Client.id == model.client_id)
+    )
+    if client_id is not None:
+        statement = statement.where(model.client_id == client_id)
+    if start_date is not None:
+        statement = statement.where(model.issue_date >= start_date)
+    if end_date is not None:
+        statement = statement.where(model.issue_date <= end_date)
+
+    with Session(sqlite_engine) as session:
+        pdf_save_path = session.get(AppSetting, setting_id).setting_value
+
+    zip_stream = _ZipStream()
+    # The PDFs that could not be archived, listed in the archive itself
+    problems = []
+    # The worker processes are only started once a PDF turns out to be missing
+    pool = None
+    try:
+        with zipfile.ZipFile(zip_stream, "w", zipfile.ZIP_DEFLATED) as archive:
+            last_id = 0
+            while True:
+                # Sort the batch's PDFs into saved and missing ones
+                saved = []
+                missing = {}
+                with Session(sqlite_engine) as session:
+                    partition = session.exec(
+                        statement
+                        .where(model.id > last_id)
+                        .order_by(model.id)
+                        .limit(ARCHIVE_BATCH_SIZE)
+                    ).all()
+                    if not partition:
+                        break
+                    last_id = partition[-1][0]
+
+                    for document_id, document_no, client_name in partition:
+                        file_name = pdf_file_name(file_type, client_name, document_no) + ".pdf"
+                        path = os.path.join(pdf_save_path, file_name)
+                        if os.path.isfile(path):
+                            saved.append((path, file_name))
+                        else:
+                            missing[document_id] = (document_no, client_name, file_name)
+
+                    html_sources = dict(session.exec(
+                        select(model.id, model.pdf_html).where(model.id.in_(missing))
+                    ).all()) if missing else {}
+
+                # Start regenerating the missing PDFs from their stored HTML
+                regenerating = {}
+                if missing:
+                    if pool is None:
+                        pool = pdf_worker_pool()
+                    for document_id, (document_no, client_name, file_name) in missing.items():
+                        html_source = html_sources.get(document_id)
+                        if not html_source:
+                            problems.append(f"{file_name}: no stored HTML to regenerate it from.")
+                            continue
+                        future = pool.submit(
+                            render_pdf,
+                            file_type,
+                            client_name,
+                            document_no,
+                            html_source,
+                            pdf_save_path
+                        )
+                        regenerating[future] = file_name
+
+                # Send the saved PDFs while the missing ones are rendered
+                for path, file_name in saved:
+                    archive.write(path, file_name)
+                    yield zip_stream.take()
+
+                # Add the regenerated PDFs as they are finished
+                for future in as_completed(regenerating):
+                    file_name = regenerating[future]
+                    try:
+                        success, message, path = future.result()
+                    except Exception as e:
+                        success, message = False, str(e)
+                    if not success:
+                        problems.append(f"{file_name}: {message}")
+                        continue
+                    archive.write(path, file_name)
+                    yield zip_stream.take()
+
+            if problems:
+                archive.writestr(
+                    "MISSING.txt",
+                    "These PDFs could not be archived:\n" + "\n".join(problems) + "\n"
+                )
+
+        # Send the archive's central directory, written when it is closed
+        yield zip_stream.take()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+@tracing.traced_methods
+class ArchiveServices:
+    @staticmethod
+    def archive_pdfs(
+        archive_name: str,
+        client_id: int | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None
+    ) -> tuple[bool, str, tuple[Iterator[bytes], str] | None]:
+        """
+        Prepare a streamed ZIP archive of the saved quote or invoice PDFs,
+        optionally only those of one client or issued in a date range. PDFs
+        missing from the PDF directory are regenerated from the HTML stored
+        with their quote or invoice, in a pool of PDF_WORKERS processes,
+        and saved there again. The archive is built as it is sent and never
+        held whole in memory or on disk.
+
+        Parameters:
+        - archive_name: "quotes" or "invoices".
+        - client_id: The unique ID of the client to archive the PDFs of, or
+        None for every client.
+        - start_date: The first issue date to include, or None.
+        - end_date: The last issue date to include, or None.
+
+        Returns:
+        - tuple[bool, str, tuple[Iterator[bytes], str] | None]: Success, a
+        status message, and the iterator over the archive and a file name
+        for it.
+        """
+        if archive_name not in ARCHIVES:
+            return False, f"Unknown archive {archive_name!r}.", None
+        if start_date is not None and end_date is not None and start_date > end_date:
+            return False, "The start date must not be after the end date.", None
+
+        file_name = f"{archive_name}_{date.today().isoformat()}.zip"
+        return (
+            True,
+            "Archive ready.",
+            (_stream(archive_name, client_id, start_date, end_date), file_name)
+        )
\ No newline at end of file
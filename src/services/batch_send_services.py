@@ -0,0 +1,221 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select, func
+
+import tracing
+from models import Quote, Invoice, BatchSend, BatchSendItem
+
+# A running batch send that has not sent a client for this long is taken to
+# have crashed, and may be retried
+BATCH_SEND_LEASE_SECONDS = int(os.getenv("BATCH_SEND_LEASE_SECONDS", "300"))
+
+# The document model and its number column of each kind of batch send
+BATCH_SEND_KINDS = {
+    "quotes": (Quote, "quote_no"),
+    "invoices": (Invoice, "invoice_no")
+}
+
+@tracing.traced_methods
+class BatchSendServices:
+    @staticmethod
+    def start(
+        kind: str,
+        idempotency_key: str,
+        client_ids: list[int],
+        session: Session
+    ) -> tuple[bool, str, tuple[BatchSend, dict[int, BatchSendItem]] | None]:
+        """
+        Start a batch send, or resume the batch sent with the same idempotency
+        key. Each client of the batch gets a ledger item recording how far
+        their quote or invoice got, so a retry skips the clients that are
+        done and keeps the document numbers already allocated. Only one
+        request can send a batch at a time.
+
+        Parameters:
+        - kind: "quotes" or "invoices".
+        - idempotency_key: The key identifying the batch, sent again with
+        every retry of it.
+        - client_ids: The unique IDs of the clients to send to.
+        - session: A SQLModel session for database access.
+
+        Returns:
+        - tuple[bool, str, tuple[BatchSend, dict[int, BatchSendItem]] | None]:
+        Success, a status message, and the batch and its ledger items keyed
+        by client ID. Fails if the key belongs to another kind of batch or
+        the batch is being sent by another request.
+        """
+        if kind not in BATCH_SEND_KINDS:
+            return False, f"Unknown batch send {kind!r}.", None
+        if not client_ids:
+            return False, "No clients to send to.", None
+        try:
+            now = datetime.now(timezone.utc)
+            started = session.exec(
+                insert(BatchSend)
+                .values(
+                    idempotency_key=idempotency_key,
+                    kind=kind,
+                    status="running",
+                    created_at=now,
+                    heartbeat_at=now
+                )
+                .on_conflict_do_nothing()
+            ).rowcount
+            session.commit()
+            batch = session.exec(
+                select(BatchSend).where(BatchSend.idempotency_key == idempotency_key)
+            ).one()
+            if batch.kind != kind:
+                return False, f"Idempotency key {idempotency_key!r} was used for a batch of {batch.kind}.", None
+
+            if not started:
+                # Only one request can take over the batch, the update is atomic
+                taken_over = session.exec(
+                    update(BatchSend)
+                    .where(BatchSend.id == batch.id)
+                    .where(
+                        (BatchSend.status != "running")
+                        | (BatchSend.heartbeat_at < now - timedelta(seconds=BATCH_SEND_LEASE_SECONDS))
+                    )
+                    .values(status="running", heartbeat_at=now)
+                ).rowcount
+                session.commit()
+                if not taken_over:
+                    return False, "This batch is already being sent.", None
+                session.refresh(batch)
+
+            # Add ledger items for the clients new to the batch
+            session.exec(
+                insert(BatchSendItem)
+                .values([{"batch_id": batch.id, "client_id": client_id} for client_id in client_ids])
+                .on_conflict_do_nothing()
+            )
+            session.commit()
+            items = {
+                item.client_id: item
+                for item in session.exec(
+                    select(BatchSendItem)
+                    .where(BatchSendItem.batch_id == batch.id)
+                    .where(BatchSendItem.client_id.in_(client_ids))
+                )
+            }
+            return True, "Batch send started." if started else "Batch send resumed.", (batch, items)
+        except Exception as e:
+            session.rollback()
+            return False, str(e), None
+
+    @staticmethod
+    def allocate(
+        kind: str,
+        item: BatchSendItem,
+        session: Session
+    ) -> tuple[bool, str, str | None]:
+        """
+        Get the quote or invoice number of a batch's client. The number is
+        allocated the first time the client is sent to and kept by retries,
+        unless another quote or invoice took it in the meantime.
+
+        Returns:
+        - tuple[bool, str, str | None]: Success, a status message, and the
+        document number.
+        """
+        try:
+            model, number_column = BATCH_SEND_KINDS[kind]
+            number = getattr(model, number_column)
+            if item.document_no is not None and not session.exec(
+                select(func.count()).select_from(model).where(number == item.document_no)
+            ).one():
+                return True, "Document number found.", item.document_no
+
+            count = session.exec(
+                select(func.count()).select_from(model).where(model.client_id == item.client_id)
+            ).one()
+            item.document_no = f"{item.client_id}-{str(count + 1).zfill(4)}"
+            session.add(item)
+            session.commit()
+            return True, "Document number allocated.", item.document_no
+        except Exception as e:
+            session.rollback()
+            return False, str(e), None
+
+    @staticmethod
+    def mark(
+        item: BatchSendItem,
+        status: str,
+        session: Session,
+        error: str | None = None,
+        commit: bool = True
+    ) -> tuple[bool, str, BatchSendItem | None]:
+        """
+        Record the progress of a batch's client and renew the batch's lease.
+
+        Parameters:
+        - item: The client's ledger item.
+        - status: "pending", "done" or "failed".
+        - session: A SQLModel session for database access.
+        - error: Why sending to the client failed, if it did.
+        - commit: Whether to commit. Pass False to commit the item together
+        with the quote or invoice it records and its email, e.g. by the CRUD
+        create.
+
+        Returns:
+        - tuple[bool, str, BatchSendItem | None]: Success, a status message,
+        and the item.
+        """
+        try:
+            now = datetime.now(timezone.utc)
+            item.status = status
+            item.error = error
+            session.add(item)
+            session.exec(
+                update(BatchSend)
+                .where(BatchSend.id == item.batch_id)
+                .values(heartbeat_at=now)
+            )
+            if commit:
+                session.commit()
+            return True, "Batch send item updated.", item
+        except Exception as e:
+            session.rollback()
+            return False, str(e), None
+
+    @staticmethod
+    def finish(
+        batch: BatchSend,
+        client_ids: list[int],
+        session: Session
+    ) -> tuple[bool, str, dict | None]:
+        """
+        Mark a batch send completed, or failed if any of the clients it was
+        last sent to were not sent to, and report it.
+
+        Returns:
+        - tuple[bool, str, dict | None]: Success, a status message, and the
+        batch's idempotency key, status, number of clients sent to, and the
+        clients that failed with their errors.
+        """
+        try:
+            items = session.exec(
+                select(BatchSendItem)
+                .where(BatchSendItem.batch_id == batch.id)
+                .where(BatchSendItem.client_id.in_(client_ids))
+            ).all()
+            failed = [
+                {"client_id": item.client_id, "error": item.error or "Not sent."}
+                for item in items if item.status != "done"
+            ]
+            batch.status = "failed" if failed else "completed"
+            session.add(batch)
+            session.commit()
+            return True, f"Batch send {batch.status}.", {
+                "idempotency_key": batch.idempotency_key,
+                "status": batch.status,
+                "sent": len(items) - len(failed),
+                "failed": failed
+            }
+        except Exception as e:
+            session.rollback()
+            return False, str(e), None
\ No newline at end of file
@@ -0,0 +1,414 @@
+import os
+import re
+import logging
+import threading
+from decimal import Decimal
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+
+import tracing
+from database import sqlite_engine
+from models import (
+    Client,
+    ClientQuoteProfile,
+    QuoteProfileLine,
+    Invoice,
+    AppSetting,
+    BillingRun
+)
+from .crud_services import InvoiceCRUD, QuoteProfileLineCRUD
+from .pricing_services import PricingServices
+from .pdf_services import PDFServices, pdf_worker_pool, render_pdf
+
+# Number of clients invoiced per transaction, and so between checkpoints
+BILLING_BATCH_SIZE = int(os.getenv("BILLING_BATCH_SIZE", "100"))
+# A running billing run that has not checkpointed for this long is taken to
+# have crashed, and the next run for its month resumes it
+BILLING_LEASE_SECONDS = int(os.getenv("BILLING_LEASE_SECONDS", "600"))
+# How often the scheduler checks whether the month's billing run is due
+BILLING_CHECK_SECONDS = int(os.getenv("BILLING_CHECK_SECONDS", "3600"))
+
+# The app setting holding the day of the month billing runs start on
+BILLING_DAY_SETTING_ID = "4002"
+# Billing days are capped so every month has them
+MAX_BILLING_DAY = 28
+
+PERIOD_PATTERN = re.compile(r"^(\d{4})-(0[1-9]|1[0-2])$")
+
+def _active_clients(after_client_id: int, session: Session) -> list[tuple[Client, Decimal]]:
+    """
+    The next BILLING_BATCH_SIZE active clients after a client, in order of
+    their ids, with their minimum monthly charges. A client is active if it
+    has a quote profile.
+    """
+    return session.exec(
+        select(Client, ClientQuoteProfile.min_monthly_charge)
+        .join(ClientQuoteProfile, ClientQuoteProfile.client_id == Client.id)
+        .where(Client.id > after_client_id)
+        .order_by(Client.id)
+        .limit(BILLING_BATCH_SIZE)
+    ).all()
+
+def _bill_clients(
+    clients: list[tuple[Client, Decimal]],
+    session: Session
+) -> list[tuple[Client, str, list[dict], Decimal]]:
+    """
+    Price the quote profiles of a batch of clients in one pass and number
+    their invoices.
+
+    Returns:
+    - list[tuple[Client, str, list[dict], Decimal]]: The client, invoice
+    number, invoice lines and grand total of each client with something to
+    bill. Clients whose profile totals nothing are left out.
+    """
+    client_ids = [client.id for client, _ in clients]
+    _, _, lines_by_client_id = QuoteProfileLineCRUD.get_lines_by_client_ids(
+        QuoteProfileLine,
+        client_ids,
+        session
+    )
+    lines = [
+        [line.to_dict() for line in lines_by_client_id[client_id]]
+        for client_id in client_ids
+    ]
+    success, message, prices = PricingServices.price_profiles([
+        (client_lines, min_monthly_charge)
+        for client_lines, (_, min_monthly_charge) in zip(lines, clients)
+    ])
+    if not success:
+        raise ValueError(message)
+    _, _, invoice_counts = InvoiceCRUD.count_by_client_ids(client_ids, session)
+
+    bills = []
+    for (client, _), client_lines, price in zip(clients, lines, prices):
+        if not price.grand_total:
+            continue
+        invoice_no = f"{client.id}-{str(invoice_counts[client.id] + 1).zfill(4)}"
+        bills.append((client, invoice_no, price.invoice_lines(client_lines), price.grand_total))
+    return bills
+
+def _acquire_run(period: str, issue_date: date) -> tuple[BillingRun | None, str]:
+    """
+    Start the billing run of a month, or take over its failed or crashed run
+    to resume it from its last checkpoint.
+
+    Returns:
+    - tuple[BillingRun | None, str]: The run, or None if the month is already
+    billed or being billed, and a status message.
+    """
+    now = datetime.now(timezone.utc)
+    with Session(sqlite_engine) as session:
+        started = session.exec(
+            insert(BillingRun)
+            .values(
+                period=period,
+                status="running",
+                issue_date=issue_date,
+                started_at=now,
+                heartbeat_at=now
+            )
+            .on_conflict_do_nothing()
+        ).rowcount
+        session.commit()
+        run = session.exec(select(BillingRun).where(BillingRun.period == period)).one()
+        if started:
+            return run, f"Started billing {period}."
+        if run.status == "completed":
+            return None, f"{period} is already billed."
+
+        # Only one process can take over the run, the update is atomic
+        taken_over = session.exec(
+            update(BillingRun)
+            .where(BillingRun.id == run.id)
+            .where(
+                (BillingRun.status == "failed")
+                | (BillingRun.heartbeat_at < now - timedelta(seconds=BILLING_LEASE_SECONDS))
+            )
+            .values(status="running", heartbeat_at=now, error=None)
+        ).rowcount
+        session.commit()
+        if not taken_over:
+            return None, f"{period} is being billed by another run."
+        session.refresh(run)
+        return run, f"Resumed billing {period} after client {run.last_client_id}."
+
+def _run_report(run: BillingRun) -> dict:
+    return {
+        "period": run.period,
+        "status": run.status,
+        "issue_date": run.issue_date.isoformat(),
+        "started_at": run.started_at.isoformat(),
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        "last_client_id": run.last_client_id,
+        "invoice_count": run.invoice_count,
+        "grand_total": str(run.grand_total),
+        "error": run.error
+    }
+
+@tracing.traced_methods
+class BillingServices:
+    @staticmethod
+    def parse_period(period: str | None) -> tuple[bool, str, str | None]:
+        """
+        Check a billing month, "YYYY-MM". No month means the current one.
+        """
+        if not period:
+            return True, "Billing period found.", date.today().strftime("%Y-%m")
+        if not PERIOD_PATTERN.match(period):
+            return False, f"Billing period {period!r} is not a month (YYYY-MM).", None
+        return True, "Billing period found.", period
+
+    @staticmethod
+    def preview(period: str) -> tuple[bool, str, dict | None]:
+        """
+        Dry run of a month's billing run: price every active client's quote
+        profile and number their invoices, without rendering PDFs or saving
+        anything. If the month's run was interrupted, only the clients it has
+        not invoiced yet are previewed.
+
+        Parameters:
+        - period: The month to bill, "YYYY-MM".
+
+        Returns:
+        - tuple[bool, str, dict | None]: Success, a status message, and the
+        number and total of the invoices the run would create, with each
+        invoice's client, number and grand total.
+        """
+        try:
+            with Session(sqlite_engine) as session:
+                run = session.exec(select(BillingRun).where(BillingRun.period == period)).first()
+                if run is not None and run.status == "completed":
+                    return True, f"{period} is already billed.", {
+                        "period": period, "invoice_count": 0, "grand_total": "0.00", "invoices": []
+                    }
+
+                invoices = []
+                grand_total = Decimal("0.00")
+                last_client_id = run.last_client_id if run is not None else 0
+                while clients := _active_clients(last_client_id, session):
+                    for client, invoice_no, _, total in _bill_clients(clients, session):
+                        invoices.append({
+                            "client_id": client.id,
+                            "client_name": client.name,
+                            "invoice_no": invoice_no,
+                            "grand_total": str(total)
+                        })
+                        grand_total += total
+                    last_client_id = clients[-1][0].id
+
+            return True, f"Billing {period} would create {len(invoices)} invoices.", {
+                "period": period,
+                "invoice_count": len(invoices),
+                "grand_total": str(grand_total),
+                "invoices": invoices
+            }
+        except Exception as e:
+            return False, str(e), None
+
+    @staticmethod
+    def run(period: str) -> tuple[bool, str, dict | None]:
+        """
+        Invoice every active client for a month from their quote profile and
+        minimum monthly charge. Clients are invoiced BILLING_BATCH_SIZE at a
+        time: a batch's quote profiles are priced in one pass, its PDFs are
+        rendered in a pool of PDF_WORKERS processes, and its invoices are
+        inserted together with the run's checkpoint in one transaction. A
+        run that fails or crashes is resumed from its last checkpoint by the
+        next run for the same month, so no client is invoiced twice.
+
+        Parameters:
+        - period: The month to bill, "YYYY-MM".
+
+        Returns:
+        - tuple[bool, str, dict | None]: Success, a status message, and the
+        run's status, checkpoint, invoice count and total.
+        """
+        run, message = _acquire_run(period, date.today())
+        if run is None:
+            return False, message, None
+
+        pool = None
+        with Session(sqlite_engine) as session:
+            run = session.get(BillingRun, run.id)
+            # The heartbeat this run last wrote. A run that was taken over has
+            # a newer one, so this process may no longer finish or fail it.
+            heartbeat_at = run.heartbeat_at
+            try:
+                pdf_save_path = session.get(AppSetting, "4000").setting_value
+                pool = pdf_worker_pool()
+                while clients := _active_clients(run.last_client_id, session):
+                    with tracing.span("BillingServices.run.batch", clients=len(clients)):
+                        bills = _bill_clients(clients, session)
+
+                        # Render the batch's PDFs across the worker processes
+                        invoices = []
+                        renders = []
+                        for client, invoice_no, services, grand_total in bills:
+                            success, message, html_source = PDFServices.generate_html_source(
+                                file_type="invoice",
+                                client=client,
+                                invoice_no=invoice_no,
+                                quote_no=None,
+                                min_monthly_charge=Decimal("0.00"),
+                                premium_salt_upcharge=Decimal("0.00"),
+                                services=services,
+                                grand_total=grand_total
+                            )
+                            if not success:
+                                raise ValueError(message)
+                            renders.append(pool.submit(
+                                render_pdf,
+                                "invoice",
+                                client.name,
+                                invoice_no,
+                                html_source,
+                                pdf_save_path
+                            ))
+                            invoices.append(Invoice(
+                                client_id=client.id,
+                                invoice_no=invoice_no,
+                                issue_date=run.issue_date,
+                                grand_total=grand_total,
+                                pdf_html=html_source
+                            ))
+                        for render in renders:
+                            success, message, _ = render.result()
+                            if not success:
+                                raise RuntimeError(message)
+
+                        # Insert the invoices and move the checkpoint past the
+                        # batch in one transaction. The checkpoint only moves
+                        # if it is where this run left it, so a run that was
+                        # taken over cannot invoice the batch a second time.
+                        success, message, _ = InvoiceCRUD.add_many(invoices, session)
+                        if not success:
+                            raise ValueError(message)
+                        checkpoint = {
+                            "last_client_id": clients[-1][0].id,
+                            "invoice_count": run.invoice_count + len(invoices),
+                            "grand_total": run.grand_total + sum((invoice.grand_total for invoice in invoices), Decimal("0.00")),
+                            "heartbeat_at": datetime.now(timezone.utc)
+                        }
+                        moved = session.exec(
+                            update(BillingRun)
+                            .where(BillingRun.id == run.id)
+                            .where(BillingRun.status == "running")
+                            .where(BillingRun.last_client_id == run.last_client_id)
+                            .where(BillingRun.heartbeat_at == heartbeat_at)
+                            .values(**checkpoint)
+                        ).rowcount
+                        if not moved:
+                            session.rollback()
+                            return False, f"The billing run for {period} was taken over by another run.", None
+                        session.commit()
+                        session.refresh(run)
+                        heartbeat_at = checkpoint["heartbeat_at"]
+
+                finished = session.exec(
+                    update(BillingRun)
+                    .where(BillingRun.id == run.id)
+                    .where(BillingRun.status == "running")
+                    .where(BillingRun.heartbeat_at == heartbeat_at)
+                    .values(status="completed", finished_at=datetime.now(timezone.utc))
+                ).rowcount
+                if not finished:
+                    session.rollback()
+                    return False, f"The billing run for {period} was taken over by another run.", None
+                session.commit()
+                session.refresh(run)
+                return True, f"Billed {period}: {run.invoice_count} invoices.", _run_report(run)
+            except Exception as e:
+                session.rollback()
+                # Only while this process still owns the run, a run that took
+                # it over must not be marked failed
+                session.exec(
+                    update(BillingRun)
+                    .where(BillingRun.id == run.id)
+                    .where(BillingRun.status == "running")
+                    .where(BillingRun.heartbeat_at == heartbeat_at)
+                    .values(status="failed", error=str(e))
+                )
+                session.commit()
+                return False, f"Billing {period} failed after client {run.last_client_id}: {e}", None
+            finally:
+                if pool is not None:
+                    pool.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def get_runs(session: Session, limit: int = 12) -> tuple[bool, str, list[dict]]:
+        """
+        The most recent billing runs, newest month first.
+        """
+        runs = session.exec(
+            select(BillingRun).order_by(BillingRun.period.desc()).limit(limit)
+        ).all()
+        return True, "Billing runs found.", [_run_report(run) for run in runs]
+
+class BillingScheduler:
+    """
+    Starts each month's billing run from a background thread. Every
+    BILLING_CHECK_SECONDS it reads the billing day from the app settings
+    (setting 4002, blank to turn billing runs off), and once the day is
+    reached it runs the month's billing, or resumes it if it was
+    interrupted. Only the current month is checked: a billing day missed
+    while the app was down is caught up when it starts again later in the
+    same month, but a month the app was down past the end of is not billed;
+    run it by hand (`python manage.py billing-run --period YYYY-MM`).
+    """
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="billing-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(BILLING_CHECK_SECONDS)
+
+    def check(self, today: date | None = None) -> tuple[bool, str, dict | None]:
+        """
+        Run the month's billing if it is due.
+        """
+        logger = logging.getLogger(__name__)
+        today = today or date.today()
+        try:
+            with Session(sqlite_engine) as session:
+                setting = session.get(AppSetting, BILLING_DAY_SETTING_ID)
+                billing_day = str(setting.setting_value or "").strip() if setting else ""
+                if not billing_day:
+                    return True, "Billing runs are turned off.", None
+                if not billing_day.isdigit() or not 1 <= int(billing_day) <= MAX_BILLING_DAY:
+                    logger.warning("Billing day %r is not a day from 1 to %s", billing_day, MAX_BILLING_DAY)
+                    return False, f"Billing day {billing_day!r} is not a day from 1 to {MAX_BILLING_DAY}.", None
+                if today.day < int(billing_day):
+                    return True, "The billing run is not due yet.", None
+
+                period = today.strftime("%Y-%m")
+                status = session.exec(
+                    select(BillingRun.status).where(BillingRun.period == period)
+                ).first()
+                if status == "completed":
+                    return True, f"{period} is already billed.", None
+        except Exception as e:
+            logger.warning("Checking the billing schedule failed: %s", e)
+            return False, str(e), None
+
+        success, message, report = BillingServices.run(period)
+        if success:
+            logger.info(message)
+        else:
+            logger.warning(message)
+        return success, message, report
+
+billing_scheduler = BillingScheduler()
\ No newline at end of file
@@ -0,0 +1,93 @@
+import json
+import hashlib
+import threading
+
+from fastapi.encoders import jsonable_encoder
+from jinja2.utils import htmlsafe_json_dumps
+from markupsafe import Markup
+from sqlmodel import Session, select
+
+import tracing
+from models import Service, DataVersion
+
+def _services_version(session: Session) -> int:
+    """
+    Get the data version of the services table, which `DataVersionCRUD.bump`
+    increments with every write to it.
+    """
+    version = session.exec(
+        select(DataVersion.version)
+        .where(DataVersion.table_name == Service.__tablename__)
+    ).first()
+    return version or 0
+
+class CatalogSnapshot:
+    """
+    An immutable copy of every service at a data version of the services
+    table, serialized once for each way the app hands the catalog out.
+    """
+    def __init__(self, services: list[Service], version: int):
+        self.version = version
+        # Copies that are not bound to the session that loaded them
+        self.services = tuple(Service(**service.model_dump()) for service in services)
+        self.services_dict = jsonable_encoder(list(self.services))
+        # The body of /services/api/all, encoded the same way JSONResponse does
+        self.json_bytes = json.dumps(
+            self.services_dict,
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        # The catalog as a JavaScript literal that is safe to embed in a page
+        self.html_json = Markup(htmlsafe_json_dumps(self.services_dict))
+        self.etag = f'W/"services-{hashlib.sha1(self.json_bytes).hexdigest()[:24]}"'
+
+class ServicesCatalog:
+    """
+    In-memory cache of the services table, keyed to the table's data
+    version. Every read checks the version, a single primary key lookup, and
+    the first read after it changed loads the table; concurrent readers that
+    miss at the same time wait for that one query instead of issuing their
+    own. A write made by another process is therefore seen by the next read,
+    like the ETags built from the same data version. ServiceCRUD also drops
+    the catalog after every committed write.
+    """
+    def __init__(self):
+        self._snapshot: CatalogSnapshot | None = None
+        self._load_lock = threading.Lock()
+
+    def get(self, session: Session) -> CatalogSnapshot:
+        """
+        Get the current catalog, loading it with the given session on a miss.
+        """
+        version = _services_version(session)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        with self._load_lock:
+            # Another request may have loaded the catalog while this one waited
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == version:
+                return snapshot
+
+            with tracing.span("ServicesCatalog.load"):
+                # The version is read before the rows, so a write committed in
+                # between only makes the next read load the table again
+                version = _services_version(session)
+                snapshot = CatalogSnapshot(
+                    session.exec(select(Service).order_by(Service.id)).all(),
+                    version
+                )
+            self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self) -> None:
+        """
+        Drop the cached catalog. Must be called after the write is committed.
+        """
+        self._snapshot = None
+
+# The catalog shared by every request in this process
+services_catalog = ServicesCatalog()
\ No newline at end of file
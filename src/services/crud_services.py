@@ -1,14 +1,231 @@
 from typing import Annotated
+from decimal import Decimal, ROUND_HALF_UP
 
 from fastapi import Depends
-from sqlmodel import Session, select
+from sqlmodel import SQLModel, Session, select, update, delete
 from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
 
+import tracing
 from database import get_session
-from models import Client, Service, ClientQuoteProfile, TempClientQuoteProfile, Quote, Invoice, AppSetting
+from models import (
+    Client,
+    Service,
+    ClientQuoteProfile,
+    TempClientQuoteProfile,
+    QuoteProfileLine,
+    TempQuoteProfileLine,
+    Quote,
+    Invoice,
+    AppSetting,
+    DataVersion,
+    MonthlyActivity,
+    ClientActivity
+)
+from .catalog_services import services_catalog
 
 SessionDependency = Annotated[Session, Depends(get_session)]
 
+@tracing.traced_methods
+class DataVersionCRUD:
+    @staticmethod
+    def bump(model: type[SQLModel], session: Session) -> None:
+        """
+        Increment the data version of a model's table. The increment is part
+        of the session's pending transaction, so it is committed together with
+        the change it records. Both statements are atomic in SQLite, so
+        concurrent writers never end up sharing a version.
+        """
+        table_name = model.__tablename__
+        session.exec(
+            insert(DataVersion)
+            .values(table_name=table_name, version=0)
+            .on_conflict_do_nothing()
+        )
+        session.exec(
+            update(DataVersion)
+            .where(DataVersion.table_name == table_name)
+            .values(version=DataVersion.version + 1)
+        )
+
+    @staticmethod
+    def get_versions(
+        models: tuple[type[SQLModel], ...],
+        session: Session
+    ) -> tuple[bool, str, dict[str, int]]:
+        table_names = [model.__tablename__ for model in models]
+        data_versions = session.exec(
+            select(DataVersion).where(DataVersion.table_name.in_(table_names))
+        ).all()
+        versions = {table_name: 0 for table_name in table_names}
+        versions.update({
+            data_version.table_name: data_version.version
+            for data_version in data_versions
+        })
+        return True, "Data versions found.", versions
+
+@tracing.traced_methods
+class ActivityCRUD:
+    @staticmethod
+    def record(document: Quote | Invoice, session: Session, sign: int = 1) -> None:
+        """
+        Add a quote or invoice to the monthly and per-client activity counts
+        and totals the dashboard reads, or take it away again with sign=-1.
+        Like `DataVersionCRUD.bump`, the change is part of the session's
+        pending transaction and each upsert is atomic in SQLite, so the
+        activity always matches the documents that were committed.
+        """
+        prefix = "quote" if isinstance(document, Quote) else "invoice"
+        total_cents = int(
+            (Decimal(document.grand_total or 0) * 100).quantize(Decimal(1), ROUND_HALF_UP)
+        )
+        keys = [(ClientActivity, {"client_id": document.client_id})]
+        if document.issue_date is not None:
+            keys.append((MonthlyActivity, {"month": document.issue_date.strftime("%Y-%m")}))
+
+        for model, key in keys:
+            count_column = getattr(model, f"{prefix}_count")
+            total_column = getattr(model, f"{prefix}_total_cents")
+            session.exec(
+                insert(model)
+                .values(**key, **{count_column.key: sign, total_column.key: sign * total_cents})
+                .on_conflict_do_update(
+                    index_elements=list(key),
+                    set_={
+                        count_column.key: count_column + sign,
+                        total_column.key: total_column + sign * total_cents
+                    }
+                )
+            )
+
+# The columns that make up a quote profile line's content
+LINE_FIELDS = (
+    "service_id",
+    "service_name",
+    "quantity",
+    "per_unit",
+    "unit_price",
+    "tax",
+    "total_price"
+)
+
+@tracing.traced_methods
+class QuoteProfileLineCRUD:
+    @staticmethod
+    def validate_lines(
+        line_model: type[QuoteProfileLine] | type[TempQuoteProfileLine],
+        lines: list[dict] | None
+    ) -> tuple[bool, str, list[QuoteProfileLine] | list[TempQuoteProfileLine] | None]:
+        """
+        Validate the lines of a quote profile form and convert them to line
+        models, numbered in the order they were given.
+        """
+        try:
+            validated_lines = [
+                line_model.model_validate({**line, "position": position})
+                for position, line in enumerate(lines or [])
+            ]
+            return True, "Validation successful.", validated_lines
+        except Exception as e:
+            return False, str(e), None
+
+    @staticmethod
+    def get_lines(
+        line_model: type[QuoteProfileLine] | type[TempQuoteProfileLine],
+        client_id: int,
+        session: Session
+    ) -> tuple[bool, str, list[QuoteProfileLine] | list[TempQuoteProfileLine]]:
+        lines = session.exec(
+            select(line_model)
+            .where(line_model.client_id == client_id)
+            .order_by(line_model.position)
+        ).all()
+        return True, "Quote Profile lines found.", list(lines)
+
+    @staticmethod
+    def get_lines_by_client_ids(
+        line_model: type[QuoteProfileLine] | type[TempQuoteProfileLine],
+        client_ids: list[int],
+        session: Session
+    ) -> tuple[bool, str, dict[int, list]]:
+        """
+        Get the lines of several quote profiles in one query, keyed by client
+        ID. Clients without lines get an empty list.
+        """
+        lines_by_client_id = {client_id: [] for client_id in client_ids}
+        for line in session.exec(
+            select(line_model)
+            .where(line_model.client_id.in_(client_ids))
+            .order_by(line_model.client_id, line_model.position)
+        ):
+            lines_by_client_id[line.client_id].append(line)
+        return True, "Quote Profile lines found.", lines_by_client_id
+
+    @staticmethod
+    def replace_lines(
+        line_model: type[QuoteProfileLine] | type[TempQuoteProfileLine],
+        client_id: int,
+        lines: list,
+        session: Session
+    ) -> None:
+        """
+        Make a quote profile's lines match the given ones, position by
+        position. Only the rows of lines that changed are written, and lines
+        are linked to the services they price by name, falling back to the
+        service a line was linked to before (e.g. if the service was renamed
+        since). The changes are pending in the session's transaction, like
+        DataVersionCRUD.bump.
+
+        Parameters:
+        - line_model: QuoteProfileLine or TempQuoteProfileLine.
+        - client_id: The unique ID of the client whose profile the lines belong to.
+        - lines: The new lines, in order. Any objects with the line columns as
+        attributes, e.g. the lines of another quote profile.
+        - session: A SQLModel session for database access.
+        """
+        service_ids_by_name = {}
+        for service in services_catalog.get(session).services:
+            service_ids_by_name.setdefault(service.name, service.id)
+
+        _, _, existing_lines = QuoteProfileLineCRUD.get_lines(line_model, client_id, session)
+        for position, line in enumerate(lines):
+            values = {field: getattr(line, field) for field in LINE_FIELDS}
+            existing_line = existing_lines[position] if position < len(existing_lines) else None
+            values["service_id"] = service_ids_by_name.get(
+                values["service_name"],
+                existing_line.service_id
+                if existing_line and existing_line.service_name == values["service_name"]
+                else values["service_id"]
+            )
+
+            if existing_line is None:
+                session.add(line_model(client_id=client_id, position=position, **values))
+            elif any(getattr(existing_line, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(existing_line, field, value)
+                session.add(existing_line)
+
+        # Lines past the end of the new list were removed
+        for existing_line in existing_lines[len(lines):]:
+            session.delete(existing_line)
+
+    @staticmethod
+    def get_client_ids(
+        service_id: int,
+        session: Session
+    ) -> tuple[bool, str, list[int]]:
+        """
+        Get the clients whose quote profiles have a line for a service.
+        """
+        client_ids = session.exec(
+            select(QuoteProfileLine.client_id)
+            .where(QuoteProfileLine.service_id == service_id)
+            .distinct()
+            .order_by(QuoteProfileLine.client_id)
+        ).all()
+        return True, "Quote profiles found.", list(client_ids)
+
+@tracing.traced_methods
 class ClientCRUD:
     @staticmethod
     def validate_data(data: Client) -> tuple[bool, str, Client | None]:
@@ -28,6 +245,7 @@ class ClientCRUD:
             return False, message, None
         
         session.add(data)
+        DataVersionCRUD.bump(Client, session)
         session.commit()
         session.refresh(data)
 
@@ -60,6 +278,7 @@ class ClientCRUD:
             client.phone = data.phone
 
             session.add(client)
+            DataVersionCRUD.bump(Client, session)
             session.commit()
             session.refresh(client)
 
@@ -74,10 +293,12 @@ class ClientCRUD:
             return False, "Client not found.", None
 
         session.delete(client)
+        DataVersionCRUD.bump(Client, session)
         session.commit()
 
         return True, "Client deleted successfully.", client
 
+@tracing.traced_methods
 class ServiceCRUD:
     @staticmethod
     def validate_data(data: Service) -> tuple[bool, str, Service | None]:
@@ -97,7 +318,9 @@ class ServiceCRUD:
             return False, message, None
         
         session.add(data)
+        DataVersionCRUD.bump(Service, session)
         session.commit()
+        services_catalog.invalidate()
         session.refresh(data)
 
         return True, "Service created successfully.", service
@@ -124,7 +347,9 @@ class ServiceCRUD:
             service.unit_price = data.unit_price
 
             session.add(service)
+            DataVersionCRUD.bump(Service, session)
             session.commit()
+            services_catalog.invalidate()
             session.refresh(service)
 
             return True, "Service updated successfully.", service
@@ -138,10 +363,26 @@ class ServiceCRUD:
             return False, "Service not found.", None
 
         session.delete(service)
+        # Quote profile lines keep their service's name and prices, but no
+        # longer point at it
+        for line_model, profile_model in (
+            (QuoteProfileLine, ClientQuoteProfile),
+            (TempQuoteProfileLine, TempClientQuoteProfile)
+        ):
+            unlinked = session.exec(
+                update(line_model)
+                .where(line_model.service_id == id)
+                .values(service_id=None)
+            ).rowcount
+            if unlinked:
+                DataVersionCRUD.bump(profile_model, session)
+        DataVersionCRUD.bump(Service, session)
         session.commit()
+        services_catalog.invalidate()
 
         return True, "Service deleted successfully.", service
 
+@tracing.traced_methods
 class ClientQuoteProfileCRUD:
     @staticmethod
     def validate_data(
@@ -156,6 +397,7 @@ class ClientQuoteProfileCRUD:
     @staticmethod
     def create(
         data: ClientQuoteProfile,
+        lines: list[QuoteProfileLine],
         session: Session
     ) -> tuple[bool, str, ClientQuoteProfile | None]:
         (
@@ -167,6 +409,9 @@ class ClientQuoteProfileCRUD:
             return False, message, None
         
         session.add(data)
+        session.flush()
+        QuoteProfileLineCRUD.replace_lines(QuoteProfileLine, data.client_id, lines, session)
+        DataVersionCRUD.bump(ClientQuoteProfile, session)
         session.commit()
         session.refresh(data)
 
@@ -186,15 +431,22 @@ class ClientQuoteProfileCRUD:
     def update(
         quote_profile: ClientQuoteProfile,
         data: ClientQuoteProfile,
+        lines: list[QuoteProfileLine],
         session: Session
     ) -> tuple[bool, str, ClientQuoteProfile | None]:
         try:
             quote_profile.min_monthly_charge = data.min_monthly_charge
             quote_profile.premium_salt_upcharge = data.premium_salt_upcharge
-            quote_profile.services = data.services
             quote_profile.grand_total = data.grand_total
+            QuoteProfileLineCRUD.replace_lines(
+                QuoteProfileLine,
+                quote_profile.client_id,
+                lines,
+                session
+            )
 
             session.add(quote_profile)
+            DataVersionCRUD.bump(ClientQuoteProfile, session)
             session.commit()
             session.refresh(quote_profile)
 
@@ -211,11 +463,14 @@ class ClientQuoteProfileCRUD:
         if not quote_profile:
             return False, "Quote Profile not found.", None
 
+        session.exec(delete(QuoteProfileLine).where(QuoteProfileLine.client_id == id))
         session.delete(quote_profile)
+        DataVersionCRUD.bump(ClientQuoteProfile, session)
         session.commit()
 
         return True, "Quote Profile deleted successfully.", quote_profile
 
+@tracing.traced_methods
 class TempClientQuoteProfileCRUD:
     @staticmethod
     def validate_data(
@@ -230,6 +485,7 @@ class TempClientQuoteProfileCRUD:
     @staticmethod
     def create(
         data: TempClientQuoteProfile,
+        lines: list,
         session: Session
     ) -> tuple[bool, str, TempClientQuoteProfile | None]:
         (
@@ -241,6 +497,9 @@ class TempClientQuoteProfileCRUD:
             return False, message, None
         
         session.add(data)
+        session.flush()
+        QuoteProfileLineCRUD.replace_lines(TempQuoteProfileLine, data.client_id, lines, session)
+        DataVersionCRUD.bump(TempClientQuoteProfile, session)
         session.commit()
         session.refresh(data)
 
@@ -260,15 +519,22 @@ class TempClientQuoteProfileCRUD:
     def update(
         quote_profile: TempClientQuoteProfile,
         data: TempClientQuoteProfile,
+        lines: list,
         session: Session
     ) -> tuple[bool, str, TempClientQuoteProfile | None]:
         try:
             quote_profile.min_monthly_charge = data.min_monthly_charge
             quote_profile.premium_salt_upcharge = data.premium_salt_upcharge
-            quote_profile.services = data.services
             quote_profile.grand_total = data.grand_total
+            QuoteProfileLineCRUD.replace_lines(
+                TempQuoteProfileLine,
+                quote_profile.client_id,
+                lines,
+                session
+            )
 
             session.add(quote_profile)
+            DataVersionCRUD.bump(TempClientQuoteProfile, session)
             session.commit()
             session.refresh(quote_profile)
 
@@ -285,11 +551,14 @@ class TempClientQuoteProfileCRUD:
         if not quote_profile:
             return False, "Quote Profile not found.", None
 
+        session.exec(delete(TempQuoteProfileLine).where(TempQuoteProfileLine.client_id == id))
         session.delete(quote_profile)
+        DataVersionCRUD.bump(TempClientQuoteProfile, session)
         session.commit()
 
         return True, "Quote Profile deleted successfully.", quote_profile
 
+@tracing.traced_methods
 class QuoteCRUD:
     @staticmethod
     def validate_data(data: Quote) -> tuple[bool, str, Quote | None]:
@@ -306,6 +575,8 @@ class QuoteCRUD:
             return False, message, None
         
         session.add(data)
+        ActivityCRUD.record(data, session)
+        DataVersionCRUD.bump(Quote, session)
         session.commit()
         session.refresh(data)
 
@@ -325,11 +596,16 @@ class QuoteCRUD:
         session: Session
     ) -> tuple[bool, str, Quote | None]:
         try:
+            # Move the quote to the month of its new issue date and total
+            ActivityCRUD.record(quote, session, sign=-1)
             quote.quote_no = data.quote_no
             quote.issue_date = data.issue_date
             quote.pdf_html = data.pdf_html
+            quote.grand_total = data.grand_total
+            ActivityCRUD.record(quote, session)
 
             session.add(quote)
+            DataVersionCRUD.bump(Quote, session)
             session.commit()
             session.refresh(quote)
 
@@ -344,6 +620,8 @@ class QuoteCRUD:
             return False, "Quote not found.", None
 
         session.delete(quote)
+        ActivityCRUD.record(quote, session, sign=-1)
+        DataVersionCRUD.bump(Quote, session)
         session.commit()
         
         return True, "Quote deleted successfully.", quote
@@ -363,6 +641,24 @@ class QuoteCRUD:
         except Exception as e:
             return False, str(e), None
 
+    @staticmethod
+    def count_by_client_ids(
+        client_ids: list[int],
+        session: Session
+    ) -> tuple[bool, str, dict[int, int] | None]:
+        try:
+            statement = (
+                select(Quote.client_id, func.count())
+                .where(Quote.client_id.in_(client_ids))
+                .group_by(Quote.client_id)
+            )
+            counts = {client_id: 0 for client_id in client_ids}
+            counts.update(session.exec(statement).all())
+            return True, "Operation successful.", counts
+        except Exception as e:
+            return False, str(e), None
+
+@tracing.traced_methods
 class InvoiceCRUD:
     @staticmethod
     def validate_data(data: Invoice) -> tuple[bool, str, Invoice | None]:
@@ -382,11 +678,34 @@ class InvoiceCRUD:
             return False, message, None
 
         session.add(data)
+        ActivityCRUD.record(data, session)
+        DataVersionCRUD.bump(Invoice, session)
         session.commit()
         session.refresh(data)
 
         return True, "Invoice created successfully.", invoice
 
+    @staticmethod
+    def add_many(
+        invoices: list[Invoice],
+        session: Session
+    ) -> tuple[bool, str, list[Invoice] | None]:
+        """
+        Add invoices to the session in one batch, along with their dashboard
+        activity, and leave committing them to the caller.
+        """
+        for invoice in invoices:
+            is_valid, message, _ = InvoiceCRUD.validate_data(invoice)
+            if not is_valid:
+                return False, message, None
+
+        session.add_all(invoices)
+        for invoice in invoices:
+            ActivityCRUD.record(invoice, session)
+        DataVersionCRUD.bump(Invoice, session)
+
+        return True, "Invoices added successfully.", invoices
+
     @staticmethod
     def get(id: int, session: Session) -> tuple[bool, str, Invoice | None]:
         invoice = session.get(Invoice, id)
@@ -401,11 +720,16 @@ class InvoiceCRUD:
         session: Session
     ) -> tuple[bool, str, Invoice | None]:
         try:
+            # Move the invoice to the month of its new issue date and total
+            ActivityCRUD.record(invoice, session, sign=-1)
             invoice.invoice_no = data.invoice_no
             invoice.issue_date = data.issue_date
             invoice.pdf_html = data.pdf_html
+            invoice.grand_total = data.grand_total
+            ActivityCRUD.record(invoice, session)
 
             session.add(invoice)
+            DataVersionCRUD.bump(Invoice, session)
             session.commit()
             session.refresh(invoice)
 
@@ -420,6 +744,8 @@ class InvoiceCRUD:
             return False, "Invoice not found.", None
 
         session.delete(invoice)
+        ActivityCRUD.record(invoice, session, sign=-1)
+        DataVersionCRUD.bump(Invoice, session)
         session.commit()
 
         return True, "Invoice deleted successfully.", invoice
@@ -439,6 +765,24 @@ class InvoiceCRUD:
         except Exception as e:
             return False, str(e), None
 
+    @staticmethod
+    def count_by_client_ids(
+        client_ids: list[int],
+        session: Session
+    ) -> tuple[bool, str, dict[int, int] | None]:
+        try:
+            statement = (
+                select(Invoice.client_id, func.count())
+                .where(Invoice.client_id.in_(client_ids))
+                .group_by(Invoice.client_id)
+            )
+            counts = {client_id: 0 for client_id in client_ids}
+            counts.update(session.exec(statement).all())
+            return True, "Operation successful.", counts
+        except Exception as e:
+            return False, str(e), None
+
+@tracing.traced_methods
 class AppSettingCRUD:
     @staticmethod
     def validate_data(data: AppSetting) -> tuple[bool, str, AppSetting | None]:
@@ -458,6 +802,7 @@ class AppSettingCRUD:
             return False, message, None
 
         session.add(data)
+        DataVersionCRUD.bump(AppSetting, session)
         session.commit()
         session.refresh(data)
         
@@ -480,6 +825,7 @@ class AppSettingCRUD:
             app_setting.setting_value = data.setting_value
 
             session.add(app_setting)
+            DataVersionCRUD.bump(AppSetting, session)
             session.commit()
             session.refresh(app_setting)
 
@@ -497,6 +843,7 @@ class AppSettingCRUD:
             return False, "App Setting not found.", None
 
         session.delete(app_setting)
+        DataVersionCRUD.bump(AppSetting, session)
         session.commit()
         return True, "App Setting deleted successfully.", app_setting
 
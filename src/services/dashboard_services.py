@@ -0,0 +1,169 @@
+from decimal import Decimal
+from datetime import date
+
+from sqlalchemy import Integer, cast, literal, union_all
+from sqlmodel import Session, select, delete, func
+
+import tracing
+from database import sqlite_engine
+from models import Client, Quote, Invoice, MonthlyActivity, ClientActivity
+
+# Number of months shown in the dashboard's activity table
+RECENT_MONTHS = 12
+# Number of clients shown in the dashboard's top clients table
+TOP_CLIENTS = 5
+
+ACTIVITY_COLUMNS = ("quote_count", "quote_total_cents", "invoice_count", "invoice_total_cents")
+
+def _dollars(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+def _activity(row: MonthlyActivity | ClientActivity | None) -> dict:
+    """
+    The counts and totals (in dollars) of an activity row, or zeros.
+    """
+    return {
+        "quote_count": row.quote_count if row else 0,
+        "quote_total": _dollars(row.quote_total_cents if row else 0),
+        "invoice_count": row.invoice_count if row else 0,
+        "invoice_total": _dollars(row.invoice_total_cents if row else 0)
+    }
+
+def _recent_months(today: date, count: int) -> list[str]:
+    """
+    The `count` months up to and including today's, newest first, as
+    "YYYY-MM".
+    """
+    months = []
+    year, month = today.year, today.month
+    for _ in range(count):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return months
+
+def _document_activity(model: type[Quote] | type[Invoice], key):
+    """
+    One row per quote or invoice with the activity columns it adds to, for
+    rebuilding the activity tables with a single GROUP BY.
+    """
+    is_quote = model is Quote
+    total_cents = cast(func.round(model.grand_total * 100), Integer)
+    return select(
+        key.label("key"),
+        literal(1 if is_quote else 0).label("quote_count"),
+        (total_cents if is_quote else literal(0)).label("quote_total_cents"),
+        literal(0 if is_quote else 1).label("invoice_count"),
+        (literal(0) if is_quote else total_cents).label("invoice_total_cents")
+    )
+
+@tracing.traced_methods
+class DashboardServices:
+    @staticmethod
+    def get_summary(
+        session: Session,
+        today: date | None = None
+    ) -> tuple[bool, str, dict | None]:
+        """
+        Read the dashboard's KPIs from the activity tables, which are kept up
+        to date as quotes and invoices are created. Every query reads a fixed
+        number of rows by primary key or index, so the dashboard takes the
+        same time however long the quote and invoice history is.
+
+        Parameters:
+        - session: A SQLModel session for database access.
+        - today: The date to report the current month and year of (default
+        is today).
+
+        Returns:
+        - tuple[bool, str, dict | None]: Success, a status message, and the
+        activity of this month, the year to date and each of the last
+        RECENT_MONTHS months, plus the TOP_CLIENTS clients by invoiced total.
+        Each activity has quote and invoice counts and totals in dollars.
+        """
+        try:
+            today = today or date.today()
+            months = _recent_months(today, RECENT_MONTHS)
+            rows_by_month = {
+                row.month: row
+                for row in session.exec(
+                    select(MonthlyActivity).where(MonthlyActivity.month.in_(months))
+                )
+            }
+
+            year_to_date = session.exec(
+                select(*(func.coalesce(func.sum(getattr(MonthlyActivity, column)), 0) for column in ACTIVITY_COLUMNS))
+                .where(MonthlyActivity.month.between(f"{today.year:04d}-01", f"{today.year:04d}-12"))
+            ).one()
+
+            top_clients = session.exec(
+                select(ClientActivity, Client.name, Client.business_name)
+                .join(Client, Client.id == ClientActivity.client_id)
+                .where(ClientActivity.invoice_total_cents > 0)
+                .order_by(ClientActivity.invoice_total_cents.desc())
+                .limit(TOP_CLIENTS)
+            ).all()
+
+            return True, "Dashboard summary found.", {
+                "this_month": _activity(rows_by_month.get(months[0])),
+                "year_to_date": _activity(MonthlyActivity(**dict(zip(ACTIVITY_COLUMNS, year_to_date)))),
+                "months": [
+                    {"month": month, **_activity(rows_by_month.get(month))}
+                    for month in months
+                ],
+                "top_clients": [
+                    {
+                        "client_id": activity.client_id,
+                        "name": name,
+                        "business_name": business_name,
+                        **_activity(activity)
+                    }
+                    for activity, name, business_name in top_clients
+                ]
+            }
+        except Exception as e:
+            return False, str(e), None
+
+    @staticmethod
+    def rebuild() -> tuple[bool, str, int]:
+        """
+        Rebuild the monthly and per-client activity tables from every quote
+        and invoice, in one transaction. Only needed if the tables were
+        changed by hand or the documents were changed outside of the CRUD
+        services; quotes and invoices without an issue date count towards
+        their client but no month.
+
+        Returns:
+        - tuple[bool, str, int]: Success, a status message, and the number of
+        months with activity.
+        """
+        try:
+            with Session(sqlite_engine) as session:
+                session.exec(delete(MonthlyActivity))
+                session.exec(delete(ClientActivity))
+
+                for model, key in ((MonthlyActivity, "month"), (ClientActivity, "client_id")):
+                    documents = union_all(*(
+                        _document_activity(
+                            document_model,
+                            func.strftime("%Y-%m", document_model.issue_date)
+                            if key == "month" else document_model.client_id
+                        )
+                        for document_model in (Quote, Invoice)
+                    )).subquery()
+                    session.exec(
+                        model.__table__.insert().from_select(
+                            (key, *ACTIVITY_COLUMNS),
+                            select(
+                                documents.c.key,
+                                *(func.sum(documents.c[column]) for column in ACTIVITY_COLUMNS)
+                            )
+                            .where(documents.c.key.is_not(None))
+                            .group_by(documents.c.key)
+                        )
+                    )
+
+                months = session.exec(select(func.count()).select_from(MonthlyActivity)).one()
+                session.commit()
+            return True, f"Rebuilt the dashboard activity ({months} months).", months
+        except Exception as e:
+            return False, str(e), 0
\ No newline at end of file
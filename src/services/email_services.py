@@ -1,24 +1,208 @@
 import os
+import re
+import time
+import asyncio
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable
 from dotenv import load_dotenv
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+import tracing
+
+if TYPE_CHECKING:
+    from fastapi_mail import FastMail, MessageSchema
 
 load_dotenv()
 
-# FastMail configuration
-mail_conf = ConnectionConfig(
-    MAIL_USERNAME=os.getenv("MAIL_USERNAME"),
-    MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
-    MAIL_FROM=os.getenv("MAIL_USERNAME"),
-    MAIL_PORT=587,
-    MAIL_SERVER=os.getenv("MAIL_SERVER"),
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-)
+@lru_cache(maxsize=1)
+def get_fastmail() -> "FastMail":
+    """
+    Build the FastMail client on first use. fastapi-mail (and the pydantic
+    models and DNS tooling it pulls in) is only imported when the first email
+    is sent or the app prewarms it, which keeps worker startup fast.
+    """
+    from fastapi_mail import FastMail, ConnectionConfig
+
+    # FastMail configuration
+    mail_conf = ConnectionConfig(
+        MAIL_USERNAME=os.getenv("MAIL_USERNAME"),
+        MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
+        MAIL_FROM=os.getenv("MAIL_USERNAME"),
+        MAIL_PORT=int(os.getenv("MAIL_PORT", "587")),
+        MAIL_SERVER=os.getenv("MAIL_SERVER"),
+        MAIL_STARTTLS=os.getenv("MAIL_STARTTLS", "true").lower() == "true",
+        MAIL_SSL_TLS=os.getenv("MAIL_SSL_TLS", "false").lower() == "true",
+        USE_CREDENTIALS=os.getenv("MAIL_USE_CREDENTIALS", "true").lower() == "true",
+    )
+    return FastMail(mail_conf)
+
+# Sustained rate and burst of outgoing emails, per process. Set them to the
+# SMTP provider's sending limits (divided by the number of processes).
+MAIL_RATE_PER_MINUTE = float(os.getenv("MAIL_RATE_PER_MINUTE", "60"))
+MAIL_BURST = int(os.getenv("MAIL_BURST", "10"))
+# Lowest rate the limiter backs off to when the provider throttles
+MAIL_MIN_RATE_PER_MINUTE = float(os.getenv("MAIL_MIN_RATE_PER_MINUTE", "6"))
+# Pause after the first throttle response in a row, doubled for each further
+# one, up to MAIL_MAX_BACKOFF_SECONDS
+MAIL_BACKOFF_SECONDS = float(os.getenv("MAIL_BACKOFF_SECONDS", "2"))
+MAIL_MAX_BACKOFF_SECONDS = float(os.getenv("MAIL_MAX_BACKOFF_SECONDS", "60"))
+# Times an email is retried after a throttle response before it fails
+MAIL_THROTTLE_RETRIES = int(os.getenv("MAIL_THROTTLE_RETRIES", "3"))
+# Number of successful sends it takes to climb back from the lowest rate to
+# MAIL_RATE_PER_MINUTE
+MAIL_RECOVERY_SENDS = 20
+
+# SMTP reply codes show up as "(421, '4.7.0 Try again later')" in the errors
+# of aiosmtplib and fastapi-mail
+SMTP_TRANSIENT_REPLY = re.compile(r"\(4\d\d,")
+
+def is_throttled(error: Exception) -> bool:
+    """
+    Whether an SMTP error is a transient (4xx) reply, the way Gmail and
+    Office 365 turn away senders over their rate or connection limits.
+    """
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return 400 <= code < 500
+    return bool(SMTP_TRANSIENT_REPLY.search(str(error)))
+
+class MailRateLimiter:
+    """
+    Token bucket pacing outgoing emails: up to `burst` emails go out at once,
+    then one per token refilled at the current rate. The rate adapts to the
+    provider (additive increase, multiplicative decrease): each throttle
+    response halves it, down to `min_rate_per_minute`, and pauses sending,
+    and each successful send raises it again towards `rate_per_minute`.
+
+    Senders reserve a token and sleep until it is theirs, so the bucket can
+    be shared by any number of concurrent sends, threads and event loops.
+    """
+    def __init__(
+        self,
+        rate_per_minute: float,
+        burst: int,
+        min_rate_per_minute: float
+    ):
+        self.max_rate = rate_per_minute / 60
+        self.min_rate = min(min_rate_per_minute, rate_per_minute) / 60
+        self.rate = self.max_rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._throttle_streak = 0
+        # Bumped by every backoff; sends reserved before it were already in
+        # flight, and their throttle responses do not back off again
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> tuple[float, int]:
+        """
+        Take a token, going into debt if the bucket is empty.
+
+        Returns:
+        - tuple[float, int]: The seconds to wait before sending, until the
+        token is refilled, and the reservation's epoch for `throttled`.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate), self._epoch
+
+    def capacity(self, seconds: float) -> int:
+        """
+        Estimate how many emails can be sent within the given number of
+        seconds at the current rate, not counting throttle retries.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0, int(self._tokens + seconds * self.rate))
+
+    def succeeded(self) -> None:
+        """
+        Raise the rate by a step after a successful send.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._throttle_streak = 0
+            self.rate = min(
+                self.max_rate,
+                self.rate + (self.max_rate - self.min_rate) / MAIL_RECOVERY_SENDS
+            )
 
-fastmail = FastMail(mail_conf)
+    def throttled(self, epoch: int) -> float:
+        """
+        Halve the rate and pause sending after a throttle response. The pause
+        is taken out of the bucket as debt, so every sender waits it out.
+        Responses to sends reserved before the last backoff are ignored, a
+        burst of them is one throttle, not many.
 
+        Parameters:
+        - epoch: The epoch of the throttled send's reservation.
+
+        Returns:
+        - float: The length of the pause in seconds, 0 if it was ignored.
+        """
+        with self._lock:
+            if epoch != self._epoch:
+                return 0.0
+            self._epoch += 1
+            self._refill(time.monotonic())
+            self._throttle_streak += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            backoff = min(
+                MAIL_MAX_BACKOFF_SECONDS,
+                MAIL_BACKOFF_SECONDS * 2 ** (self._throttle_streak - 1)
+            )
+            self._tokens = min(self._tokens, 0.0) - backoff * self.rate
+            return backoff
+
+# The limiter every email of the process goes through
+mail_rate_limiter = MailRateLimiter(MAIL_RATE_PER_MINUTE, MAIL_BURST, MAIL_MIN_RATE_PER_MINUTE)
+
+async def _send_paced(
+    message: "MessageSchema",
+    before_send: Callable[[], None] | None = None
+) -> None:
+    """
+    Send a message through the rate limiter, retrying it up to
+    MAIL_THROTTLE_RETRIES times after throttle responses. `before_send` is
+    called right before each attempt, once the limiter's wait is over, and
+    may raise to give up on the message.
+    """
+    for attempt in range(MAIL_THROTTLE_RETRIES + 1):
+        delay, epoch = mail_rate_limiter.reserve()
+        if delay:
+            with tracing.span("EmailServices.rate_limit_wait", seconds=round(delay, 3)):
+                await asyncio.sleep(delay)
+        if before_send is not None:
+            before_send()
+        try:
+            await get_fastmail().send_message(message)
+        except Exception as e:
+            if attempt == MAIL_THROTTLE_RETRIES or not is_throttled(e):
+                raise
+            mail_rate_limiter.throttled(epoch)
+            continue
+        mail_rate_limiter.succeeded()
+        return
+
+@tracing.traced_methods
 class EmailServices:
+    @staticmethod
+    def prewarm() -> tuple[bool, str, None]:
+        """
+        Import fastapi-mail and build the mail client ahead of the first send.
+        """
+        try:
+            get_fastmail()
+            return True, "Email services loaded.", None
+        except Exception as e:
+            return False, str(e), None
+
     @staticmethod
     async def send_email(
         subject: str,
@@ -26,8 +210,11 @@ class EmailServices:
         body: str,
         subtype: str,
         attachments: list[dict],
-    ) -> tuple[bool, str, MessageSchema | None]:
+        before_send: Callable[[], None] | None = None
+    ) -> tuple[bool, str, "MessageSchema | None"]:
         try:
+            from fastapi_mail import MessageSchema
+
             message = MessageSchema(
                 subject=subject,
                 recipients=recipients,
@@ -35,7 +222,7 @@ class EmailServices:
                 subtype=subtype,
                 attachments=attachments
             )
-            await fastmail.send_message(message)
+            await _send_paced(message, before_send)
             return True, "Email sent.", message
         except Exception as e:
             # TODO - log error
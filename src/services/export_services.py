@@ -0,0 +1,168 @@
+import io
+import os
+import csv
+import json
+import functools
+from datetime import date
+from typing import Iterator
+
+from sqlalchemy import Select
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlmodel import Session, select
+
+import tracing
+from database import sqlite_engine
+from models import Client, Quote, Invoice
+
+# Number of rows fetched from the database at a time while exporting
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Size the CSV output is buffered up to before it is sent
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson"
+}
+
+CLIENT_COLUMNS = (
+    "id",
+    "name",
+    "business_name",
+    "street_address",
+    "city",
+    "state",
+    "zip_code",
+    "email",
+    "phone"
+)
+# The client columns exported alongside each quote and invoice
+JOINED_CLIENT_COLUMNS = tuple(
+    (f"client_{column}", getattr(Client, column))
+    for column in CLIENT_COLUMNS if column != "id"
+)
+
+def _client_rows() -> tuple[tuple[str, ...], Select, InstrumentedAttribute]:
+    """
+    The export columns, query and ID column of the clients table.
+    """
+    statement = select(*(getattr(Client, column) for column in CLIENT_COLUMNS))
+    return CLIENT_COLUMNS, statement, Client.id
+
+def _document_rows(
+    model: type[Quote] | type[Invoice],
+    number_column: str
+) -> tuple[tuple[str, ...], Select, InstrumentedAttribute]:
+    """
+    The export columns, query and ID column of the quotes or invoices table,
+    joined with the clients table. The PDF HTML is left out, it is only needed to
+    re-render the document.
+    """
+    columns = ("id", number_column, "issue_date", "client_id")
+    statement = (
+        select(
+            *(getattr(model, column) for column in columns),
+            *(column for _, column in JOINED_CLIENT_COLUMNS)
+        )
+        # Outer join so documents of deleted clients are still exported
+        .outerjoin(Client, Client.id == model.client_id)
+    )
+    return columns + tuple(name for name, _ in JOINED_CLIENT_COLUMNS), statement, model.id
+
+EXPORTS = {
+    "clients": _client_rows,
+    "quotes": functools.partial(_document_rows, Quote, "quote_no"),
+    "invoices": functools.partial(_document_rows, Invoice, "invoice_no")
+}
+
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+def _stream(
+    statement: Select,
+    id_column: InstrumentedAttribute,
+    columns: tuple[str, ...],
+    export_format: str
+) -> Iterator[bytes]:
+    """
+    Run the export query EXPORT_BATCH_SIZE rows at a time, paging by ID, and
+    encode each batch as it arrives. Every batch is read in a short session
+    of its own, closed before the batch is sent, since the response is sent
+    after the request's session is closed and an open read would keep
+    SQLite's lock, and every write waiting on it, for the whole download.
+    The ID is the first export column.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == "csv":
+        # Send the header before the query runs, so the download starts at once
+        writer.writerow(columns)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+    last_id = 0
+    while True:
+        with Session(sqlite_engine) as session:
+            partition = session.exec(
+                statement
+                .where(id_column > last_id)
+                .order_by(id_column)
+                .limit(EXPORT_BATCH_SIZE)
+            ).all()
+        if not partition:
+            break
+        last_id = partition[-1][0]
+
+        if export_format == "csv":
+            writer.writerows(partition)
+            if buffer.tell() < EXPORT_CHUNK_SIZE:
+                continue
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            yield "".join(
+                json.dumps(dict(zip(columns, row)), default=_json_default) + "\n"
+                for row in partition
+            ).encode("utf-8")
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+@tracing.traced_methods
+class ExportServices:
+    @staticmethod
+    def export_rows(
+        export_name: str,
+        export_format: str
+    ) -> tuple[bool, str, tuple[Iterator[bytes], str, str] | None]:
+        """
+        Prepare a streamed export of the clients, quotes or invoices table.
+        Quotes and invoices include the columns of the client they belong to.
+        Nothing is read until the returned iterator is consumed, and rows are
+        fetched and encoded a batch at a time, so an export of any size runs
+        in constant memory.
+
+        Parameters:
+        - export_name: "clients", "quotes" or "invoices".
+        - export_format: "csv" or "jsonl" (one JSON object per line).
+
+        Returns:
+        - tuple[bool, str, tuple[Iterator[bytes], str, str] | None]: Success,
+        a status message, and the iterator over the encoded export, its media
+        type, and a file name for it.
+        """
+        if export_name not in EXPORTS:
+            return False, f"Unknown export {export_name!r}.", None
+        if export_format not in EXPORT_FORMATS:
+            return False, f"Unknown export format {export_format!r}, use one of: {', '.join(EXPORT_FORMATS)}.", None
+
+        columns, statement, id_column = EXPORTS[export_name]()
+        file_name = f"{export_name}_{date.today().isoformat()}.{export_format}"
+        return (
+            True,
+            "Export ready.",
+            (_stream(statement, id_column, columns, export_format), EXPORT_FORMATS[export_format], file_name)
+        )
\ No newline at end of file
@@ -0,0 +1,152 @@
+import os
+import csv
+import itertools
+from typing import Iterable, Iterator, TextIO
+
+from sqlmodel import Session
+
+import tracing
+from models import Client
+from .crud_services import DataVersionCRUD
+
+# Number of CSV rows validated and inserted per transaction
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# Row errors beyond this many are counted but not listed in the report, so
+# the report stays small however bad the file is
+MAX_REPORTED_ERRORS = 1000
+
+CLIENT_COLUMNS = (
+    "name",
+    "business_name",
+    "street_address",
+    "city",
+    "state",
+    "zip_code",
+    "email",
+    "phone"
+)
+# Columns that must not be blank. A blank business name defaults to the
+# client's name, the same way the PDFs treat a client without a business.
+REQUIRED_CLIENT_COLUMNS = ("name", "street_address", "city", "state", "zip_code")
+
+def _normalize_header(header: str) -> str:
+    """
+    Accept the form field names ("business-name") and spaced or capitalized
+    headers ("Business Name") as well as the column names ("business_name").
+    """
+    return header.strip().lower().replace("-", "_").replace(" ", "_")
+
+def _validate_row(row: dict) -> tuple[dict | None, list[str]]:
+    """
+    Validate one CSV row.
+
+    Returns:
+    - tuple[dict | None, list[str]]: The client's column values if the row is
+    valid, and the row's errors.
+    """
+    errors = []
+    if None in row:
+        errors.append("Row has more fields than the header.")
+    values = {
+        column: (row.get(column) or "").strip()
+        for column in CLIENT_COLUMNS
+    }
+    for column in REQUIRED_CLIENT_COLUMNS:
+        if not values[column]:
+            errors.append(f"{column} is required.")
+    if values["email"] and "@" not in values["email"]:
+        errors.append(f"email {values['email']!r} is not an email address.")
+    if not values["business_name"]:
+        values["business_name"] = values["name"]
+    if errors:
+        return None, errors
+    # Every client column is a string, so the values need no further
+    # conversion (and building a model per row would dominate the import)
+    return values, []
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[list[tuple[int, dict]]]:
+    """
+    Split rows into lists of (row number, row) pairs, numbered the way a
+    spreadsheet shows them: the header is row 1.
+    """
+    numbered_rows = enumerate(rows, start=2)
+    while chunk := list(itertools.islice(numbered_rows, size)):
+        yield chunk
+
+@tracing.traced_methods
+class ImportServices:
+    @staticmethod
+    def read_client_csv(csv_file: TextIO) -> tuple[bool, str, csv.DictReader | None]:
+        """
+        Read the header row of a client CSV file and check that it has the
+        required columns.
+
+        Parameters:
+        - csv_file: The CSV file, opened in text mode with `newline=""`.
+
+        Returns:
+        - tuple[bool, str, csv.DictReader | None]: Success, a status message,
+        and a reader over the file's remaining rows, keyed by column name.
+        """
+        try:
+            reader = csv.DictReader(csv_file)
+            headers = [_normalize_header(header) for header in reader.fieldnames or []]
+        except (csv.Error, UnicodeDecodeError) as e:
+            return False, f"Could not read the CSV file: {e}", None
+        missing_columns = [column for column in REQUIRED_CLIENT_COLUMNS if column not in headers]
+        if missing_columns:
+            return False, f"CSV file is missing columns: {', '.join(missing_columns)}.", None
+        reader.fieldnames = headers
+        return True, "CSV file read.", reader
+
+    @staticmethod
+    def import_clients(
+        rows: Iterable[dict],
+        session: Session
+    ) -> tuple[bool, str, dict | None]:
+        """
+        Import clients from CSV rows. The rows are read as a stream,
+        IMPORT_BATCH_SIZE at a time; the valid rows of each chunk are inserted
+        in one transaction and invalid rows are reported with their row
+        numbers, so memory use does not grow with the file. Chunks committed
+        before an unexpected error stay imported.
+
+        Parameters:
+        - rows: The rows of a client CSV file, from `read_client_csv`.
+        - session: A SQLModel session for database access.
+
+        Returns:
+        - tuple[bool, str, dict | None]: Success, a status message, and a
+        report with the number of rows imported and rejected and the first
+        MAX_REPORTED_ERRORS row errors.
+        """
+        report = {"imported": 0, "rejected": 0, "errors": [], "errors_truncated": False}
+        try:
+            for chunk in _chunks(rows, IMPORT_BATCH_SIZE):
+                with tracing.span("ImportServices.import_clients.chunk", rows=len(chunk)):
+                    valid_rows = []
+                    for row_number, row in chunk:
+                        values, errors = _validate_row(row)
+                        if values is not None:
+                            valid_rows.append(values)
+                            continue
+                        report["rejected"] += 1
+                        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                            report["errors"].append({"row": row_number, "errors": errors})
+                        else:
+                            report["errors_truncated"] = True
+
+                    if valid_rows:
+                        session.connection().execute(Client.__table__.insert(), valid_rows)
+                        DataVersionCRUD.bump(Client, session)
+                        session.commit()
+                        report["imported"] += len(valid_rows)
+
+            return (
+                True,
+                f"Imported {report['imported']} clients, rejected {report['rejected']} rows.",
+                report
+            )
+        except Exception as e:
+            session.rollback()
+            return False, f"Import failed after importing {report['imported']} clients: {e}", None
\ No newline at end of file
@@ -0,0 +1,237 @@
+import re
+import json
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from sqlalchemy import bindparam, inspect, text
+from sqlmodel import SQLModel, Session, select
+
+import tracing
+from database import sqlite_engine
+from models import (
+    ClientQuoteProfile,
+    TempClientQuoteProfile,
+    QuoteProfileLine,
+    TempQuoteProfileLine,
+    Quote,
+    Invoice,
+    ClientActivity
+)
+from .crud_services import DataVersionCRUD
+from .catalog_services import services_catalog
+from .dashboard_services import DashboardServices
+
+# Number of quote profiles (or quotes and invoices) migrated per transaction
+MIGRATION_BATCH_SIZE = 500
+
+# The grand total cell of the quote and invoice PDFs' HTML, see
+# `PDFServices.generate_html_source`
+GRAND_TOTAL_PATTERN = re.compile(r"Total \(USD\)</td>\s*<td[^>]*>\s*(-?[0-9]+(?:\.[0-9]+)?)\s*</td>")
+
+def _to_decimal(value, places: str) -> Decimal:
+    """
+    Convert a number from a legacy JSON line, which may be a number, a string
+    or missing, to a Decimal with the line column's number of places.
+    """
+    try:
+        return Decimal(str(value if value not in (None, "") else 0)).quantize(
+            Decimal(places),
+            ROUND_HALF_UP
+        )
+    except InvalidOperation:
+        return Decimal(places)
+
+def _lines_from_json(
+    line_model: type[QuoteProfileLine] | type[TempQuoteProfileLine],
+    client_id: int,
+    services_json: str,
+    service_ids_by_name: dict[str, int]
+) -> list[QuoteProfileLine] | list[TempQuoteProfileLine]:
+    """
+    Convert a quote profile's legacy JSON list of lines to line rows.
+    """
+    lines = []
+    for position, line in enumerate(json.loads(services_json) or []):
+        service_name = str(line.get("service_name") or "")
+        lines.append(line_model(
+            client_id=client_id,
+            position=position,
+            service_id=service_ids_by_name.get(service_name, line.get("service_id")),
+            service_name=service_name,
+            quantity=_to_decimal(line.get("quantity"), "0.0000"),
+            per_unit=str(line.get("per_unit") or ""),
+            unit_price=_to_decimal(line.get("unit_price"), "0.00"),
+            tax=_to_decimal(line.get("tax"), "0.0000"),
+            total_price=_to_decimal(line.get("total_price"), "0.00")
+        ))
+    return lines
+
+@tracing.traced_methods
+class MigrationServices:
+    @staticmethod
+    def create_missing_indexes() -> tuple[bool, str, int]:
+        """
+        Create the indexes of the models that are missing from tables created
+        before the indexes were added, which `create_all` does not do.
+
+        Returns:
+        - tuple[bool, str, int]: Success, a status message, and the number of
+        indexes created.
+        """
+        try:
+            existing = {
+                index["name"]
+                for table_name in inspect(sqlite_engine).get_table_names()
+                for index in inspect(sqlite_engine).get_indexes(table_name)
+            }
+            created = 0
+            for table in SQLModel.metadata.sorted_tables:
+                for index in table.indexes:
+                    if index.name not in existing:
+                        index.create(sqlite_engine, checkfirst=True)
+                        created += 1
+            return True, f"Created {created} indexes.", created
+        except Exception as e:
+            return False, str(e), 0
+
+    @staticmethod
+    def migrate_quote_profile_lines() -> tuple[bool, str, int]:
+        """
+        Move the lines of quote profiles saved before the line tables existed
+        out of the profiles' legacy `services` JSON column and into the
+        QuoteProfileLine and TempQuoteProfileLine tables. Migrated profiles
+        have their JSON column cleared, so running the migration again only
+        picks up what is left. Also drops the reverse index table that the
+        line tables replace. Profiles are migrated MIGRATION_BATCH_SIZE at a
+        time, one transaction per batch.
+
+        Returns:
+        - tuple[bool, str, int]: Success, a status message, and the number of
+        quote profiles migrated.
+        """
+        try:
+            migrated = 0
+            with Session(sqlite_engine) as session:
+                service_ids_by_name = {}
+                for service in services_catalog.get(session).services:
+                    service_ids_by_name.setdefault(service.name, service.id)
+
+            for profile_model, line_model in (
+                (ClientQuoteProfile, QuoteProfileLine),
+                (TempClientQuoteProfile, TempQuoteProfileLine)
+            ):
+                table_name = profile_model.__tablename__
+                columns = inspect(sqlite_engine).get_columns(table_name)
+                if "services" not in {column["name"] for column in columns}:
+                    continue
+
+                while True:
+                    with Session(sqlite_engine) as session:
+                        rows = session.execute(
+                            text(
+                                f"SELECT client_id, services FROM {table_name} "
+                                "WHERE services IS NOT NULL LIMIT :limit"
+                            ).bindparams(limit=MIGRATION_BATCH_SIZE)
+                        ).all()
+                        if not rows:
+                            break
+
+                        client_ids = [client_id for client_id, _ in rows]
+                        # Profiles that already have lines were saved since
+                        # the line tables were added, so their JSON is stale
+                        migrated_client_ids = set(session.exec(
+                            select(line_model.client_id)
+                            .where(line_model.client_id.in_(client_ids))
+                        ).all())
+                        for client_id, services_json in rows:
+                            if client_id not in migrated_client_ids:
+                                session.add_all(_lines_from_json(
+                                    line_model,
+                                    client_id,
+                                    services_json,
+                                    service_ids_by_name
+                                ))
+
+                        session.execute(
+                            text(
+                                f"UPDATE {table_name} SET services = NULL "
+                                "WHERE client_id IN :client_ids"
+                            ).bindparams(bindparam("client_ids", client_ids, expanding=True))
+                        )
+                        DataVersionCRUD.bump(profile_model, session)
+                        session.commit()
+                        migrated += len(rows)
+
+            with sqlite_engine.begin() as connection:
+                connection.execute(text("DROP TABLE IF EXISTS quoteprofileserviceindex"))
+
+            return True, f"Migrated {migrated} quote profiles.", migrated
+        except Exception as e:
+            return False, str(e), 0
+
+    @staticmethod
+    def migrate_document_totals() -> tuple[bool, str, int]:
+        """
+        Add the `grand_total` column to quotes and invoices saved before it
+        existed, filling it in from the grand total printed in each document's
+        stored HTML (documents without one keep a total of 0). Then build the
+        dashboard's activity tables if they are empty but there are quotes or
+        invoices, which is the case the first time the app starts with them.
+        Documents are backfilled MIGRATION_BATCH_SIZE at a time, one
+        transaction per batch.
+
+        Returns:
+        - tuple[bool, str, int]: Success, a status message, and the number of
+        quotes and invoices whose grand total was backfilled.
+        """
+        try:
+            backfilled = 0
+            for model in (Quote, Invoice):
+                table_name = model.__tablename__
+                columns = inspect(sqlite_engine).get_columns(table_name)
+                if "grand_total" in {column["name"] for column in columns}:
+                    continue
+
+                with sqlite_engine.begin() as connection:
+                    connection.execute(text(
+                        f"ALTER TABLE {table_name} "
+                        "ADD COLUMN grand_total NUMERIC(12, 2) NOT NULL DEFAULT 0"
+                    ))
+
+                last_id = 0
+                while True:
+                    with Session(sqlite_engine) as session:
+                        rows = session.exec(
+                            select(model.id, model.pdf_html)
+                            .where(model.id > last_id)
+                            .order_by(model.id)
+                            .limit(MIGRATION_BATCH_SIZE)
+                        ).all()
+                        if not rows:
+                            break
+
+                        for document_id, pdf_html in rows:
+                            match = GRAND_TOTAL_PATTERN.search(pdf_html or "")
+                            if match:
+                                session.execute(
+                                    text(f"UPDATE {table_name} SET grand_total = :grand_total WHERE id = :id"),
+                                    {"grand_total": str(_to_decimal(match.group(1), "0.00")), "id": document_id}
+                                )
+                                backfilled += 1
+                        DataVersionCRUD.bump(model, session)
+                        session.commit()
+                        last_id = rows[-1][0]
+
+            with Session(sqlite_engine) as session:
+                activity_built = session.exec(select(ClientActivity.client_id).limit(1)).first() is not None
+                has_documents = any(
+                    session.exec(select(model.id).limit(1)).first() is not None
+                    for model in (Quote, Invoice)
+                )
+            if has_documents and not activity_built:
+                success, message, _ = DashboardServices.rebuild()
+                if not success:
+                    return False, message, backfilled
+
+            return True, f"Backfilled the grand totals of {backfilled} quotes and invoices.", backfilled
+        except Exception as e:
+            return False, str(e), 0
\ No newline at end of file
@@ -0,0 +1,317 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+from sqlmodel import Session, select, func
+
+import tracing
+from database import sqlite_engine
+from models import OutboxEmail
+from .email_services import EmailServices, mail_rate_limiter
+
+# Number of emails a worker claims and sends at a time
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+# Seconds a worker waits before looking for new emails when the outbox is
+# empty
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+# A worker that has not sent an email this long after claiming it, or after
+# last renewing its claim, is taken to have crashed, and the email is sent
+# again. The claim is renewed right before every send and throttle retry.
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+# Attempts before an email is given up on, and the wait before the first
+# retry, doubled for each further one (up to an hour)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_SECONDS = int(os.getenv("OUTBOX_RETRY_SECONDS", "30"))
+MAX_RETRY_SECONDS = 3600
+
+OUTBOX_STATUSES = ("pending", "sending", "sent", "failed")
+
+def _claim(limit: int) -> list[OutboxEmail]:
+    """
+    Claim the next due emails for this worker: pending emails whose next
+    attempt is due, and emails left "sending" by a crashed worker. The claim
+    is a single UPDATE, so two workers never claim the same email.
+    """
+    now = datetime.now(timezone.utc)
+    due = (
+        select(OutboxEmail.id)
+        .where(
+            ((OutboxEmail.status == "pending") & (OutboxEmail.next_attempt_at <= now))
+            | ((OutboxEmail.status == "sending") & (OutboxEmail.locked_until < now))
+        )
+        .order_by(OutboxEmail.id)
+        .limit(limit)
+    )
+    with Session(sqlite_engine) as session:
+        claimed_ids = session.exec(
+            update(OutboxEmail)
+            .where(OutboxEmail.id.in_(due.scalar_subquery()))
+            .values(
+                status="sending",
+                locked_until=now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                attempts=OutboxEmail.attempts + 1
+            )
+            .returning(OutboxEmail.id)
+        ).scalars().all()
+        session.commit()
+        if not claimed_ids:
+            return []
+        emails = session.exec(
+            select(OutboxEmail).where(OutboxEmail.id.in_(claimed_ids)).order_by(OutboxEmail.id)
+        ).all()
+        session.expunge_all()
+        return list(emails)
+
+class OutboxClaimLost(Exception):
+    """
+    Raised when a worker's claim on an email ran out and another worker took
+    the email over.
+    """
+
+def _renew_claim(email: OutboxEmail) -> None:
+    """
+    Extend the claim on an email by OUTBOX_LEASE_SECONDS, right before it is
+    sent. The email rate limiter may hold a claimed email back for longer
+    than the lease, and another worker must not take over an email that is
+    about to be sent.
+
+    Raises:
+    - OutboxClaimLost: If another worker already took the email over.
+    """
+    now = datetime.now(timezone.utc)
+    with Session(sqlite_engine) as session:
+        renewed = session.exec(
+            update(OutboxEmail)
+            .where(OutboxEmail.id == email.id)
+            .where(OutboxEmail.status == "sending")
+            .where(OutboxEmail.attempts == email.attempts)
+            .values(locked_until=now + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+        ).rowcount
+        session.commit()
+    if not renewed:
+        raise OutboxClaimLost(f"Outbox email {email.id} was taken over by another worker.")
+
+def _record_result(email: OutboxEmail, success: bool, message: str) -> str:
+    """
+    Mark a claimed email sent, or schedule its next attempt, or give up on it
+    after OUTBOX_MAX_ATTEMPTS.
+
+    Returns:
+    - str: The email's new status, or "lost" if another worker took the
+    email over.
+    """
+    now = datetime.now(timezone.utc)
+    if success:
+        values = {"status": "sent", "sent_at": now, "last_error": None}
+    elif email.attempts >= OUTBOX_MAX_ATTEMPTS:
+        values = {"status": "failed", "last_error": message}
+    else:
+        retry_seconds = min(MAX_RETRY_SECONDS, OUTBOX_RETRY_SECONDS * 2 ** (email.attempts - 1))
+        values = {
+            "status": "pending",
+            "next_attempt_at": now + timedelta(seconds=retry_seconds),
+            "last_error": message
+        }
+    with Session(sqlite_engine) as session:
+        # Only while the claim is held, a worker that took over the email
+        # after the lease ran out owns it now
+        recorded = session.exec(
+            update(OutboxEmail)
+            .where(OutboxEmail.id == email.id)
+            .where(OutboxEmail.status == "sending")
+            .where(OutboxEmail.attempts == email.attempts)
+            .values(locked_until=None, **values)
+        ).rowcount
+        session.commit()
+    return values["status"] if recorded else "lost"
+
+@tracing.traced_methods
+class OutboxServices:
+    @staticmethod
+    def enqueue(
+        session: Session,
+        subject: str,
+        recipients: list[str],
+        body: str,
+        subtype: str,
+        attachments: list[dict],
+        document_type: str | None = None,
+        document_no: str | None = None
+    ) -> tuple[bool, str, OutboxEmail | None]:
+        """
+        Add an email to the outbox, for the outbox worker to send. The email
+        is only added to the session: it is committed in the same
+        transaction as the quote or invoice it sends, e.g. by the CRUD
+        create, so either both are saved or neither is.
+
+        Parameters:
+        - session: A SQLModel session for database access.
+        - subject, recipients, body, subtype, attachments: The email, as
+        taken by `EmailServices.send_email`. Attachments are read from disk
+        when the email is sent.
+        - document_type: "quote" or "invoice", if the email sends one.
+        - document_no: The quote or invoice number, if the email sends one.
+
+        Returns:
+        - tuple[bool, str, OutboxEmail | None]: Success, a status message, and
+        the queued email.
+        """
+        try:
+            now = datetime.now(timezone.utc)
+            email = OutboxEmail(
+                subject=subject,
+                recipients=json.dumps(recipients),
+                body=body,
+                subtype=subtype,
+                attachments=json.dumps(attachments),
+                document_type=document_type,
+                document_no=document_no,
+                next_attempt_at=now,
+                created_at=now
+            )
+            session.add(email)
+            return True, "Email queued.", email
+        except Exception as e:
+            return False, str(e), None
+
+    @staticmethod
+    async def send_due(limit: int = OUTBOX_BATCH_SIZE) -> tuple[bool, str, dict | None]:
+        """
+        Claim up to `limit` due emails, and no more than the email rate
+        limiter lets out within half of OUTBOX_LEASE_SECONDS, and send them
+        concurrently through it. An email is marked sent only after the SMTP
+        server accepted it, so delivery is at least once: if the worker
+        crashes in between, the email is sent again once its claim runs out
+        after OUTBOX_LEASE_SECONDS. The claim is renewed right before each
+        send, however long the rate limiter held the email back, and an
+        email another worker took over in the meantime is not sent. Failed
+        emails are retried with exponential backoff.
+
+        Returns:
+        - tuple[bool, str, dict | None]: Success, a status message, and the
+        number of emails sent, rescheduled, given up on and taken over by
+        another worker.
+        """
+        try:
+            # Only claim as many emails as the rate limiter lets out within
+            # half the lease, leaving room for throttle retries, so that the
+            # rest are left to other workers
+            capacity = mail_rate_limiter.capacity(OUTBOX_LEASE_SECONDS / 2)
+            emails = _claim(max(1, min(limit, capacity)))
+
+            async def send(email: OutboxEmail) -> str:
+                success, message, _ = await EmailServices.send_email(
+                    subject=email.subject,
+                    recipients=json.loads(email.recipients),
+                    body=email.body,
+                    subtype=email.subtype,
+                    attachments=json.loads(email.attachments),
+                    before_send=lambda: _renew_claim(email)
+                )
+                # Recorded as soon as the email is sent, while the claim
+                # renewed for it still holds and the rest of the batch may
+                # still be waiting on the rate limiter
+                status = _record_result(email, success, message)
+                if status == "failed":
+                    logging.getLogger(__name__).warning(
+                        "Gave up on outbox email %s to %s: %s", email.id, email.recipients, message
+                    )
+                return status
+
+            report = {"sent": 0, "pending": 0, "failed": 0, "lost": 0}
+            for status in await asyncio.gather(*(send(email) for email in emails)):
+                report[status] += 1
+            return (
+                True,
+                f"Sent {report['sent']} emails, {report['pending']} to retry, {report['failed']} failed, "
+                f"{report['lost']} taken over by another worker.",
+                report
+            )
+        except Exception as e:
+            return False, str(e), None
+
+    @staticmethod
+    def get_counts(session: Session) -> tuple[bool, str, dict[str, int] | None]:
+        """
+        Get the number of outbox emails in each status.
+        """
+        try:
+            counts = {status: 0 for status in OUTBOX_STATUSES}
+            counts.update(session.exec(
+                select(OutboxEmail.status, func.count()).group_by(OutboxEmail.status)
+            ).all())
+            return True, "Outbox counts found.", counts
+        except Exception as e:
+            return False, str(e), None
+
+    @staticmethod
+    def retry_failed(session: Session) -> tuple[bool, str, int]:
+        """
+        Queue the emails that were given up on to be sent again, e.g. once
+        the mail settings are fixed.
+
+        Returns:
+        - tuple[bool, str, int]: Success, a status message, and the number
+        of emails queued again.
+        """
+        try:
+            count = session.exec(
+                update(OutboxEmail)
+                .where(OutboxEmail.status == "failed")
+                .values(status="pending", attempts=0, next_attempt_at=datetime.now(timezone.utc))
+            ).rowcount
+            session.commit()
+            return True, f"Queued {count} failed emails again.", count
+        except Exception as e:
+            session.rollback()
+            return False, str(e), 0
+
+class OutboxWorker:
+    """
+    Sends the emails in the outbox. Runs in a background thread of the app,
+    or in a process of its own (`python manage.py outbox-worker`), in which
+    case set OUTBOX_WORKER=false for the app. Any number of workers can run,
+    they never send the same email at once.
+    """
+    def __init__(self):
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="outbox-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self) -> None:
+        """
+        Look for new emails now rather than after OUTBOX_POLL_SECONDS, e.g.
+        right after queueing some.
+        """
+        self._wake.set()
+
+    def run(self) -> None:
+        """
+        Send emails until stopped. Sleeps while the outbox is empty.
+        """
+        logger = logging.getLogger(__name__)
+        while not self._stop.is_set():
+            self._wake.clear()
+            success, message, report = asyncio.run(OutboxServices.send_due())
+            if not success:
+                logger.warning("Sending outbox emails failed: %s", message)
+            elif sum(report.values()):
+                logger.info(message)
+                # Keep going while there is more to send
+                continue
+            self._wake.wait(OUTBOX_POLL_SECONDS)
+
+outbox_worker = OutboxWorker()
\ No newline at end of file
@@ -1,13 +1,72 @@
 import io
+import os
+import multiprocessing
 from decimal import Decimal
 from typing import List, Dict, Any
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
-from xhtml2pdf import pisa
-
+import tracing
 from models import Client
 
+def pdf_file_name(file_type: str, client_name: str, document_no: str) -> str:
+    """
+    The name (without extension) a quote or invoice PDF is saved under.
+    """
+    if file_type == "invoice":
+        # ex: m&m-invoice_Joie-Rose_Stangle_1-0001
+        return f'm&m-invoice_{client_name.replace(" ", "_")}_{document_no}'
+    # ex: m&m-quote_Joie-Rose_Stangle_1-0001
+    return f'm&m-quote_{client_name.replace(" ", "_")}_{document_no}'
+
+# Number of worker processes rendering PDFs in bulk
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+
+def pdf_worker_pool() -> ProcessPoolExecutor:
+    """
+    A pool of PDF_WORKERS processes to run `render_pdf` in. The workers are
+    spawned rather than forked, forking a process that runs threads can
+    deadlock the child.
+    """
+    return ProcessPoolExecutor(
+        max_workers=PDF_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+def render_pdf(
+    file_type: str,
+    client_name: str,
+    document_no: str,
+    html_source: str,
+    pdf_save_path: str
+) -> tuple[bool, str, str | None]:
+    """
+    Render a quote or invoice PDF from its HTML and save it, in a worker
+    process of `pdf_worker_pool`.
+    """
+    os.makedirs(pdf_save_path, exist_ok=True)
+    return PDFServices.save_pdf(
+        file_type=file_type,
+        client=Client(name=client_name),
+        invoice_no=document_no if file_type == "invoice" else None,
+        quote_no=document_no if file_type == "quote" else None,
+        html_source=html_source,
+        pdf_save_path=pdf_save_path
+    )
+
+@tracing.traced_methods
 class PDFServices:
+    @staticmethod
+    def prewarm() -> tuple[bool, str, None]:
+        """
+        Import xhtml2pdf ahead of the first PDF.
+        """
+        try:
+            from xhtml2pdf import pisa
+            return True, "PDF services loaded.", None
+        except Exception as e:
+            return False, str(e), None
+
     @staticmethod
     def generate_html_source(
         file_type: str,
@@ -195,12 +254,15 @@ class PDFServices:
             - bool - A success flag (true or false)
             - str - A success message (if bool is true), or an error message (if bool is false).
         """
-        if file_type == "invoice":
-            # ex: m&m-invoice_Joie-Rose_Stangle_1-0001
-            filename = f'm&m-invoice_{client.name.replace(" ", "_")}_{invoice_no}'
-        else:
-            # ex: m&m-quote_Joie-Rose_Stangle_1-0001
-            filename = f'm&m-quote_{client.name.replace(" ", "_")}_{quote_no}'
+        filename = pdf_file_name(
+            file_type,
+            client.name,
+            invoice_no if file_type == "invoice" else quote_no
+        )
+
+        # xhtml2pdf (and reportlab) take most of a second to import, so they
+        # are loaded on the first PDF rather than at startup
+        from xhtml2pdf import pisa
 
         with open(f"{pdf_save_path}/{filename}.pdf", "w+b") as result_file:
             pisa_status = pisa.pisaDocument(
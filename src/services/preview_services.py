@@ -0,0 +1,196 @@
+import os
+import shutil
+import hashlib
+import tempfile
+
+from sqlmodel import Session, select
+
+import tracing
+from models import Client, TempClientQuoteProfile, TempQuoteProfileLine
+from .crud_services import QuoteProfileLineCRUD, QuoteCRUD
+from .pricing_services import PricingServices
+from .pdf_services import PDFServices, pdf_file_name
+
+# Directory the PDFs rendered from previews are cached in, by the hash of
+# their HTML
+PREVIEW_CACHE_DIR = os.getenv("PREVIEW_CACHE_DIR") or os.path.join(
+    tempfile.gettempdir(), "invoice_app_previews"
+)
+# Number of preview PDFs kept in the cache; the least recently used are
+# removed beyond it
+PREVIEW_CACHE_SIZE = int(os.getenv("PREVIEW_CACHE_SIZE", "200"))
+
+def _prune_cache() -> None:
+    """
+    Remove the least recently used preview PDFs beyond PREVIEW_CACHE_SIZE.
+    """
+    # Renders still in progress are left alone
+    entries = [
+        entry for entry in os.scandir(PREVIEW_CACHE_DIR)
+        if entry.is_dir() and not entry.name.startswith(".")
+    ]
+    if len(entries) <= PREVIEW_CACHE_SIZE:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in entries[PREVIEW_CACHE_SIZE:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+@tracing.traced_methods
+class PreviewServices:
+    @staticmethod
+    def preview_quotes(
+        client_ids: list[int],
+        session: Session
+    ) -> tuple[bool, str, list[dict] | None]:
+        """
+        Generate the HTML of the quotes `batch_send_quotes` would send the
+        given clients, from their temp quote profiles, without rendering or
+        emailing PDFs and without creating quotes. The clients, profiles,
+        lines and quote counts are each read in one query and every profile
+        is priced in one pass, so a preview costs about as much as generating
+        its HTML.
+
+        Parameters:
+        - client_ids: The unique IDs of the clients to preview the quotes of.
+        - session: A SQLModel session for database access.
+
+        Returns:
+        - tuple[bool, str, list[dict] | None]: Success, a status message, and
+        a preview per client, in the order given: the client's ID and name,
+        the quote number and grand total the quote would have, and its HTML,
+        or an error if the client or their profile was not found.
+        """
+        try:
+            client_ids = list(dict.fromkeys(client_ids))
+            clients = {
+                client.id: client
+                for client in session.exec(select(Client).where(Client.id.in_(client_ids)))
+            }
+            profiles = {
+                profile.client_id: profile
+                for profile in session.exec(
+                    select(TempClientQuoteProfile)
+                    .where(TempClientQuoteProfile.client_id.in_(client_ids))
+                )
+            }
+            _, _, lines_by_client_id = QuoteProfileLineCRUD.get_lines_by_client_ids(
+                TempQuoteProfileLine,
+                client_ids,
+                session
+            )
+            success, message, num_quotes = QuoteCRUD.count_by_client_ids(client_ids, session)
+            if not success:
+                return False, message, None
+
+            # Price the profiles the same way batch_send_quotes does
+            success, message, prices = PricingServices.price_profiles(
+                [(lines_by_client_id[client_id], None) for client_id in client_ids]
+            )
+            if not success:
+                return False, message, None
+
+            previews = []
+            for client_id, price in zip(client_ids, prices):
+                client = clients.get(client_id)
+                profile = profiles.get(client_id)
+                preview = {
+                    "client_id": client_id,
+                    "client_name": client.name if client else None
+                }
+                previews.append(preview)
+                if client is None:
+                    preview["error"] = "Client not found."
+                    continue
+                if profile is None:
+                    preview["error"] = "Client has no quote profile."
+                    continue
+
+                quote_no = f"{client_id}-{str(num_quotes[client_id] + 1).zfill(4)}"
+                success, message, html_source = PDFServices.generate_html_source(
+                    file_type="quote",
+                    client=client,
+                    invoice_no=None,
+                    quote_no=quote_no,
+                    min_monthly_charge=profile.min_monthly_charge,
+                    premium_salt_upcharge=profile.premium_salt_upcharge,
+                    services=price.priced_lines(
+                        line.to_dict() for line in lines_by_client_id[client_id]
+                    ),
+                    grand_total=price.grand_total
+                )
+                if not success:
+                    preview["error"] = message
+                    continue
+                preview.update(
+                    quote_no=quote_no,
+                    grand_total=price.grand_total,
+                    html=html_source
+                )
+
+            return True, f"Previewed {len(previews)} quotes.", previews
+        except Exception as e:
+            return False, str(e), None
+
+    @staticmethod
+    def get_pdf(
+        file_type: str,
+        client_name: str,
+        document_no: str,
+        html_source: str
+    ) -> tuple[bool, str, str | None]:
+        """
+        Get the PDF of a previewed quote or invoice. PDFs are cached in
+        PREVIEW_CACHE_DIR by the hash of their HTML, so a preview is only
+        rendered the first time it is asked for as a PDF, and again only once
+        anything on it changes.
+
+        Parameters:
+        - file_type: "quote" or "invoice".
+        - client_name: The name of the client the document is for.
+        - document_no: The quote or invoice number on the document.
+        - html_source: The document's HTML, from `generate_html_source`.
+
+        Returns:
+        - tuple[bool, str, str | None]: Success, a status message, and the
+        path of the PDF.
+        """
+        try:
+            key = hashlib.sha256(html_source.encode("utf-8")).hexdigest()
+            entry_path = os.path.join(PREVIEW_CACHE_DIR, key)
+            pdf_path = os.path.join(
+                entry_path,
+                pdf_file_name(file_type, client_name, document_no) + ".pdf"
+            )
+            if os.path.isfile(pdf_path):
+                # Mark the entry as recently used
+                os.utime(entry_path)
+                return True, "Cached PDF found.", pdf_path
+
+            # Render into a directory of its own and move it into place once
+            # the PDF is complete, so a failed or concurrent render is never
+            # served from the cache
+            os.makedirs(PREVIEW_CACHE_DIR, exist_ok=True)
+            render_path = tempfile.mkdtemp(prefix=".render-", dir=PREVIEW_CACHE_DIR)
+            try:
+                success, message, _ = PDFServices.save_pdf(
+                    file_type=file_type,
+                    client=Client(name=client_name),
+                    invoice_no=document_no if file_type == "invoice" else None,
+                    quote_no=document_no if file_type == "quote" else None,
+                    html_source=html_source,
+                    pdf_save_path=render_path
+                )
+                if not success:
+                    return False, message, None
+                try:
+                    os.rename(render_path, entry_path)
+                except OSError:
+                    # Another request cached the same PDF first
+                    pass
+            finally:
+                shutil.rmtree(render_path, ignore_errors=True)
+
+            _prune_cache()
+            return True, "PDF rendered.", pdf_path
+        except Exception as e:
+            return False, str(e), None
\ No newline at end of file
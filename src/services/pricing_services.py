@@ -0,0 +1,178 @@
+import operator
+from decimal import Decimal, Context, InvalidOperation, ROUND_HALF_UP, localcontext
+from typing import Any, Iterable
+
+import tracing
+
+CENT = Decimal("0.01")
+HUNDRED = Decimal(100)
+ZERO = Decimal("0.00")
+
+# Exact arithmetic for every intermediate result; rounding only happens when
+# amounts are quantized to cents, half up like the quote profile forms show
+PRICING_CONTEXT = Context(prec=34, rounding=ROUND_HALF_UP)
+
+def _get(line: Any, name: str) -> Any:
+    """
+    Get a column of a line, which may be a dict from a form or a line model.
+    """
+    return line.get(name) if isinstance(line, dict) else getattr(line, name)
+
+def _to_decimal(value: Any) -> Decimal:
+    """
+    Convert a number from a form, a JSON body or a Decimal column to a
+    Decimal. Blank and missing values count as zero.
+    """
+    if isinstance(value, Decimal):
+        return value
+    if value is None:
+        return ZERO
+    if isinstance(value, float):
+        # floats come from JSON bodies, use the number as written
+        value = repr(value)
+    try:
+        number = Decimal(str(value).strip() or "0")
+    except InvalidOperation:
+        raise ValueError(f"{value!r} is not a number")
+    if not number.is_finite():
+        raise ValueError(f"{value!r} is not a finite number")
+    return number
+
+class ProfilePrice:
+    """
+    The prices of one quote profile's lines and its totals, in cents.
+
+    - line_totals: Each line's total price (quantity * unit price plus tax).
+    - subtotal: The sum of the lines' prices before tax.
+    - tax: The sum of the lines' taxes.
+    - services_total: The sum of the lines' total prices.
+    - minimum_charge: What the minimum monthly charge adds on top of the
+    services total (zero if the services total reaches it).
+    - grand_total: The services total plus the minimum charge.
+    """
+    __slots__ = ("line_totals", "subtotal", "tax", "services_total", "minimum_charge", "grand_total")
+
+    def __init__(
+        self,
+        line_totals: list[Decimal],
+        subtotal: Decimal,
+        services_total: Decimal,
+        minimum_charge: Decimal
+    ):
+        self.line_totals = line_totals
+        self.subtotal = subtotal
+        self.tax = services_total - subtotal
+        self.services_total = services_total
+        self.minimum_charge = minimum_charge
+        self.grand_total = services_total + minimum_charge
+
+    def priced_lines(self, lines: Iterable[dict]) -> list[dict]:
+        """
+        Copies of the given line dicts with their total prices replaced by the
+        computed ones.
+        """
+        return [
+            {**line, "total_price": str(line_total)}
+            for line, line_total in zip(lines, self.line_totals)
+        ]
+
+    def invoice_lines(self, lines: Iterable[dict]) -> list[dict]:
+        """
+        The priced lines of an invoice, plus a line for the minimum monthly
+        charge if the services do not reach it.
+        """
+        priced_lines = self.priced_lines(lines)
+        if self.minimum_charge:
+            priced_lines.append({
+                "service_name": "Minimum monthly charge",
+                "quantity": "1",
+                "per_unit": "--",
+                "unit_price": str(self.minimum_charge),
+                "tax": "0",
+                "total_price": str(self.minimum_charge)
+            })
+        return priced_lines
+
+@tracing.traced_methods
+class PricingServices:
+    @staticmethod
+    def price_profiles(
+        profiles: list[tuple[list, Decimal | None]]
+    ) -> tuple[bool, str, list[ProfilePrice] | None]:
+        """
+        Price the lines of any number of quote profiles and total them, in one
+        pass over all of their lines. The lines' quantities, unit prices and
+        tax percentages are gathered into columns and each step is computed
+        for a whole column at once, with exact Decimal arithmetic. Totals the
+        browser computed are never used.
+
+        Parameters:
+        - profiles: (lines, min_monthly_charge) pairs. Lines are dicts or line
+        models with `quantity`, `unit_price` and `tax` (a percentage). If a
+        minimum monthly charge is given, the grand total is raised to it.
+
+        Returns:
+        - tuple[bool, str, list[ProfilePrice] | None]: Success, a status
+        message, and the price of each profile, in the order given.
+        """
+        try:
+            with localcontext(PRICING_CONTEXT):
+                # Gather the lines of every profile into columns
+                quantities = []
+                unit_prices = []
+                tax_rates = []
+                line_counts = []
+                for lines, _ in profiles:
+                    line_count = 0
+                    for line in lines:
+                        quantities.append(_to_decimal(_get(line, "quantity")))
+                        unit_prices.append(_to_decimal(_get(line, "unit_price")))
+                        tax_rates.append(_to_decimal(_get(line, "tax")))
+                        line_count += 1
+                    line_counts.append(line_count)
+
+                # Price every line
+                bases = list(map(operator.mul, quantities, unit_prices))
+                taxes = [
+                    base * tax_rate / HUNDRED
+                    for base, tax_rate in zip(bases, tax_rates)
+                ]
+                line_totals = [
+                    (base + tax).quantize(CENT)
+                    for base, tax in zip(bases, taxes)
+                ]
+                line_subtotals = [base.quantize(CENT) for base in bases]
+
+                # Total each profile's slice of the columns
+                prices = []
+                start = 0
+                for (_, min_monthly_charge), line_count in zip(profiles, line_counts):
+                    end = start + line_count
+                    services_total = sum(line_totals[start:end], ZERO)
+                    minimum_charge = ZERO
+                    if min_monthly_charge is not None:
+                        floor = _to_decimal(min_monthly_charge).quantize(CENT)
+                        minimum_charge = max(floor - services_total, ZERO)
+                    prices.append(ProfilePrice(
+                        line_totals[start:end],
+                        sum(line_subtotals[start:end], ZERO),
+                        services_total,
+                        minimum_charge
+                    ))
+                    start = end
+
+            return True, "Quote profiles priced.", prices
+        except Exception as e:
+            return False, f"Could not price quote profile lines: {e}", None
+
+    @staticmethod
+    def price_profile(
+        lines: list,
+        min_monthly_charge: Decimal | None = None
+    ) -> tuple[bool, str, ProfilePrice | None]:
+        """
+        Price the lines of a single quote profile and total them. See
+        `price_profiles`.
+        """
+        success, message, prices = PricingServices.price_profiles([(lines, min_monthly_charge)])
+        return success, message, prices[0] if success else None
\ No newline at end of file
@@ -0,0 +1,133 @@
+import os
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlmodel import Session, select
+
+import tracing
+from database import sqlite_engine
+from models import Service, ClientQuoteProfile, QuoteProfileLine
+from .crud_services import DataVersionCRUD, QuoteProfileLineCRUD
+from .pricing_services import PricingServices, CENT
+
+# Number of quote profiles re-priced per transaction
+REPRICE_BATCH_SIZE = int(os.getenv("REPRICE_BATCH_SIZE", "500"))
+
+def _reprice_batch(service_id: int, client_ids: list[int], session: Session) -> int:
+    """
+    Re-price one batch of quote profiles in a single transaction.
+
+    Returns:
+    - int: The number of quote profiles that changed.
+    """
+    # Take SQLite's write lock before reading anything, so no profile or
+    # price can change between reading and rewriting it. This also changes
+    # the ETags of the quote profiles.
+    DataVersionCRUD.bump(ClientQuoteProfile, session)
+
+    # Read the price inside the transaction, so when two price changes race
+    # the job that commits last always uses the latest price
+    service = session.get(Service, service_id)
+    if service is None:
+        session.rollback()
+        return 0
+    unit_price = Decimal(service.unit_price).quantize(CENT, ROUND_HALF_UP)
+
+    # Only the lines for this service get the new price, the others are kept
+    # as they are
+    repriced_client_ids = set()
+    for line in session.exec(
+        select(QuoteProfileLine)
+        .where(QuoteProfileLine.service_id == service_id)
+        .where(QuoteProfileLine.client_id.in_(client_ids))
+        .where(QuoteProfileLine.unit_price != unit_price)
+    ):
+        line.unit_price = unit_price
+        session.add(line)
+        repriced_client_ids.add(line.client_id)
+    if not repriced_client_ids:
+        session.commit()
+        return 0
+
+    # Price all the lines of the changed profiles in one pass and re-total
+    # the profiles
+    _, _, lines_by_client_id = QuoteProfileLineCRUD.get_lines_by_client_ids(
+        QuoteProfileLine,
+        list(repriced_client_ids),
+        session
+    )
+    success, message, prices = PricingServices.price_profiles(
+        [(lines, None) for lines in lines_by_client_id.values()]
+    )
+    if not success:
+        raise ValueError(message)
+    grand_totals = {}
+    for (client_id, lines), price in zip(lines_by_client_id.items(), prices):
+        for line, line_total in zip(lines, price.line_totals):
+            if line.total_price != line_total:
+                line.total_price = line_total
+                session.add(line)
+        grand_totals[client_id] = price.grand_total
+    for quote_profile in session.exec(
+        select(ClientQuoteProfile)
+        .where(ClientQuoteProfile.client_id.in_(repriced_client_ids))
+    ):
+        quote_profile.grand_total = grand_totals[quote_profile.client_id]
+        session.add(quote_profile)
+
+    session.commit()
+    return len(repriced_client_ids)
+
+@tracing.traced_methods
+class RepricingServices:
+    @staticmethod
+    def reprice_service(service_id: int) -> tuple[bool, str, int]:
+        """
+        Re-price the lines of every quote profile that uses a service at the
+        service's current unit price, and update those profiles' grand
+        totals. Runs as a background task after a service's price changes, so
+        it opens its own sessions. Profiles are found through the lines'
+        service index and re-priced in batches of REPRICE_BATCH_SIZE, one
+        transaction per batch.
+
+        Parameters:
+        - service_id: The unique ID of the service whose price changed.
+
+        Returns:
+        - tuple[bool, str, int]: Success, a status message, and the number of
+        quote profiles that were re-priced.
+        """
+        try:
+            with Session(sqlite_engine) as session:
+                _, _, client_ids = QuoteProfileLineCRUD.get_client_ids(service_id, session)
+
+            repriced = 0
+            for start in range(0, len(client_ids), REPRICE_BATCH_SIZE):
+                with Session(sqlite_engine) as session:
+                    repriced += _reprice_batch(
+                        service_id,
+                        client_ids[start:start + REPRICE_BATCH_SIZE],
+                        session
+                    )
+            return True, f"Re-priced {repriced} quote profiles.", repriced
+        except Exception as e:
+            return False, str(e), 0
+
+    @staticmethod
+    def reprice_all() -> tuple[bool, str, int]:
+        """
+        Re-price every quote profile line at its service's current unit price.
+
+        Returns:
+        - tuple[bool, str, int]: Success, a status message, and the number of
+        quote profiles that were re-priced.
+        """
+        with Session(sqlite_engine) as session:
+            service_ids = session.exec(select(Service.id).order_by(Service.id)).all()
+
+        repriced = 0
+        for service_id in service_ids:
+            reprice_status, message, count = RepricingServices.reprice_service(service_id)
+            if not reprice_status:
+                return False, message, repriced
+            repriced += count
+        return True, f"Re-priced quote profiles ({repriced} updates).", repriced
\ No newline at end of file
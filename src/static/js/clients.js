@@ -21,6 +21,8 @@ document.addEventListener("DOMContentLoaded", async function() {
         }, 3);
     }
 
+    // The page of the table being viewed, kept up to date as the table is patched in place
+    let currentPage = Number(document.querySelector('input[name="current-page"]').value) || 1;
 
     //#region CLIENT FORM
     const clientFormDialog = document.getElementById("dialog_client-form");
@@ -42,11 +44,9 @@ document.addEventListener("DOMContentLoaded", async function() {
             closeFormDialog(clientFormDialog);
         });
 
-        // Open the "Edit Client" form*
-        document.querySelectorAll('[id^="btn_show-edit-client-form-"]').forEach((btn) => {
-            btn.addEventListener("click", (e) => {
-                openEditClientForm(e.currentTarget);
-            });
+        // Open the "Edit Client", "Remove Client", and Client Quote Profile forms*
+        Array.from(document.getElementById("tbody_all-clients").rows).forEach((row) => {
+            bindClientRowButtons(row);
         });
 
         //#endregion
@@ -61,6 +61,7 @@ document.addEventListener("DOMContentLoaded", async function() {
         clientForm.addEventListener("submit", async(e) => {
             e.preventDefault();
             const formData = new FormData(e.target);
+            formData.set("current-page", currentPage);
             try {
                 // Use the current form's action (set by the button that opens the form) -> this is either /clients/add_client or /clients/edit_client
                 const response = await fetch(clientForm.action, {
@@ -72,11 +73,13 @@ document.addEventListener("DOMContentLoaded", async function() {
                     data = await response.json();
                     // Close the form dialog
                     closeFormDialog(clientFormDialog);
-                    // Store toast message before reload
-                    localStorage.setItem("toastType", "success");
-                    localStorage.setItem("toastMessage", typeof data.detail === "object" ? JSON.stringify(data.detail) : data.detail);
-                    // Reload the page according to the redirect url provided in the JSON response body
-                    window.location.href = data.redirect_to;
+                    // Patch the table with the HTML fragments provided in the JSON response body
+                    if (clientForm.action.endsWith("/edit_client")) {
+                        updateClientInAllClientsTable(data);
+                    } else {
+                        addRenderedClientToAllClientsTable(data);
+                    }
+                    showToast("success", typeof data.detail === "object" ? JSON.stringify(data.detail) : data.detail);
                 } else {
                     data = await response.json();
                     if (response.status == 422) {
@@ -174,13 +177,6 @@ document.addEventListener("DOMContentLoaded", async function() {
 
         //#region
 
-        // Open the "Remove Client" form*
-        document.querySelectorAll('[id^="btn_show-remove-client-form-"]').forEach((btn) => {
-            btn.addEventListener("click", (e) => {
-                openRemoveClientForm(e.currentTarget);
-            });
-        });
-        
         // Close the "Remove Client" form
         document.getElementById("btn_hide-remove-client-form").addEventListener("click", () => {
             closeFormDialog(removeClientFormDialog);
@@ -198,6 +194,7 @@ document.addEventListener("DOMContentLoaded", async function() {
         removeClientForm.addEventListener("submit", async(e) => {
             e.preventDefault();
             const formData = new FormData(e.target);
+            formData.set("current-page", currentPage);
             try {
                 // Use the current form's action (set by the button that opens the form) -> this is always /clients/remove_client
                 const response = await fetch(removeClientForm.action, {
@@ -209,11 +206,9 @@ document.addEventListener("DOMContentLoaded", async function() {
                     data = await response.json();
                     // Close the form dialog
                     closeFormDialog(removeClientFormDialog);
-                    // Store toast message before reload
-                    localStorage.setItem("toastType", "success");
-                    localStorage.setItem("toastMessage", data.detail);
-                    // Reload the page according to the redirect url provided in the JSON response body
-                    window.location.href = data.redirect_to;
+                    // Patch the table with the HTML fragments provided in the JSON response body
+                    removeRenderedClientFromAllClientsTable(data);
+                    showToast("success", data.detail);
                 } else {
                     data = await response.json();
                     if (response.status == 500) {
@@ -265,13 +260,6 @@ document.addEventListener("DOMContentLoaded", async function() {
 
         //#region
 
-        // Open the Client Quote Profile Form*
-        document.querySelectorAll('[id^="btn_show-client-quote-profile-form-"]').forEach((btn) => {
-            btn.addEventListener("click", (e) => {
-                openClientQuoteProfileForm(e.currentTarget);
-            });
-        });
-
         // Close the Client Quote Profile Form
         document.getElementById("btn_hide-client-quote-profile-form").addEventListener("click", () => {
             document.getElementById("tbody_client-quote-profile-services").innerHTML = "";
@@ -742,6 +730,120 @@ document.addEventListener("DOMContentLoaded", async function() {
     //#endregion GENERAL/REUSABLE FUNCTIONS
 
 
+    //#region ALL CLIENTS TABLE FUNCTIONS
+    /**
+     * Add event listeners to the icon buttons of a row in the all clients table.
+     * @param {HTMLTableRowElement} row - The table row of a client.
+     * @returns {void}
+     */
+    function bindClientRowButtons(row) {
+        row.querySelector('[id^="btn_show-edit-client-form-"]').addEventListener("click", (e) => {
+            // Open the "Edit Client" form
+            openEditClientForm(e.currentTarget);
+        });
+        row.querySelector('[id^="btn_show-remove-client-form-"]').addEventListener("click", (e) => {
+            // Open the "Remove Client" form
+            openRemoveClientForm(e.currentTarget);
+        });
+        row.querySelector('[id^="btn_show-client-quote-profile-form-"]').addEventListener("click", (e) => {
+            // Open the Client Quote Profile form
+            openClientQuoteProfileForm(e.currentTarget);
+        });
+    }
+
+    /**
+     * Create a row for the all clients table from the HTML rendered by the server.
+     * @param {string} rowHtml - The HTML of the row's <tr> element.
+     * @returns {HTMLTableRowElement}
+     */
+    function createClientRow(rowHtml) {
+        const template = document.createElement("template");
+        template.innerHTML = rowHtml.trim();
+        const row = template.content.firstElementChild;
+        bindClientRowButtons(row);
+        return row;
+    }
+
+    /**
+     * Replace the rows of the all clients table with the rows of another page.
+     * @param {{ rows_html: string, page_clients: Array<Object> }} data - The JSON response body of a client mutation.
+     * @returns {void}
+     */
+    function showClientsPage(data) {
+        const allClientsTableBody = document.getElementById("tbody_all-clients");
+
+        allClientsTableBody.innerHTML = data.rows_html;
+        Array.from(allClientsTableBody.rows).forEach((row) => {
+            bindClientRowButtons(row);
+        });
+        pageClients.splice(0, pageClients.length, ...data.page_clients);
+    }
+
+    /**
+     * Update the pagination control, page number, and url after the all clients table was patched.
+     * @param {{ page: number, pagination_html: string, redirect_to: string }} data - The JSON response body of a client mutation.
+     * @returns {void}
+     */
+    function updateClientsPagination(data) {
+        currentPage = data.page;
+        document.getElementById("div_table-pagination").innerHTML = data.pagination_html;
+        history.replaceState(null, "", data.redirect_to);
+    }
+
+    /**
+     * Add a newly created client to the all clients table, switching to the page it is shown on if necessary.
+     * @param {Object} data - The JSON response body of the "Add Client" request.
+     * @returns {void}
+     */
+    function addRenderedClientToAllClientsTable(data) {
+        allClients.push(data.client);
+        if (data.row_html) {
+            document.getElementById("tbody_all-clients").appendChild(createClientRow(data.row_html));
+            pageClients.push(data.client);
+        } else {
+            showClientsPage(data);
+        }
+        updateClientsPagination(data);
+    }
+
+    /**
+     * Replace an edited client's row in the all clients table.
+     * @param {Object} data - The JSON response body of the "Edit Client" request.
+     * @returns {void}
+     */
+    function updateClientInAllClientsTable(data) {
+        document.getElementById(`tr_client-${data.client.id}`).replaceWith(createClientRow(data.row_html));
+        [allClients, pageClients].forEach((clients) => {
+            const index = clients.findIndex((client) => client.id === data.client.id);
+            (index !== -1) && clients.splice(index, 1, data.client);
+        });
+        updateClientsPagination(data);
+    }
+
+    /**
+     * Remove a client from the all clients table, moving the next page's first client up or switching to the previous page if necessary.
+     * @param {Object} data - The JSON response body of the "Remove Client" request.
+     * @returns {void}
+     */
+    function removeRenderedClientFromAllClientsTable(data) {
+        [allClients, pageClients].forEach((clients) => {
+            const index = clients.findIndex((client) => client.id === data.client.id);
+            (index !== -1) && clients.splice(index, 1);
+        });
+        if (data.rows_html !== undefined) {
+            showClientsPage(data);
+        } else {
+            document.getElementById(`tr_client-${data.client.id}`)?.remove();
+            if (data.refill_row_html) {
+                document.getElementById("tbody_all-clients").appendChild(createClientRow(data.refill_row_html));
+                pageClients.push(data.refill_client);
+            }
+        }
+        updateClientsPagination(data);
+    }
+    //#endregion ALL CLIENTS TABLE FUNCTIONS
+
+
     //#region DEPRECATED FUNCTIONS
     /**
      * Add a client to the all clients table.
@@ -16,6 +16,8 @@ document.addEventListener("DOMContentLoaded", async function() {
     const batchQuotesFormDialog = document.getElementById("dialog_batch-quotes-form");
     const batchQuotesForm = document.getElementById("form_batch-quotes-form");
     const allClientsTableBody = document.getElementById("tbody_all-clients");
+    // Idempotency key of the batch being sent, kept until it is sent in full
+    let batchQuotesIdempotencyKey = null;
 
     ////////////////////////
     /* Open/Close Events */
@@ -53,6 +55,21 @@ document.addEventListener("DOMContentLoaded", async function() {
     /* Form Submission */
     ////////////////////
 
+        // Preview the quotes of the selected clients in a new tab
+        document.getElementById("btn_preview-quotes").addEventListener("click", () => {
+            const params = new URLSearchParams();
+            document.querySelectorAll('[id^="chkbx_add-client-to-batch-quote_client-"]').forEach((checkbox) => {
+                if (checkbox.checked) {
+                    params.append("client_ids", checkbox.dataset.clientId);
+                }
+            });
+            if (!params.has("client_ids")) {
+                showToast("error", "Select at least one client to preview.");
+                return;
+            }
+            window.open(`/quotes/preview?${params}`, "_blank");
+        });
+
         // Submit the Batch Quotes Form
         batchQuotesFormDialog.addEventListener("submit", async(e) => {
             e.preventDefault();
@@ -65,11 +82,19 @@ document.addEventListener("DOMContentLoaded", async function() {
                 }
             });
 
+            // Send the batch under one idempotency key until it succeeds, so
+            // resubmitting after a failure only sends the failed quotes
+            batchQuotesIdempotencyKey ??= (
+                window.crypto?.randomUUID?.()
+                ?? `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+            );
+
             try {
                 const response = await fetch(batchQuotesForm.action, {
                     method: "POST",
                     headers: {
-                        "Content-Type": "application/json"
+                        "Content-Type": "application/json",
+                        "Idempotency-Key": batchQuotesIdempotencyKey
                     },
                     body: JSON.stringify({
                         "client_ids": clientIds
@@ -85,6 +110,9 @@ document.addEventListener("DOMContentLoaded", async function() {
                     localStorage.setItem("toastMessage", data.detail);
                     // Reload the page according to the redirect url provided in the JSON response body
                     window.location.href = data.redirect_to;
+                } else {
+                    data = await response.json();
+                    showToast("error", data.detail || "Unexpected Error");
                 }
             } catch (error) {
                 closeFormDialog(batchQuotesFormDialog);
@@ -1,16 +1,6 @@
 document.addEventListener("DOMContentLoaded", function() {
-    const toastType = localStorage.getItem("toastType");
-    const toastMessage = localStorage.getItem("toastMessage");
-
-    // Show stored toast message after a reload
-    if (toastType && toastMessage) {
-        setTimeout(() => {
-            showToast(toastType, toastMessage);
-            // Clear the message so it doesn't show again on next reload
-            localStorage.removeItem("toastType");
-            localStorage.removeItem("toastMessage");
-        }, 3);
-    }
+    // The page of the table being viewed, kept up to date as the table is patched in place
+    let currentPage = Number(document.querySelector('input[name="current-page"]').value) || 1;
 
     //#region SERVICE FORM
     const serviceFormDialog = document.getElementById("dialog_service-form");
@@ -25,11 +15,9 @@ document.addEventListener("DOMContentLoaded", function() {
             openAddNewServiceForm();
         });
 
-        // Open the "Edit Service" form*
-        document.querySelectorAll('[id^="btn_show-edit-service-form-"]').forEach((btn) => {
-            btn.addEventListener("click", (e) => {
-                openEditServiceForm(e.currentTarget);
-            });
+        // Open the "Edit Service" and "Remove Service" forms*
+        Array.from(document.getElementById("tbody_all-services").rows).forEach((row) => {
+            bindServiceRowButtons(row);
         });
 
         // Close the Service Form
@@ -45,6 +33,7 @@ document.addEventListener("DOMContentLoaded", function() {
         serviceForm.addEventListener("submit", async (e) => {
             e.preventDefault();
             const formData = new FormData(e.target);
+            formData.set("current-page", currentPage);
             try {
                 // Use the current form's action (set by the button that opens the form)
                 const response = await fetch(serviceForm.action, {
@@ -56,11 +45,13 @@ document.addEventListener("DOMContentLoaded", function() {
                     data = await response.json();
                     // Close the form dialog
                     closeFormDialog(serviceFormDialog);
-                    // Store toast message before reload
-                    localStorage.setItem("toastType", "success");
-                    localStorage.setItem("toastMessage", data.detail);
-                    // Reload the page according to the redirect url provided in the JSON response body
-                    window.location.href = data.redirect_to;
+                    // Patch the table with the HTML fragments provided in the JSON response body
+                    if (serviceForm.action.endsWith("/edit_service")) {
+                        updateServiceInAllServicesTable(data);
+                    } else {
+                        addRenderedServiceToAllServicesTable(data);
+                    }
+                    showToast("success", data.detail);
                 } else {
                     data = await response.json();
                     if (response.status == 422) {
@@ -99,13 +90,6 @@ document.addEventListener("DOMContentLoaded", function() {
     /* Open/Close Events */
     //////////////////////
 
-        // Open the "Remove Service" form*
-        document.querySelectorAll('[id^="btn_show-remove-service-form-"]').forEach((btn) => {
-            btn.addEventListener("click", (e) => {
-                openRemoveServiceForm(e.currentTarget);
-            })
-        });
-
         // Close the "Remove Service" Form
         document.getElementById("btn_hide-remove-service-form").addEventListener("click", () => {
             closeFormDialog(removeServiceFormDialog);
@@ -119,6 +103,7 @@ document.addEventListener("DOMContentLoaded", function() {
         removeServiceForm.addEventListener("submit", async (e) => {
             e.preventDefault();
             const formData = new FormData(e.target);
+            formData.set("current-page", currentPage);
             try {
                 const response = await fetch(removeServiceForm.action, {
                     method: "POST",
@@ -129,11 +114,9 @@ document.addEventListener("DOMContentLoaded", function() {
                     data = await response.json();
                     // Close the form dialog
                     closeFormDialog(removeServiceFormDialog);
-                    // Store toast message before reload
-                    localStorage.setItem("toastType", "success");
-                    localStorage.setItem("toastMessage", data.detail);
-                    // Reload the page according to the redirect url provided in the JSON response body
-                    window.location.href = data.redirect_to;
+                    // Patch the table with the HTML fragments provided in the JSON response body
+                    removeServiceFromAllServicesTable(data);
+                    showToast("success", data.detail);
                 } else {
                     data = await response.json();
                     if (response.status == 500) {
@@ -434,33 +417,118 @@ document.addEventListener("DOMContentLoaded", function() {
             openRemoveServiceForm(e.currentTarget);
         });
     }
-    //#endregion FUNCTIONS
 
-    //#region DEPRECATED FUNCTIONS
     /**
-     * Remove a service from the all services table.
-     * @param {{ id: number }} service - The service as a JSON object containing the unique ID of the removed service.
+     * Add event listeners to the icon buttons of a row in the all services table.
+     * @param {HTMLTableRowElement} row - The table row of a service.
+     * @returns {void}
+     */
+    function bindServiceRowButtons(row) {
+        row.querySelector('[id^="btn_show-edit-service-form-"]').addEventListener("click", (e) => {
+            // Open the "Edit Service" form
+            openEditServiceForm(e.currentTarget);
+        });
+        row.querySelector('[id^="btn_show-remove-service-form-"]').addEventListener("click", (e) => {
+            // Open the "Remove Service" form
+            openRemoveServiceForm(e.currentTarget);
+        });
+    }
+
+    /**
+     * Create a row for the all services table from the HTML rendered by the server.
+     * @param {string} rowHtml - The HTML of the row's <tr> element.
+     * @returns {HTMLTableRowElement}
+     */
+    function createServiceRow(rowHtml) {
+        const template = document.createElement("template");
+        template.innerHTML = rowHtml.trim();
+        const row = template.content.firstElementChild;
+        bindServiceRowButtons(row);
+        return row;
+    }
+
+    /**
+     * Replace the rows of the all services table with the rows of another page.
+     * @param {{ rows_html: string, page_services: Array<Object> }} data - The JSON response body of a service mutation.
      * @returns {void}
-     * 
-     * 09/08/2025 - This function is no longer used because the page reloads after a service is removed.
      */
-    /*function removeServiceFromAllServicesTable(service) {
-        document.getElementById(`tr_service-${service.id}`).remove();
-    }*/
+    function showServicesPage(data) {
+        const allServicesTableBody = document.getElementById("tbody_all-services");
+
+        allServicesTableBody.innerHTML = data.rows_html;
+        Array.from(allServicesTableBody.rows).forEach((row) => {
+            bindServiceRowButtons(row);
+        });
+        pageServices.splice(0, pageServices.length, ...data.page_services);
+    }
 
     /**
-     * Edit a service in the all services table.
-     * @param {{ id: number, name: string, description: string, unit_price: string}} service - The service as a JSON object containing the unique ID, name, description, and unit price of the updated service.
+     * Update the pagination control, page number, and url after the all services table was patched.
+     * @param {{ page: number, pagination_html: string, redirect_to: string }} data - The JSON response body of a service mutation.
      * @returns {void}
-     * 
-     * 09/08/2025 - This function is no longer used because the page reloads after a service is removed.
      */
-    /*function editServiceInAllServicesTable(service) {
-        const serviceRow = document.getElementById(`tr_service-${service.id}`);
-
-        serviceRow.getElementsByTagName("td")[0].innerText = service.name;
-        serviceRow.getElementsByTagName("td")[1].innerText = service.description;
-        serviceRow.getElementsByTagName("td")[2].innerText = `$${Number(service.unit_price).toFixed(2)}`;
-    }*/
-    //#endregion DEPRECATED FUNCTIONS
+    function updateServicesPagination(data) {
+        currentPage = data.page;
+        document.getElementById("div_table-pagination").innerHTML = data.pagination_html;
+        history.replaceState(null, "", data.redirect_to);
+
+        // Re-apply an active search to the updated list of services
+        if (searchInput.value.trim() !== "") {
+            clearAllServicesTableSearch();
+            searchAllServicesTable(searchInput.value, searchBySelect.value);
+        }
+    }
+
+    /**
+     * Add a newly created service to the all services table, switching to the page it is shown on if necessary.
+     * @param {Object} data - The JSON response body of the "Add Service" request.
+     * @returns {void}
+     */
+    function addRenderedServiceToAllServicesTable(data) {
+        allServices.push(data.service);
+        if (data.row_html) {
+            document.getElementById("tbody_all-services").appendChild(createServiceRow(data.row_html));
+            pageServices.push(data.service);
+        } else {
+            showServicesPage(data);
+        }
+        updateServicesPagination(data);
+    }
+
+    /**
+     * Replace an edited service's row in the all services table.
+     * @param {Object} data - The JSON response body of the "Edit Service" request.
+     * @returns {void}
+     */
+    function updateServiceInAllServicesTable(data) {
+        document.getElementById(`tr_service-${data.service.id}`).replaceWith(createServiceRow(data.row_html));
+        [allServices, pageServices].forEach((services) => {
+            const index = services.findIndex((service) => service.id === data.service.id);
+            (index !== -1) && services.splice(index, 1, data.service);
+        });
+        updateServicesPagination(data);
+    }
+
+    /**
+     * Remove a service from the all services table, moving the next page's first service up or switching to the previous page if necessary.
+     * @param {Object} data - The JSON response body of the "Remove Service" request.
+     * @returns {void}
+     */
+    function removeServiceFromAllServicesTable(data) {
+        [allServices, pageServices].forEach((services) => {
+            const index = services.findIndex((service) => service.id === data.service.id);
+            (index !== -1) && services.splice(index, 1);
+        });
+        if (data.rows_html !== undefined) {
+            showServicesPage(data);
+        } else {
+            document.getElementById(`tr_service-${data.service.id}`)?.remove();
+            if (data.refill_row_html) {
+                document.getElementById("tbody_all-services").appendChild(createServiceRow(data.refill_row_html));
+                pageServices.push(data.refill_service);
+            }
+        }
+        updateServicesPagination(data);
+    }
+    //#endregion FUNCTIONS
 });
\ No newline at end of file
@@ -0,0 +1,24 @@
+// Report the height of the browser's viewport to the server in a cookie, so
+// list pages can pick how many table rows fit on screen (see
+// utils.get_per_page). Runs on every page before the body is parsed.
+(function() {
+    const COOKIE_NAME = "viewport_height";
+    const ONE_YEAR_IN_SECONDS = 60 * 60 * 24 * 365;
+
+    function saveViewportHeight() {
+        document.cookie = (
+            `${COOKIE_NAME}=${Math.round(window.innerHeight)}; ` +
+            `path=/; max-age=${ONE_YEAR_IN_SECONDS}; SameSite=Lax`
+        );
+    }
+
+    saveViewportHeight();
+
+    // Keep the cookie current when the window is resized, without writing it
+    // on every resize event
+    let resizeTimeout = null;
+    window.addEventListener("resize", function() {
+        clearTimeout(resizeTimeout);
+        resizeTimeout = setTimeout(saveViewportHeight, 250);
+    });
+})();
\ No newline at end of file
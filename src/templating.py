@@ -0,0 +1,69 @@
+import os
+
+import jinja2
+from fastapi.templating import Jinja2Templates
+from heroicons.jinja import (
+    heroicon_micro, heroicon_mini, heroicon_outline, heroicon_solid
+)
+
+import assets
+import config
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+# Compiled templates are cached on disk so that a new worker (or a restart)
+# loads bytecode instead of parsing and compiling every template again. When
+# JINJA_CACHE_DIR is unset Jinja picks a per-user directory in the system temp
+# directory.
+bytecode_cache = jinja2.FileSystemBytecodeCache(os.getenv("JINJA_CACHE_DIR") or None)
+
+# The single template environment shared by main.py and every router
+environment = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+    autoescape=jinja2.select_autoescape(),
+    bytecode_cache=bytecode_cache,
+    # Templates cannot change under a production server, so skip the mtime
+    # check on every render
+    auto_reload=not config.PRODUCTION,
+    # Keep every template compiled in memory
+    cache_size=-1,
+)
+environment.globals.update(
+    {
+        "heroicon_micro": heroicon_micro,
+        "heroicon_mini": heroicon_mini,
+        "heroicon_outline": heroicon_outline,
+        "heroicon_solid": heroicon_solid,
+        "asset_url": assets.asset_url,
+    }
+)
+
+# Create Jinja2 templates object for rendering HTML from the templates directory
+templates = Jinja2Templates(env=environment)
+
+def precompile_templates() -> int:
+    """
+    Load and compile every template so the first request to each page does
+    not pay for it.
+
+    Returns:
+    - int: The number of templates compiled.
+    """
+    template_names = environment.list_templates(extensions=["html"])
+    for template_name in template_names:
+        environment.get_template(template_name)
+    return len(template_names)
+
+def render_fragment(template_name: str, **context) -> str:
+    """
+    Render a partial template (e.g. a single table row) to an HTML string for
+    endpoints that patch the page in place instead of reloading it.
+
+    Parameters:
+    - template_name: str - The partial's path relative to the templates directory.
+    - context: The variables available to the partial.
+
+    Returns:
+    - str: The rendered HTML.
+    """
+    return environment.get_template(template_name).render(**context)
\ No newline at end of file
@@ -0,0 +1,231 @@
+import os
+import sys
+import json
+import time
+import inspect
+import secrets
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class Span:
+    """
+    A timed unit of work. Spans opened while another span is active become
+    its children and share its trace id, mirroring the OpenTelemetry model.
+    """
+    def __init__(self, name: str, parent: "Span | None", attributes: dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.status = "OK"
+        self.status_message: str | None = None
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: int | None = None
+        self._start = time.perf_counter()
+        self.duration_ms = 0.0
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, message: str) -> None:
+        self.status = "ERROR"
+        self.status_message = message
+
+    def end(self) -> None:
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        self.end_time_ns = time.time_ns()
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start_time_ns,
+            "end_time_unix_nano": self.end_time_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.status_message},
+        }
+
+class ConsoleSpanExporter:
+    """
+    Writes one human-readable line per finished span to stderr.
+    """
+    def export(self, span: Span) -> None:
+        attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        sys.stderr.write(
+            f"[trace {span.trace_id[:8]}] {span.name} {span.duration_ms:.2f}ms "
+            f"{span.status} {attributes}\n"
+        )
+
+class FileSpanExporter:
+    """
+    Appends each finished span to a file as one JSON object per line.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as trace_file:
+                trace_file.write(line + "\n")
+
+def _exporters_from_env() -> list:
+    """
+    Build the exporters named in TRACE_EXPORTER (a comma separated list of
+    "console" and/or "file"). Tracing is disabled when it is unset.
+    """
+    exporters = []
+    for exporter_name in os.getenv("TRACE_EXPORTER", "").lower().split(","):
+        exporter_name = exporter_name.strip()
+        if exporter_name == "console":
+            exporters.append(ConsoleSpanExporter())
+        elif exporter_name == "file":
+            exporters.append(FileSpanExporter(os.getenv("TRACE_FILE", "traces.jsonl")))
+    return exporters
+
+_exporters = _exporters_from_env()
+
+# The span that new spans are parented to. Sync endpoints run in a threadpool
+# with a copy of the request's context, so nesting carries across threads.
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+def set_exporters(exporters: list) -> None:
+    """
+    Replace the configured exporters, e.g. to enable tracing from a script.
+    """
+    global _exporters
+    _exporters = list(exporters)
+
+def is_enabled() -> bool:
+    return bool(_exporters)
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """
+    Open a span around the enclosed block. Yields None when tracing is
+    disabled so that the block pays no tracing cost.
+    """
+    if not _exporters:
+        yield None
+        return
+
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+        for exporter in _exporters:
+            exporter.export(current)
+
+def _call_attributes(signature: inspect.Signature, args: tuple, kwargs: dict) -> dict[str, Any]:
+    """
+    Pull the client and document identifiers out of a service call's arguments.
+    """
+    try:
+        arguments = signature.bind(*args, **kwargs).arguments
+    except TypeError:
+        return {}
+
+    attributes = {}
+    client = arguments.get("client")
+    if client is not None and getattr(client, "id", None) is not None:
+        attributes["client.id"] = client.id
+    if arguments.get("client_id") is not None:
+        attributes["client.id"] = arguments["client_id"]
+    data = arguments.get("data")
+    if data is not None and getattr(data, "client_id", None) is not None:
+        attributes["client.id"] = data.client_id
+    for key in ("file_type", "quote_no", "invoice_no"):
+        if arguments.get(key) is not None:
+            attributes[f"document.{key}"] = arguments[key]
+    if arguments.get("recipients") is not None:
+        attributes["email.recipient_count"] = len(arguments["recipients"])
+    return attributes
+
+def _record_result(current: Span | None, result: Any) -> None:
+    # Services report failure through their (success, message, data) tuple
+    if current is not None and isinstance(result, tuple) and len(result) == 3 and result[0] is False:
+        current.set_error(str(result[1]))
+
+def traced(name: str) -> Callable:
+    """
+    Decorator that runs each call of a service function inside a span named
+    `name`, tagged with the client and document it was called for.
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _exporters:
+                    return await func(*args, **kwargs)
+                with span(name, **_call_attributes(signature, args, kwargs)) as current:
+                    result = await func(*args, **kwargs)
+                    _record_result(current, result)
+                    return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _exporters:
+                return func(*args, **kwargs)
+            with span(name, **_call_attributes(signature, args, kwargs)) as current:
+                result = func(*args, **kwargs)
+                _record_result(current, result)
+                return result
+        return wrapper
+    return decorator
+
+def traced_methods(cls: type) -> type:
+    """
+    Class decorator that traces every static method of a service class,
+    naming each span "<ClassName>.<method>".
+    """
+    for attr_name, attr in list(vars(cls).items()):
+        if isinstance(attr, staticmethod) and not attr_name.startswith("_"):
+            setattr(cls, attr_name, staticmethod(traced(f"{cls.__name__}.{attr_name}")(attr.__func__)))
+    return cls
+
+class TracingMiddleware:
+    """
+    ASGI middleware that opens a root span per HTTP request, so every span
+    started while handling the request shares the request's trace id.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not _exporters:
+            await self.app(scope, receive, send)
+            return
+
+        with span("http.request", **{"http.method": scope["method"], "http.target": scope["path"]}) as current:
+            async def send_with_status(message) -> None:
+                if message["type"] == "http.response.start":
+                    current.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        current.set_error(f"HTTP {message['status']}")
+                await send(message)
+
+            await self.app(scope, receive, send_with_status)
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                current.set_attribute("http.route", route.path)
\ No newline at end of file
@@ -1,6 +1,6 @@
-import ctypes
-
-from fastapi import HTTPException, status
+from fastapi import HTTPException, Request, status
+from sqlmodel import Session, SQLModel, select
+from sqlalchemy import func
 
 def call_service_or_500(service_func, *args, **kwargs):
     success, message, data = service_func(*args, **kwargs)
@@ -20,6 +20,15 @@ async def call_async_service_or_500(service_func, *args, **kwargs):
         )
     return message, data
 
+def call_service_or_409(service_func, *args, **kwargs):
+    success, message, data = service_func(*args, **kwargs)
+    if not success:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=message
+        )
+    return message, data
+
 def call_service_or_422(service_func, *args, **kwargs):
     success, message, data = service_func(*args, **kwargs)
     if not success:
@@ -38,9 +47,36 @@ def call_service_or_404(service_func, *args, **kwargs):
         )
     return message, data
 
-def get_per_page(page_type: str) -> int:
-    user32 = ctypes.windll.user32
-    height = user32.GetSystemMetrics(1)
+# Name of the cookie static/js/viewport.js keeps up to date with the height
+# (in CSS pixels) of the browser's viewport
+VIEWPORT_HEIGHT_COOKIE = "viewport_height"
+
+# Bounds for a page size requested with the `per_page` query parameter, so a
+# client cannot ask for pages large enough to make list queries expensive
+MIN_PER_PAGE = 1
+MAX_PER_PAGE = 50
+
+def get_per_page(page_type: str, request: Request) -> int:
+    """
+    Determine the number of table rows to show per page for the browser that
+    made the request. An explicit `per_page` query parameter wins (clamped to
+    MIN_PER_PAGE..MAX_PER_PAGE), otherwise the page size is picked from the
+    viewport height reported in the viewport_height cookie. Requests without
+    either get the page size for a 1000-1200px tall viewport.
+
+    Parameters:
+    - page_type: str - The type of table being paginated (e.g. "clients", "quotes").
+    - request: Request - The incoming HTTP request.
+
+    Returns:
+    - int: The number of rows per page.
+    """
+    per_page = request.query_params.get("per_page")
+    if per_page is not None and per_page.isdigit():
+        return min(max(int(per_page), MIN_PER_PAGE), MAX_PER_PAGE)
+
+    height = request.cookies.get(VIEWPORT_HEIGHT_COOKIE, "")
+    height = int(height) if height.isdigit() else 1000
 
     if height > 1200:
         if (page_type == "clients"):
@@ -70,6 +106,35 @@ def get_per_page(page_type: str) -> int:
 
     return per_page
 
+def get_total_pages(total: int, per_page: int) -> int:
+    """
+    Count the number of pages necessary to show `total` rows, `per_page` at a time.
+    """
+    return (total + per_page - 1) // per_page
+
+def count_rows(model: type[SQLModel], session: Session) -> int:
+    """
+    Count the rows of a table without loading them.
+    """
+    return session.exec(select(func.count()).select_from(model)).one()
+
+def get_page_rows(
+    model: type[SQLModel],
+    page: int,
+    per_page: int,
+    session: Session
+) -> list:
+    """
+    Get the rows shown on one page of a table, in the same order the list
+    pages show them (by id).
+    """
+    return session.exec(
+        select(model)
+        .order_by(model.id)
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+    ).all()
+
 def get_colors(color_theme: str) -> dict:
     if color_theme == "emerald-400":
         return {